@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class ApiShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'api_shop'
\ No newline at end of file
+    name = 'api_shop'
+
+    def ready(self):
+        from . import signals  # noqa: F401
\ No newline at end of file
@@ -0,0 +1,124 @@
+from collections import Counter
+
+from petshop import taxonomy
+from petshop.models import ProductPurpose, Category, Brand, ProductType, AgeCategory, Species, Purpose
+
+
+FACET_FILTERS = {
+    'category': ('category_id', Category),
+    'brand': ('brand_id', Brand),
+    'type': ('product_type_id', ProductType),
+    'age': ('age_category_id', AgeCategory),
+    'species': ('species_id', Species),
+    'purpose': ('purposes', Purpose),
+}
+
+
+class CatalogFilterError(ValueError):
+    pass
+
+
+def parse_facet_filters(query_params):
+    selected = {}
+    for param, (_, model_class) in FACET_FILTERS.items():
+        ids = query_params.getlist(param)
+        if not ids:
+            continue
+        try:
+            ids_int = [int(i) for i in ids]
+        except ValueError:
+            raise CatalogFilterError(f"Некорректный формат параметра {param}")
+
+        invalid_ids = taxonomy.find_missing_ids(model_class, ids_int)
+        if invalid_ids:
+            raise CatalogFilterError(f"Некорректные {param} ID: {', '.join(map(str, invalid_ids))}")
+        selected[param] = set(ids_int)
+    return selected
+
+
+def apply_facet_filters(products, selected, exclude=None):
+    for param, ids in selected.items():
+        if param == exclude:
+            continue
+        field_name, _ = FACET_FILTERS[param]
+        if field_name == 'purposes':
+            products = products.filter(
+                id__in=ProductPurpose.objects.filter(purpose_id__in=ids).values('product_id')
+            )
+        else:
+            products = products.filter(**{f"{field_name}__in": ids})
+    return products
+
+
+def _in_price_range(price, price_min, price_max):
+    if price_min is not None and price < price_min:
+        return False
+    if price_max is not None and price > price_max:
+        return False
+    return True
+
+
+def compute_facets(products, selected, price_min=None, price_max=None):
+    """
+    Считает количество товаров по каждому значению фасета для текущего
+    состояния фильтров. Для фасета не учитывается его собственный фильтр,
+    а диапазон цен считается без учёта фильтра по цене. Весь расчёт —
+    два запроса (товары и их назначения) и один проход в памяти.
+    """
+    columns = [field for field, _ in FACET_FILTERS.values() if field != 'purposes']
+    rows = list(products.values_list('id', 'price', *columns))
+    purposes_by_product = {}
+    for product_id, purpose_id in ProductPurpose.objects.filter(
+        product_id__in=products.values('id')
+    ).values_list('product_id', 'purpose_id'):
+        purposes_by_product.setdefault(product_id, set()).add(purpose_id)
+
+    params = list(FACET_FILTERS)
+    counters = {param: Counter() for param in params}
+    prices = []
+
+    for row in rows:
+        product_id, price = row[0], row[1]
+        values = dict(zip([p for p in params if p != 'purpose'], row[2:]))
+        values['purpose'] = purposes_by_product.get(product_id, set())
+
+        failed = []
+        for param, ids in selected.items():
+            value = values[param]
+            matched = bool(value & ids) if param == 'purpose' else value in ids
+            if not matched:
+                failed.append(param)
+                if len(failed) > 1:
+                    break
+        if len(failed) > 1:
+            continue
+
+        if not failed:
+            prices.append(price)
+
+        if not _in_price_range(price, price_min, price_max):
+            continue
+
+        for param in params:
+            if failed and failed[0] != param:
+                continue
+            value = values[param]
+            if param == 'purpose':
+                counters[param].update(value)
+            elif value is not None:
+                counters[param][value] += 1
+
+    facets = {}
+    for param, (_, model_class) in FACET_FILTERS.items():
+        facets[param] = [
+            {'id': value_id, 'name': taxonomy.get_name(model_class, value_id), 'count': count}
+            for value_id, count in sorted(counters[param].items())
+        ]
+
+    return {
+        'facets': facets,
+        'price': {
+            'min': min(prices) if prices else None,
+            'max': max(prices) if prices else None,
+        },
+    }
@@ -0,0 +1,361 @@
+import bisect
+import logging
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+
+from petshop import reservations, taxonomy
+from petshop.models import Product, ProductPurpose, ProductStock
+from .catalog import FACET_FILTERS
+from .pagination import get_sort_key
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+logger = logging.getLogger(__name__)
+
+SCALAR_FACETS = {param: field for param, (field, _) in FACET_FILTERS.items() if param != 'purpose'}
+PRODUCT_FIELDS = ['id', 'name', 'price', 'is_active'] + list(SCALAR_FACETS.values())
+
+
+def _to_cents(price):
+    return int((Decimal(str(price)) * 100).to_integral_value())
+
+
+def _from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+class CatalogIndex:
+    """
+    Индекс каталога в памяти процесса. Каждому товару соответствует строка
+    в столбцовых массивах NumPy: идентификаторы таксономии, цена в копейках,
+    признак активности, остатки по пунктам выдачи. Для назначений хранятся
+    булевы маски по каждому значению. Фильтрация сводится к побитовым
+    операциям над масками, сортировка — к lexsort по отфильтрованным строкам.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.row_by_id = {}
+        self.size = 0
+        self.built_at = None
+        self._allocate(0)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.price = np.zeros(capacity, dtype=np.int64)
+        self.names = np.empty(capacity, dtype=object)
+        self.columns = {param: np.zeros(capacity, dtype=np.int64) for param in SCALAR_FACETS}
+        self.purposes = {}
+        self.stock = {}
+        self._available_any = None
+        self._name_ranks = None
+        self._sorted_names = None
+
+    def _grow(self, needed):
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, self.capacity * 2, 1024)
+
+        def grow(array):
+            grown = np.zeros(capacity, dtype=array.dtype) if array.dtype != object else np.empty(capacity, dtype=object)
+            grown[:self.capacity] = array
+            return grown
+
+        self.ids = grow(self.ids)
+        self.alive = grow(self.alive)
+        self.active = grow(self.active)
+        self.price = grow(self.price)
+        self.names = grow(self.names)
+        self.columns = {param: grow(array) for param, array in self.columns.items()}
+        self.purposes = {key: grow(array) for key, array in self.purposes.items()}
+        self.stock = {key: grow(array) for key, array in self.stock.items()}
+        self.capacity = capacity
+
+    def _row_for(self, product_id):
+        row = self.row_by_id.get(product_id)
+        if row is None:
+            row = self.size
+            self._grow(row + 1)
+            self.size += 1
+            self.row_by_id[product_id] = row
+            self.ids[row] = product_id
+        return row
+
+    def _set_product(self, values):
+        row = self._row_for(values['id'])
+        self.alive[row] = True
+        self.active[row] = values['is_active']
+        self.price[row] = _to_cents(values['price'])
+        if self.names[row] != values['name']:
+            self.names[row] = values['name']
+            self._name_ranks = None
+        for param, field in SCALAR_FACETS.items():
+            self.columns[param][row] = values[field] or 0
+
+    def _set_purposes(self, product_ids, pairs):
+        rows = [self.row_by_id[pid] for pid in product_ids if pid in self.row_by_id]
+        for array in self.purposes.values():
+            array[rows] = False
+        for product_id, purpose_id in pairs:
+            row = self.row_by_id.get(product_id)
+            if row is None:
+                continue
+            array = self.purposes.get(purpose_id)
+            if array is None:
+                array = self.purposes[purpose_id] = np.zeros(self.capacity, dtype=bool)
+            array[row] = True
+
+    def _set_stock(self, product_ids, triples):
+        rows = [self.row_by_id[pid] for pid in product_ids if pid in self.row_by_id]
+        for array in self.stock.values():
+            array[rows] = 0
+        for product_id, pickup_point_id, quantity in triples:
+            row = self.row_by_id.get(product_id)
+            if row is None:
+                continue
+            array = self.stock.get(pickup_point_id)
+            if array is None:
+                array = self.stock[pickup_point_id] = np.zeros(self.capacity, dtype=np.int64)
+            array[row] += quantity
+        self._available_any = None
+
+    def build(self, products=None, purposes=None, stocks=None):
+        if products is None:
+            products = Product.objects.values(*PRODUCT_FIELDS).iterator(chunk_size=10000)
+        if purposes is None:
+            purposes = ProductPurpose.objects.values_list('product_id', 'purpose_id').iterator(chunk_size=10000)
+        if stocks is None:
+            stocks = reservations.with_available(ProductStock.objects.all()).values_list('product_id', 'pickup_point_id', 'available').iterator(chunk_size=10000)
+
+        with self._lock:
+            self.row_by_id = {}
+            self.size = 0
+            self._allocate(0)
+            for values in products:
+                self._set_product(values)
+            self._set_purposes([], purposes)
+            self._set_stock([], stocks)
+            self.built_at = time.monotonic()
+        return self
+
+    def refresh_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        rows = list(Product.objects.filter(id__in=product_ids).values(*PRODUCT_FIELDS))
+        purposes = list(ProductPurpose.objects.filter(product_id__in=product_ids).values_list('product_id', 'purpose_id'))
+        stocks = list(reservations.with_available(ProductStock.objects.filter(product_id__in=product_ids)).values_list('product_id', 'pickup_point_id', 'available'))
+        with self._lock:
+            found = set()
+            for values in rows:
+                self._set_product(values)
+                found.add(values['id'])
+            for product_id in set(product_ids) - found:
+                row = self.row_by_id.get(product_id)
+                if row is not None:
+                    self.alive[row] = False
+            self._set_purposes(product_ids, purposes)
+            self._set_stock(product_ids, stocks)
+
+    def _availability(self, pickup_point_id):
+        n = self.size
+        if pickup_point_id is not None:
+            array = self.stock.get(pickup_point_id)
+            return array[:n] > 0 if array is not None else np.zeros(n, dtype=bool)
+        if self._available_any is None:
+            available = np.zeros(self.capacity, dtype=bool)
+            for array in self.stock.values():
+                available |= array > 0
+            self._available_any = available
+        return self._available_any[:n]
+
+    def _mask(self, selected, pickup_point_id, price_min, price_max, exclude=None, with_price=True):
+        n = self.size
+        mask = self.alive[:n] & self.active[:n] & self._availability(pickup_point_id)
+        for param, ids in selected.items():
+            if param == exclude:
+                continue
+            if param == 'purpose':
+                matched = np.zeros(n, dtype=bool)
+                for purpose_id in ids:
+                    array = self.purposes.get(purpose_id)
+                    if array is not None:
+                        matched |= array[:n]
+                mask &= matched
+            else:
+                mask &= np.isin(self.columns[param][:n], list(ids))
+        if with_price:
+            if price_min is not None:
+                mask &= self.price[:n] >= _to_cents(price_min)
+            if price_max is not None:
+                mask &= self.price[:n] <= _to_cents(price_max)
+        return mask
+
+    def _ensure_name_ranks(self):
+        if self._name_ranks is None:
+            n = self.size
+            names = [name if name is not None else '' for name in self.names[:n]]
+            sorted_names = sorted(set(names))
+            positions = {name: i for i, name in enumerate(sorted_names)}
+            self._name_ranks = np.array([positions[name] for name in names], dtype=np.int64)
+            self._sorted_names = sorted_names
+        return self._name_ranks
+
+    def _cursor_filter(self, field, descending, keys, ids, cursor):
+        key, last_id = cursor
+        if field == 'id':
+            return ids < last_id if descending else ids > last_id
+        if field == 'price':
+            pivot, exact = _to_cents(key), True
+        else:
+            pivot = bisect.bisect_left(self._sorted_names, key)
+            exact = pivot < len(self._sorted_names) and self._sorted_names[pivot] == key
+            if not exact and descending:
+                return keys < pivot
+            if not exact:
+                return keys >= pivot
+        if descending:
+            return (keys < pivot) | ((keys == pivot) & (ids < last_id))
+        return (keys > pivot) | ((keys == pivot) & (ids > last_id))
+
+    def query(self, selected, pickup_point_id=None, price_min=None, price_max=None,
+              sort=None, cursor=None, limit=None, candidate_ids=None):
+        """
+        Возвращает (список id товаров в порядке сортировки, курсор
+        следующей страницы в виде (ключ, id) или None).
+        """
+        field, descending = get_sort_key(sort)
+        with self._lock:
+            mask = self._mask(selected, pickup_point_id, price_min, price_max)
+            if candidate_ids is not None:
+                allowed = np.zeros(self.size, dtype=bool)
+                allowed[[self.row_by_id[pid] for pid in candidate_ids if pid in self.row_by_id]] = True
+                mask &= allowed
+
+            rows = np.flatnonzero(mask)
+            ids = self.ids[rows]
+            if field == 'price':
+                keys = self.price[rows]
+            elif field == 'name':
+                keys = self._ensure_name_ranks()[rows]
+            else:
+                keys = ids
+
+            if cursor is not None:
+                keep = self._cursor_filter(field, descending, keys, ids, cursor)
+                rows, ids, keys = rows[keep], ids[keep], keys[keep]
+
+            if descending:
+                keys, ids_key = -keys, -ids
+            else:
+                ids_key = ids
+
+            if limit is not None and len(rows) > limit + 1:
+                kth = np.partition(keys, limit)[limit]
+                candidates = keys <= kth
+                rows, ids, keys, ids_key = rows[candidates], ids[candidates], keys[candidates], ids_key[candidates]
+
+            order = np.lexsort((ids_key, keys))
+            if limit is not None:
+                order = order[:limit + 1]
+            ordered_rows = rows[order]
+
+            next_cursor = None
+            if limit is not None and len(ordered_rows) > limit:
+                ordered_rows = ordered_rows[:limit]
+                last = ordered_rows[-1]
+                if field == 'price':
+                    key = _from_cents(self.price[last])
+                elif field == 'name':
+                    key = self.names[last]
+                else:
+                    key = None
+                next_cursor = (key, int(self.ids[last]))
+
+            return [int(pid) for pid in self.ids[ordered_rows]], next_cursor
+
+    def facets(self, selected, pickup_point_id=None, price_min=None, price_max=None, candidate_ids=None):
+        with self._lock:
+            allowed = None
+            if candidate_ids is not None:
+                allowed = np.zeros(self.size, dtype=bool)
+                allowed[[self.row_by_id[pid] for pid in candidate_ids if pid in self.row_by_id]] = True
+
+            result = {}
+            for param, (_, model_class) in FACET_FILTERS.items():
+                mask = self._mask(selected, pickup_point_id, price_min, price_max, exclude=param)
+                if allowed is not None:
+                    mask &= allowed
+                if param == 'purpose':
+                    counts = {
+                        purpose_id: int(np.count_nonzero(array[:self.size] & mask))
+                        for purpose_id, array in self.purposes.items()
+                    }
+                else:
+                    values, totals = np.unique(self.columns[param][:self.size][mask], return_counts=True)
+                    counts = dict(zip(values.tolist(), totals.tolist()))
+                    counts.pop(0, None)
+                result[param] = [
+                    {'id': value_id, 'name': taxonomy.get_name(model_class, value_id), 'count': count}
+                    for value_id, count in sorted(counts.items()) if count
+                ]
+
+            mask = self._mask(selected, pickup_point_id, price_min, price_max, with_price=False)
+            if allowed is not None:
+                mask &= allowed
+            prices = self.price[:self.size][mask]
+
+        return {
+            'facets': result,
+            'price': {
+                'min': _from_cents(prices.min()) if len(prices) else None,
+                'max': _from_cents(prices.max()) if len(prices) else None,
+            },
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, 'CATALOG_INDEX_ENABLED', False) and np is not None
+
+
+def get_index():
+    global _index
+    if not is_enabled():
+        return None
+
+    max_age = getattr(settings, 'CATALOG_INDEX_MAX_AGE', 300)
+    index = _index
+    if index is not None and (not max_age or time.monotonic() - index.built_at < max_age):
+        return index
+
+    with _index_lock:
+        if _index is None or _index is index:
+            started = time.monotonic()
+            _index = CatalogIndex().build()
+            logger.info("Индекс каталога построен за %.3f с (%d товаров)", time.monotonic() - started, _index.size)
+        return _index
+
+
+def refresh_products(product_ids):
+    if _index is not None:
+        _index.refresh_products(product_ids)
+
+
+def reset():
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,117 @@
+import base64
+import binascii
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+
+CATALOG_SORTS = {
+    'price_asc': ('price', False),
+    'price_desc': ('price', True),
+    'name_asc': ('name', False),
+    'name_desc': ('name', True),
+    'relevance': ('search_rank', True),
+}
+
+NUMERIC_SORT_FIELDS = ('price', 'search_rank')
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def get_sort_key(sort):
+    return CATALOG_SORTS.get(sort, ('id', False))
+
+
+def order_catalog(queryset, sort):
+    field, descending = get_sort_key(sort)
+    if field == 'id':
+        return queryset.order_by('-id' if descending else 'id')
+    if descending:
+        return queryset.order_by(f'-{field}', '-id')
+    return queryset.order_by(field, 'id')
+
+
+def encode_cursor(sort, obj):
+    field, _ = get_sort_key(sort)
+    key = getattr(obj, field) if field != 'id' else None
+    return encode_cursor_values(sort, key, obj.pk)
+
+
+def encode_cursor_values(sort, key, pk):
+    field, _ = get_sort_key(sort)
+    payload = {'s': sort or '', 'id': pk}
+    if field != 'id':
+        payload['k'] = str(key)
+    raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        last_id = int(payload['id'])
+    except (ValueError, KeyError, TypeError, binascii.Error, UnicodeError):
+        raise InvalidCursor("Некорректный курсор")
+
+    if payload.get('s', '') != (sort or ''):
+        raise InvalidCursor("Курсор не соответствует выбранной сортировке")
+
+    field, _ = get_sort_key(sort)
+    if field == 'id':
+        return None, last_id
+
+    key = payload.get('k')
+    if key is None:
+        raise InvalidCursor("Некорректный курсор")
+    if field in NUMERIC_SORT_FIELDS:
+        try:
+            key = Decimal(key)
+        except InvalidOperation:
+            raise InvalidCursor("Некорректный курсор")
+    return key, last_id
+
+
+def parse_page_size(value):
+    if value in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise InvalidCursor("Некорректный размер страницы")
+    if limit < 1:
+        raise InvalidCursor("Размер страницы должен быть больше 0")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def paginate_by_cursor(queryset, sort, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Keyset-пагинация каталога: следующая страница выбирается условием
+    (ключ сортировки, id) > (последний ключ, последний id), поэтому
+    глубокие страницы стоят столько же, сколько первая.
+    """
+    field, descending = get_sort_key(sort)
+    queryset = order_catalog(queryset, sort)
+
+    if cursor:
+        key, last_id = decode_cursor(cursor, sort)
+        op = 'lt' if descending else 'gt'
+        if field == 'id':
+            queryset = queryset.filter(**{f'id__{op}': last_id})
+        else:
+            queryset = queryset.filter(
+                Q(**{f'{field}__{op}': key}) | Q(**{field: key, f'id__{op}': last_id})
+            )
+
+    items = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(sort, items[-1])
+    return items, next_cursor
@@ -0,0 +1,68 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField
+
+
+def _walk_relations(model, source_attrs):
+    path = []
+    many = False
+    for attr in source_attrs:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation or field.name != attr:
+            break
+        path.append(attr)
+        many = many or field.many_to_many or field.one_to_many
+        model = field.related_model
+    return path, many, model
+
+
+def _collect(serializer, model, prefix, many_prefix, select, prefetch):
+    meta = getattr(serializer, 'Meta', None)
+    for hint in getattr(meta, 'select_related_hints', ()):
+        (prefetch if many_prefix else select).add(prefix + hint)
+    for hint in getattr(meta, 'prefetch_related_hints', ()):
+        prefetch.add(prefix + hint)
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            if isinstance(field, serializers.BaseSerializer) and field.source == '*':
+                _collect(field, model, prefix, many_prefix, select, prefetch)
+            continue
+
+        path, many, related_model = _walk_relations(model, field.source_attrs)
+        if not path:
+            continue
+
+        lookup = prefix + '__'.join(path)
+        is_many = many_prefix or many or isinstance(field, (ManyRelatedField, serializers.ListSerializer))
+        (prefetch if is_many else select).add(lookup)
+
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if isinstance(nested, serializers.BaseSerializer):
+            _collect(nested, related_model, lookup + '__', is_many, select, prefetch)
+
+
+def plan_queryset(queryset, serializer_class):
+    """
+    Добавляет к queryset нужные select_related/prefetch_related, разбирая
+    поля сериализатора: связи «к одному» подтягиваются JOIN-ом, связи
+    «ко многим» — отдельным запросом на всю выборку. Для полей, которые
+    нельзя разобрать автоматически (SerializerMethodField), сериализатор
+    может указать Meta.select_related_hints / Meta.prefetch_related_hints.
+    """
+    select, prefetch = set(), set()
+    _collect(serializer_class(), queryset.model, '', False, select, prefetch)
+
+    if select:
+        queryset = queryset.select_related(*sorted(select))
+    if prefetch:
+        queryset = queryset.prefetch_related(*sorted(prefetch))
+    return queryset
+
+
+class PlannedQuerysetMixin:
+    def get_queryset(self):
+        return plan_queryset(super().get_queryset(), self.get_serializer_class())
@@ -0,0 +1,79 @@
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'catalog'
+KEY_PREFIX = 'catalog:response'
+STATS_KEYS = {'hits': 'catalog:stats:hits', 'misses': 'catalog:stats:misses'}
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def normalize_params(query_params):
+    """
+    Приводит параметры запроса к каноническому виду: пустые значения
+    отбрасываются, параметры и повторяющиеся значения сортируются, поэтому
+    ?brand=2&brand=1&category=3 и ?category=3&brand=1&brand=2 дают один ключ.
+    """
+    items = []
+    for param in sorted(query_params.keys()):
+        values = sorted({value for value in query_params.getlist(param) if value != ''})
+        if values:
+            items.append(f"{param}={','.join(values)}")
+    return '&'.join(items)
+
+
+def make_key(query_params, version):
+    digest = hashlib.sha1(normalize_params(query_params).encode('utf-8')).hexdigest()
+    return f"{KEY_PREFIX}:{version}:{digest}"
+
+
+def _count(name):
+    key = STATS_KEYS[name]
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get(key):
+    try:
+        data = _cache().get(key)
+        _count('hits' if data is not None else 'misses')
+        return data
+    except Exception:
+        logger.warning("Кеш каталога недоступен", exc_info=True)
+        return None
+
+
+def set(key, data):
+    try:
+        _cache().set(key, data, timeout=getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600))
+    except Exception:
+        logger.warning("Не удалось сохранить ответ в кеш каталога", exc_info=True)
+
+
+def stats():
+    values = _cache().get_many(list(STATS_KEYS.values()))
+    hits = values.get(STATS_KEYS['hits'], 0)
+    misses = values.get(STATS_KEYS['misses'], 0)
+    total = hits + misses
+    return {
+        'backend': settings.CACHES[CACHE_ALIAS]['BACKEND'],
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def reset_stats():
+    _cache().delete_many(list(STATS_KEYS.values()))
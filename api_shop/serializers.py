@@ -1,7 +1,10 @@
 from rest_framework import serializers
-from petshop.models import User, UserProfile, Product, Cart, Category, Brand, ProductType, Species, ProductPurpose, Purpose, PickupPoint, ProductStock, Review, Order, OrderItem, OrdersByCategory, OrdersByBrand, OrdersByMonth
+from petshop.models import User, UserProfile, Product, Cart, Category, Brand, ProductType, Species, ProductPurpose, Purpose, PickupPoint, ProductStock, Review, Order, OrderItem, OrdersByCategory, OrdersByBrand, OrdersByMonth, ReportJob
 from rest_framework.validators import UniqueValidator
+from petshop import taxonomy, carts
+from petshop.models import AgeCategory
 import re
+from django.urls import reverse
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -95,14 +98,33 @@ class ProfileSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+class TaxonomyNameField(serializers.Field):
+    def __init__(self, model, **kwargs):
+        kwargs['read_only'] = True
+        self.model = model
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return taxonomy.get_name(self.model, value)
+
+
+class TaxonomyNamesField(TaxonomyNameField):
+    def __init__(self, model, id_attr, **kwargs):
+        self.id_attr = id_attr
+        super().__init__(model, **kwargs)
+
+    def to_representation(self, value):
+        return [taxonomy.get_name(self.model, getattr(row, self.id_attr)) for row in value.all()]
+
+
 class ProductSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
-    product_type = serializers.StringRelatedField()
-    category = serializers.StringRelatedField()
-    brand = serializers.StringRelatedField()
-    age_category = serializers.StringRelatedField()
-    species = serializers.StringRelatedField()
-    purposes = serializers.StringRelatedField(many=True)
+    product_type = TaxonomyNameField(ProductType, source='product_type_id')
+    category = TaxonomyNameField(Category, source='category_id')
+    brand = TaxonomyNameField(Brand, source='brand_id')
+    age_category = TaxonomyNameField(AgeCategory, source='age_category_id')
+    species = TaxonomyNameField(Species, source='species_id')
+    purposes = TaxonomyNamesField(Purpose, 'purpose_id', source='productpurpose_set')
 
     class Meta:
         model = Product
@@ -110,12 +132,16 @@ class ProductSerializer(serializers.ModelSerializer):
             'id', 'name', 'description', 'price', 'image',
             'category', 'brand', 'product_type', 'age_category', 'species', 'purposes'
         ]
+        prefetch_related_hints = ['productpurpose_set']
 
     def get_image(self, obj):
         return obj.image.url if obj.image else ''
 
 
 class ProductCreateUpdateSerializer(serializers.ModelSerializer):
+    # Остаток — сумма остатков по пунктам выдачи, меняется через
+    # /api/product-stocks/, а не здесь.
+    stock = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Product
@@ -146,16 +172,12 @@ class ReviewSerializer(serializers.ModelSerializer):
 
 
 class ProductDetailSerializer(serializers.ModelSerializer):
-    category = serializers.CharField(source='category.name')
-    brand = serializers.CharField(source='brand.name', default=None)
-    age_category = serializers.CharField(source='age_category.age_name', default=None)
-    product_type = serializers.CharField(source='product_type.type_name', default=None)
-    species = serializers.CharField(source='species.species_name', default=None)
-    purposes = serializers.SlugRelatedField(
-        many=True,
-        read_only=True,
-        slug_field='purpose_name'
-    )
+    category = TaxonomyNameField(Category, source='category_id')
+    brand = TaxonomyNameField(Brand, source='brand_id')
+    age_category = TaxonomyNameField(AgeCategory, source='age_category_id')
+    product_type = TaxonomyNameField(ProductType, source='product_type_id')
+    species = TaxonomyNameField(Species, source='species_id')
+    purposes = TaxonomyNamesField(Purpose, 'purpose_id', source='productpurpose_set')
     stocks = serializers.SerializerMethodField()
     reviews = serializers.SerializerMethodField()
     can_review = serializers.SerializerMethodField()
@@ -167,6 +189,7 @@ class ProductDetailSerializer(serializers.ModelSerializer):
             'category', 'brand', 'age_category', 'product_type',
             'species', 'purposes', 'stocks', 'reviews', 'can_review'
         ]
+        prefetch_related_hints = ['productpurpose_set', 'stocks__pickup_point', 'reviews__user']
 
     def get_stocks(self, obj):
         return [
@@ -224,30 +247,54 @@ class AddToCartSerializer(serializers.Serializer):
         'required': 'Количество обязательно',
         'min_value': 'Минимальное количество — 1'
     })
+    pickup_point = serializers.PrimaryKeyRelatedField(
+        queryset=PickupPoint.objects.filter(is_active=True), required=False,
+        error_messages={'does_not_exist': 'Пункт выдачи не найден'}
+    )
 
 
-class CartProductSerializer(serializers.ModelSerializer):
-    image = serializers.SerializerMethodField()
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=carts.OPERATIONS, error_messages={
+        'invalid_choice': 'Неизвестная операция: {input}'
+    })
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, required=False, error_messages={
+        'min_value': 'Минимальное количество — 1'
+    })
 
-    class Meta:
-        model = Product
-        fields = ['id', 'name', 'price', 'image']
+    def validate(self, attrs):
+        if attrs['op'] != 'remove' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'Количество обязательно'})
+        return attrs
 
-    def get_image(self, obj):
-        return obj.image.url if obj.image else ''
-    
 
-class CartItemSerializer(serializers.ModelSerializer):
-    product = CartProductSerializer()
-    total = serializers.SerializerMethodField()
+class CartBulkUpdateSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=carts.MAX_OPERATIONS)
+    pickup_point = serializers.PrimaryKeyRelatedField(
+        queryset=PickupPoint.objects.filter(is_active=True), required=False,
+        error_messages={'does_not_exist': 'Пункт выдачи не найден'}
+    )
 
-    class Meta:
-        model = Cart
-        fields = ['id', 'product', 'quantity', 'total']
 
-    def get_total(self, obj):
-        return obj.product.price * obj.quantity
-    
+class CartProductSerializer(serializers.Serializer):
+    """Товар в строке корзины; строки приходят словарями из petshop.carts.load."""
+    id = serializers.IntegerField(source='product_id')
+    name = serializers.CharField(source='product_name')
+    price = serializers.DecimalField(source='product_price', max_digits=10, decimal_places=2)
+    image = serializers.SerializerMethodField()
+
+    def get_image(self, row):
+        return Product._meta.get_field('image').storage.url(row['product_image']) if row['product_image'] else ''
+
+
+class CartItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    product = CartProductSerializer(source='*')
+    quantity = serializers.IntegerField()
+    total = serializers.DecimalField(source='line_total', max_digits=12, decimal_places=2, coerce_to_string=False)
+    available_quantity = serializers.IntegerField(required=False)
+    is_available = serializers.BooleanField(required=False)
+
 
 class OrdersByCategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -265,8 +312,6 @@ class OrdersByMonthSerializer(serializers.ModelSerializer):
         fields = ['month', 'total_orders', 'total_sales', 'avg_order_value']
 
 
-from petshop.models import AgeCategory
-
 class AgeCategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = AgeCategory
@@ -305,6 +350,31 @@ class PickupPointSerializer(serializers.ModelSerializer):
 class RestoreBackupSerializer(serializers.Serializer):
     backup_file = serializers.FileField(required=True, help_text="Выберите ZIP файл для восстановления")
 
+class ReportJobCreateSerializer(serializers.Serializer):
+    kind = serializers.ChoiceField(choices=ReportJob.KIND_CHOICES, error_messages={
+        'invalid_choice': 'Неизвестный отчёт: {input}'
+    })
+    format = serializers.ChoiceField(choices=ReportJob.FORMAT_CHOICES, default='csv', error_messages={
+        'invalid_choice': 'Неизвестный формат: {input}'
+    })
+    params = serializers.DictField(required=False, default=dict, help_text="Те же параметры, что у отчёта: type, date, product_id, category_id, brand_id, user_id")
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = ['id', 'kind', 'format', 'params', 'status', 'rows_count', 'error', 'created_at', 'started_at', 'finished_at', 'download_url']
+
+    def get_download_url(self, obj):
+        if obj.status != 'done':
+            return None
+        request = self.context.get('request')
+        url = reverse('api_report_job_download', args=[obj.pk])
+        return request.build_absolute_uri(url) if request else url
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_id = serializers.IntegerField(source='product.id', read_only=True) 
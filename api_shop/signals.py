@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from petshop.models import Product, ProductPurpose, ProductStock, Brand, Category
+from petshop.signals import stock_changed
+from . import catalog_index, suggest
+
+
+def refresh_catalog_index(sender, instance, **kwargs):
+    if not catalog_index.is_enabled():
+        return
+    product_id = instance.pk if sender is Product else instance.product_id
+    transaction.on_commit(lambda: catalog_index.refresh_products([product_id]))
+
+
+def refresh_catalog_index_stock(sender, product_ids, **kwargs):
+    if catalog_index.is_enabled():
+        product_ids = list(product_ids)
+        transaction.on_commit(lambda: catalog_index.refresh_products(product_ids))
+
+
+def invalidate_suggestions(sender, **kwargs):
+    transaction.on_commit(suggest.invalidate)
+
+
+for model in (Product, ProductPurpose, ProductStock):
+    post_save.connect(refresh_catalog_index, sender=model, dispatch_uid=f'catalog_index_{model.__name__}_save')
+    post_delete.connect(refresh_catalog_index, sender=model, dispatch_uid=f'catalog_index_{model.__name__}_delete')
+stock_changed.connect(refresh_catalog_index_stock, dispatch_uid='catalog_index_stock_changed')
+
+for model in (Product, Brand, Category):
+    post_save.connect(invalidate_suggestions, sender=model, dispatch_uid=f'suggest_{model.__name__}_save')
+    post_delete.connect(invalidate_suggestions, sender=model, dispatch_uid=f'suggest_{model.__name__}_delete')
@@ -0,0 +1,101 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+from petshop import taxonomy
+from petshop.models import Product, Brand, Category
+from petshop.search import WORD_RE, normalize
+
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+KINDS = ('products', 'brands', 'categories')
+
+_lock = threading.Lock()
+_index = None
+_generation = 0
+
+
+class PrefixIndex:
+    """
+    Отсортированный массив ключей для поиска по префиксу через bisect.
+    Для каждого названия хранится ключ с начала названия и ключи с начала
+    каждого следующего слова, так что «соб» находит «Корм для собак».
+    Совпадения с начала названия выдаются раньше совпадений внутри него.
+    """
+
+    def __init__(self, items):
+        starts, words = [], []
+        for item_id, name in items:
+            key = normalize(name)
+            starts.append((key, item_id))
+            for match in WORD_RE.finditer(key):
+                if match.start():
+                    words.append((key[match.start():], item_id))
+        starts.sort()
+        words.sort()
+        self.names = dict(items)
+        self.start_keys = [key for key, _ in starts]
+        self.start_ids = [item_id for _, item_id in starts]
+        self.word_keys = [key for key, _ in words]
+        self.word_ids = [item_id for _, item_id in words]
+
+    def lookup(self, prefix, limit):
+        found = []
+        seen = set()
+        for keys, ids in ((self.start_keys, self.start_ids), (self.word_keys, self.word_ids)):
+            position = bisect.bisect_left(keys, prefix)
+            while position < len(keys) and len(found) < limit and keys[position].startswith(prefix):
+                item_id = ids[position]
+                if item_id not in seen:
+                    seen.add(item_id)
+                    found.append({'id': item_id, 'name': self.names[item_id]})
+                position += 1
+        return found
+
+
+def _build():
+    return {
+        'built_at': time.monotonic(),
+        'products': PrefixIndex(list(Product.objects.filter(is_active=True).values_list('id', 'name'))),
+        'brands': PrefixIndex([(obj.id, obj.name) for obj in taxonomy.get_active(Brand)]),
+        'categories': PrefixIndex([(obj.id, obj.name) for obj in taxonomy.get_active(Category)]),
+    }
+
+
+def _fresh(index):
+    # invalidate() вызывается только в процессе, который изменил товар или
+    # справочник; остальные процессы перестраивают индекс по возрасту.
+    max_age = getattr(settings, 'SUGGEST_INDEX_MAX_AGE', 60)
+    return not max_age or time.monotonic() - index['built_at'] < max_age
+
+
+def get_index():
+    global _index
+    index = _index
+    if index is not None and _fresh(index):
+        return index
+
+    generation = _generation
+    index = _build()
+    with _lock:
+        if _generation == generation:
+            _index = index
+    return index
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    prefix = normalize(query.strip())
+    if not prefix:
+        return {kind: [] for kind in KINDS}
+    index = get_index()
+    return {kind: index[kind].lookup(prefix, limit) for kind in KINDS}
+
+
+def invalidate():
+    global _index, _generation
+    with _lock:
+        _generation += 1
+        _index = None
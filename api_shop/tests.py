@@ -1,3 +1,708 @@
-from django.test import TestCase
+import csv
+import io
+import itertools
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.http import QueryDict, StreamingHttpResponse
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from petshop import availability, catalog_version, db_reports, guest_cart, reports, reservations, taxonomy
+from petshop.models import (
+    AgeCategory, Brand, Cart, Category, Order, OrderItem, PickupPoint, Product, ProductPurpose, ProductStock, ProductType, Purpose, Role,
+    Species, StockReservation, User,
+)
+from . import catalog_index, pagination, response_cache, suggest
+from .serializers import ProductCreateUpdateSerializer
+
+
+class CatalogQueryCountTests(TestCase):
+    """Число запросов списка товаров не зависит от числа товаров в ответе."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        Role.objects.create(id=2, name='Администратор')
+        cls.admin = User.objects.create_user(
+            email='admin@example.com', password='pass12345', first_name='Админ', last_name='Админов', role_id=2,
+        )
+        cls.small = Category.objects.create(name='Клетки')
+        cls.large = Category.objects.create(name='Корма')
+        brands = [Brand.objects.create(name=f'Бренд {i}') for i in range(3)]
+        purposes = [Purpose.objects.create(purpose_name=f'Назначение {i}') for i in range(3)]
+        age = AgeCategory.objects.create(age_name='Взрослые')
+        product_type = ProductType.objects.create(type_name='Сухой')
+        species = Species.objects.create(species_name='Кошки')
+        point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        for i in range(31):
+            product = Product.objects.create(
+                category=cls.small if i == 0 else cls.large, brand=brands[i % 3], age_category=age,
+                product_type=product_type, species=species, name=f'Товар {i}', price=Decimal(100 + i),
+            )
+            for purpose in purposes[:1 + i % 3]:
+                ProductPurpose.objects.create(product=product, purpose=purpose)
+            ProductStock.objects.create(product=product, pickup_point=point, quantity=5)
+
+    def setUp(self):
+        caches['catalog'].clear()
+        taxonomy.invalidate()
+        catalog_index.reset()
+        self.client = APIClient()
+
+    def count_queries(self, url, params):
+        # Справочники кешируются при первом запросе; считаются запросы
+        # повторного, уже без кеша ответов.
+        self.client.get(url, params)
+        caches['catalog'].clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def assert_constant(self, url, params_small, params_large):
+        small, response = self.count_queries(url, params_small)
+        self.assertEqual(len(response.data), 1)
+        large, response = self.count_queries(url, params_large)
+        self.assertEqual(len(response.data), 30)
+        self.assertEqual(small, large)
+
+    def test_public_list(self):
+        self.assert_constant('/api/products/public/', {'category': self.small.id}, {'category': self.large.id})
+
+    def test_public_list_from_index(self):
+        with self.settings(CATALOG_INDEX_ENABLED=True):
+            if catalog_index.np is None:
+                self.skipTest("NumPy не установлен")
+            self.assert_constant('/api/products/public/', {'category': self.small.id}, {'category': self.large.id})
+
+    def test_admin_list(self):
+        self.client.force_authenticate(self.admin)
+        queries, response = self.count_queries('/api/products/', {})
+        self.assertEqual(len(response.data), 31)
+        Product.objects.filter(category=self.large).update(is_active=False)
+        with self.assertNumQueries(queries):
+            response = self.client.get('/api/products/')
+        self.assertEqual(len(response.data), 1)
+
+
+class SuggestIndexTests(TestCase):
+    def setUp(self):
+        suggest.invalidate()
+        self.product = Product.objects.create(category=Category.objects.create(name='Корма'), name='Корм для кошек', price=100)
+
+    def test_rebuilt_after_max_age(self):
+        # Изменение из другого процесса: update() без сигналов и invalidate().
+        with self.settings(SUGGEST_INDEX_MAX_AGE=60), mock.patch('api_shop.suggest.time.monotonic', return_value=1000):
+            self.assertEqual(suggest.suggest('кор')['products'], [{'id': self.product.id, 'name': 'Корм для кошек'}])
+            Product.objects.filter(id=self.product.id).update(name='Лакомство для кошек')
+            self.assertEqual(len(suggest.suggest('лак')['products']), 0)
+        with self.settings(SUGGEST_INDEX_MAX_AGE=60), mock.patch('api_shop.suggest.time.monotonic', return_value=1060):
+            self.assertEqual(suggest.suggest('лак')['products'], [{'id': self.product.id, 'name': 'Лакомство для кошек'}])
+
+
+class ProductStockFieldTests(TestCase):
+    def test_stock_is_read_only(self):
+        category = Category.objects.create(name='Корма')
+        serializer = ProductCreateUpdateSerializer(data={
+            'name': 'Корм для кошек', 'price': '100.00', 'category': category.id, 'stock': 50,
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        product = serializer.save()
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertTrue(serializer.fields['stock'].read_only)
+
+
+class CatalogPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Корма')
+        point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        # Цены повторяются: порядок внутри равной цены задаёт id.
+        cls.products = [
+            Product.objects.create(category=category, name=f'Товар {i}', price=Decimal(price))
+            for i, price in enumerate([300, 100, 200, 100, 300, 100, 200])
+        ]
+        ProductStock.objects.bulk_create([ProductStock(product=product, pickup_point=point, quantity=5) for product in cls.products])
+        availability.rebuild_availability()
+
+    def setUp(self):
+        caches['catalog'].clear()
+        catalog_index.reset()
+        self.client = APIClient()
+
+    def walk(self, sort, limit):
+        ids, cursor = [], None
+        for _ in range(len(self.products) + 1):
+            params = {'sort': sort, 'limit': limit}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/products/public/', params)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                return ids
+        self.fail("Курсор не закончился")
+
+    def test_pages_follow_sort_with_ties_broken_by_id(self):
+        by_price = sorted(self.products, key=lambda product: (product.price, product.id))
+        self.assertEqual(self.walk('price_asc', 2), [product.id for product in by_price])
+        by_price_desc = sorted(self.products, key=lambda product: (product.price, product.id), reverse=True)
+        self.assertEqual(self.walk('price_desc', 3), [product.id for product in by_price_desc])
+        self.assertEqual(self.walk('', 4), sorted(product.id for product in self.products))
+
+    def test_last_page_has_no_next_cursor(self):
+        response = self.client.get('/api/products/public/', {'sort': 'price_asc', 'limit': 7})
+        self.assertEqual(len(response.data['results']), 7)
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_cursor_round_trip(self):
+        cursor = pagination.encode_cursor('price_asc', self.products[1])
+        self.assertEqual(pagination.decode_cursor(cursor, 'price_asc'), (Decimal('100'), self.products[1].id))
+        cursor = pagination.encode_cursor(None, self.products[1])
+        self.assertEqual(pagination.decode_cursor(cursor, None), (None, self.products[1].id))
+
+    def test_invalid_cursor_is_rejected(self):
+        cursor = self.client.get('/api/products/public/', {'sort': 'price_asc', 'limit': 2}).data['next_cursor']
+        for params in (
+            {'sort': 'price_asc', 'cursor': cursor[:-3] + '!!!'},
+            {'sort': 'price_asc', 'cursor': 'bm90LWpzb24'},
+            # Курсор другой сортировки.
+            {'sort': 'name_asc', 'cursor': cursor},
+            {'sort': 'price_asc', 'cursor': pagination.encode_cursor_values('price_asc', 'дорого', 1)},
+            {'sort': 'price_asc', 'limit': 0},
+        ):
+            with self.subTest(**params):
+                response = self.client.get('/api/products/public/', {'limit': 2, **params})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.data)
+
+
+class CatalogFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.food, cls.toys = Category.objects.create(name='Корма'), Category.objects.create(name='Игрушки')
+        cls.alpha, cls.beta = Brand.objects.create(name='Альфа'), Brand.objects.create(name='Бета')
+        cls.walk = Purpose.objects.create(purpose_name='Прогулка')
+        point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        products = [
+            Product.objects.create(category=category, brand=brand, name=f'Товар {price}', price=Decimal(price))
+            for category, brand, price in [
+                (cls.food, cls.alpha, 100), (cls.food, cls.beta, 200), (cls.toys, cls.alpha, 300), (cls.toys, cls.beta, 400),
+            ]
+        ]
+        ProductPurpose.objects.create(product=products[3], purpose=cls.walk)
+        ProductStock.objects.bulk_create([ProductStock(product=product, pickup_point=point, quantity=5) for product in products])
+        availability.rebuild_availability()
+
+    def setUp(self):
+        caches['catalog'].clear()
+        taxonomy.invalidate()
+        catalog_index.reset()
+        self.client = APIClient()
+
+    def facets(self, **params):
+        response = self.client.get('/api/products/public/', {'facets': 1, **params})
+        self.assertEqual(response.status_code, 200)
+        counts = {
+            param: {row['id']: row['count'] for row in rows}
+            for param, rows in response.data['facets'].items()
+            if param in ('category', 'brand', 'purpose')
+        }
+        return counts, response.data['price'], len(response.data['results'])
+
+    def test_counts_respect_other_filters_but_not_their_own(self):
+        counts, _, found = self.facets(category=self.food.id, brand=self.alpha.id)
+        self.assertEqual(found, 1)
+        self.assertEqual(counts['category'], {self.food.id: 1, self.toys.id: 1})
+        self.assertEqual(counts['brand'], {self.alpha.id: 1, self.beta.id: 1})
+
+        counts, _, found = self.facets(purpose=self.walk.id)
+        self.assertEqual(found, 1)
+        self.assertEqual(counts['category'], {self.toys.id: 1})
+        self.assertEqual(counts['purpose'], {self.walk.id: 1})
+
+    def test_price_range_ignores_price_filter(self):
+        counts, price, found = self.facets(brand=self.alpha.id, price_max=250)
+        self.assertEqual(found, 1)
+        self.assertEqual(counts['category'], {self.food.id: 1})
+        self.assertEqual(counts['brand'], {self.alpha.id: 1, self.beta.id: 1})
+        self.assertEqual((price['min'], price['max']), (Decimal('100'), Decimal('300')))
+
+
+class CatalogIndexParityTests(TestCase):
+    """Индекс NumPy отвечает так же, как запросы ORM."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = [Category.objects.create(name=f'Категория {i}') for i in range(3)]
+        cls.brands = [Brand.objects.create(name=f'Бренд {i}') for i in range(2)]
+        cls.purposes = [Purpose.objects.create(purpose_name=f'Назначение {i}') for i in range(2)]
+        cls.points = [PickupPoint.objects.create(address=f'ул. Ленина, {i}') for i in range(2)]
+        names = ['Корм', 'Мяч', 'Миска', 'Ошейник', 'Лежанка', 'Игрушка', 'Домик', 'Поводок', 'Когтеточка', 'Шампунь']
+        stocks = []
+        for i, name in enumerate(names * 2):
+            product = Product.objects.create(
+                category=cls.categories[i % 3], brand=cls.brands[i % 2] if i % 5 else None,
+                name=f'{name} {i // len(names)}', price=Decimal(100 + 50 * (i % 4)), is_active=i != 7,
+            )
+            for purpose in cls.purposes[:i % 3]:
+                ProductPurpose.objects.create(product=product, purpose=purpose)
+            if i % 6:
+                stocks.append(ProductStock(product=product, pickup_point=cls.points[i % 2], quantity=i % 4))
+        ProductStock.objects.bulk_create(stocks)
+        availability.rebuild_availability()
+
+    def setUp(self):
+        caches['catalog'].clear()
+        taxonomy.invalidate()
+        catalog_index.reset()
+        self.client = APIClient()
+        if catalog_index.np is None:
+            self.skipTest("NumPy не установлен")
+
+    def get(self, params, index):
+        caches['catalog'].clear()
+        with self.settings(CATALOG_INDEX_ENABLED=index):
+            response = self.client.get('/api/products/public/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def ids(self, data):
+        rows = data['results'] if isinstance(data, dict) else data
+        return [row['id'] for row in rows]
+
+    def test_filters_and_sorts_match_orm(self):
+        filters = [
+            {}, {'category': self.categories[0].id}, {'brand': [self.brands[0].id, self.brands[1].id]},
+            {'purpose': self.purposes[1].id}, {'price_min': 150, 'price_max': 200},
+            {'pickup_point': self.points[1].id}, {'category': self.categories[1].id, 'purpose': self.purposes[0].id},
+        ]
+        for params, sort in itertools.product(filters, ['', 'price_asc', 'price_desc', 'name_asc', 'name_desc']):
+            params = {**params, 'sort': sort, 'facets': 1}
+            with self.subTest(**params):
+                orm, index = self.get(params, False), self.get(params, True)
+                if sort:
+                    self.assertEqual(self.ids(index), self.ids(orm))
+                else:
+                    self.assertEqual(sorted(self.ids(index)), sorted(self.ids(orm)))
+                self.assertEqual(index['facets'], orm['facets'])
+                self.assertEqual(index['price'], orm['price'])
+
+    def test_pages_match_orm(self):
+        for sort in ('price_asc', 'name_desc'):
+            pages = {}
+            for use_index in (False, True):
+                params, ids = {'sort': sort, 'limit': 3}, []
+                while True:
+                    data = self.get(params, use_index)
+                    ids += self.ids(data)
+                    if not data['next_cursor']:
+                        break
+                    params['cursor'] = data['next_cursor']
+                pages[use_index] = ids
+            self.assertEqual(pages[True], pages[False])
+
+    def test_refreshed_after_product_and_stock_change(self):
+        params = {'sort': 'price_asc'}
+        before = self.ids(self.get(params, True))
+        product = Product.objects.get(id=before[-1])
+        with self.settings(CATALOG_INDEX_ENABLED=True), self.captureOnCommitCallbacks(execute=True):
+            product.price = Decimal('1.00')
+            product.save()
+        self.assertEqual(self.ids(self.get(params, True))[0], product.id)
+
+        hidden = Product.objects.get(id=before[0])
+        with self.settings(CATALOG_INDEX_ENABLED=True), self.captureOnCommitCallbacks(execute=True):
+            for stock in ProductStock.objects.filter(product=hidden):
+                stock.quantity = 0
+                stock.save()
+        after = self.ids(self.get(params, True))
+        self.assertNotIn(hidden.id, after)
+        self.assertEqual(after, self.ids(self.get(params, False)))
+
+
+class CatalogConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        cls.user = User.objects.create_user(
+            email='buyer@example.com', password='pass12345', first_name='Иван', last_name='Иванов', role_id=1,
+        )
+        category = Category.objects.create(name='Корма')
+        cls.point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.product = Product.objects.create(category=category, name='Корм', price=Decimal('100.00'))
+        ProductStock.objects.create(product=cls.product, pickup_point=cls.point, quantity=5)
+
+    def setUp(self):
+        caches['catalog'].clear()
+        catalog_index.reset()
+        self.client = APIClient()
+
+    def test_not_modified_on_matching_etag_and_date(self):
+        response = self.client.get('/api/products/public/')
+        self.assertEqual(response.status_code, 200)
+        again = self.client.get('/api/products/public/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        again = self.client.get('/api/products/public/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_product_save_changes_etag(self):
+        etag = self.client.get('/api/products/public/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal('90.00')
+            self.product.save()
+        response = self.client.get('/api/products/public/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_order_status_keeps_catalog_etag_but_changes_detail_for_buyer(self):
+        url = f'/api/products/public/{self.product.pk}/'
+        self.client.force_authenticate(self.user)
+        list_etag = self.client.get('/api/products/public/')['ETag']
+        detail = self.client.get(url)
+        self.assertEqual(detail.data['can_review'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                user=self.user, order_number='000001', pickup_point=self.point, total_price=Decimal('100.00'),
+                first_name='Иван', last_name='Иванов', email='buyer@example.com',
+            )
+            OrderItem.objects.create(order=order, product=self.product, quantity=1, price=Decimal('100.00'))
+            order.status = 'Получен'
+            order.save()
+        self.assertEqual(self.client.get('/api/products/public/', HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=detail['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['can_review'], 1)
+
+
+class CatalogResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Корма')
+        point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        for i in range(3):
+            product = Product.objects.create(category=category, name=f'Товар {i}', price=Decimal(100 + i))
+            ProductStock.objects.create(product=product, pickup_point=point, quantity=5)
+
+    def setUp(self):
+        caches['catalog'].clear()
+        catalog_index.reset()
+        self.client = APIClient()
+
+    def test_parameter_order_gives_same_key(self):
+        first = QueryDict('brand=2&brand=1&category=3&search=')
+        second = QueryDict('category=3&brand=1&brand=2')
+        self.assertEqual(response_cache.make_key(first, 1), response_cache.make_key(second, 1))
+        self.assertNotEqual(response_cache.make_key(first, 1), response_cache.make_key(QueryDict('category=3'), 1))
+
+    def test_reordered_query_hits_cache(self):
+        first = self.client.get('/api/products/public/?sort=price_asc&limit=2')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        second = self.client.get('/api/products/public/?limit=2&sort=price_asc')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+
+    def test_version_bump_misses(self):
+        self.client.get('/api/products/public/')
+        catalog_version.bump()
+        self.assertEqual(self.client.get('/api/products/public/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/products/public/')['X-Cache'], 'HIT')
+
+    def test_counters_move(self):
+        response_cache.reset_stats()
+        self.client.get('/api/products/public/')
+        self.client.get('/api/products/public/')
+        self.client.get('/api/products/public/')
+        stats = response_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        self.assertEqual(stats['hit_ratio'], round(2 / 3, 4))
+
+
+class CreateOrderIdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        cls.users = [
+            User.objects.create_user(
+                email=f'buyer{i}@example.com', password='pass12345', first_name='Иван', last_name='Иванов', role_id=1,
+            )
+            for i in range(2)
+        ]
+        category = Category.objects.create(name='Корма')
+        cls.point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.product = Product.objects.create(category=category, name='Корм', price=Decimal('100.00'))
+        ProductStock.objects.create(product=cls.product, pickup_point=cls.point, quantity=10)
+
+    def order(self, user, key):
+        Cart.objects.get_or_create(user=user, product=self.product, defaults={'quantity': 2})
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post('/api/orders/create/', {
+            'first_name': 'Иван', 'last_name': 'Иванов', 'email': user.email, 'phone': '', 'pickup_point': self.point.id,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_original_order(self):
+        first = self.order(self.users[0], 'key-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', first)
+        replay = self.order(self.users[0], 'key-1')
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.data['order_id'], first.data['order_id'])
+        self.assertEqual(Order.objects.count(), 1)
+        # Повтор не списывает остаток второй раз; корзина осталась от повтора.
+        self.assertEqual(ProductStock.objects.get(product=self.product).quantity, 8)
+
+    def test_same_key_for_other_user_is_independent(self):
+        first = self.order(self.users[0], 'key-1')
+        second = self.order(self.users[1], 'key-1')
+        self.assertEqual(second.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', second)
+        self.assertNotEqual(second.data['order_id'], first.data['order_id'])
+        self.assertEqual(
+            set(Order.objects.values_list('user_id', 'idempotency_key')),
+            {(self.users[0].id, 'key-1'), (self.users[1].id, 'key-1')},
+        )
+
+    def test_too_long_key_rejected(self):
+        response = self.order(self.users[0], 'k' * 65)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(CART_RESERVATION_TTL=60)
+class CatalogReservationTests(TransactionTestCase):
+    # Версия каталога меняется в on_commit, поэтому нужны настоящие
+    # коммиты; строки, созданные миграциями, восстанавливаются после теста.
+    serialized_rollback = True
+
+    def setUp(self):
+        Role.objects.create(id=1, name='Покупатель')
+        self.user = User.objects.create_user(
+            email='buyer@example.com', password='pass12345', first_name='Иван', last_name='Иванов', role_id=1,
+        )
+        category = Category.objects.create(name='Корма')
+        self.point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        self.product = Product.objects.create(category=category, name='Корм', price=Decimal('100.00'))
+        ProductStock.objects.create(product=self.product, pickup_point=self.point, quantity=1)
+        caches['catalog'].clear()
+        catalog_index.reset()
+        self.client = APIClient()
+
+    def listed(self):
+        response = self.client.get('/api/products/public/', {'pickup_point': self.point.id})
+        return [row['id'] for row in response.data], response['ETag']
+
+    def test_expired_hold_listed_again_without_cron(self):
+        now = timezone.now()
+        reservations.reserve(self.user, self.product, self.point, 1, now=now)
+        hidden, etag = self.listed()
+        self.assertEqual(hidden, [])
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(seconds=61)):
+            listed, new_etag = self.listed()
+        self.assertEqual(listed, [self.product.id])
+        self.assertNotEqual(new_etag, etag)
+
+
+class CartBulkUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        cls.user = User.objects.create_user(
+            email='buyer@example.com', password='pass12345', first_name='Иван', last_name='Иванов', role_id=1,
+        )
+        category = Category.objects.create(name='Корма')
+        point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.products = [Product.objects.create(category=category, name=f'Корм {i}', price=Decimal(100 + i)) for i in range(3)]
+        for product in cls.products:
+            ProductStock.objects.create(product=product, pickup_point=point, quantity=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def patch(self, *operations):
+        return self.client.patch('/api/cart/', {'operations': list(operations)}, format='json')
+
+    def cart(self):
+        return dict(Cart.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+
+    def test_add_set_remove(self):
+        first, second, third = (product.id for product in self.products)
+        Cart.objects.create(user=self.user, product_id=third, quantity=1)
+        response = self.patch(
+            {'op': 'add', 'product_id': first, 'quantity': 2},
+            {'op': 'add', 'product_id': first, 'quantity': 1},
+            {'op': 'set', 'product_id': second, 'quantity': 4},
+            {'op': 'remove', 'product_id': third},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart(), {first: 3, second: 4})
+        self.assertEqual(response.data['items_count'], 7)
+        self.assertEqual(response.data['total_price'], Decimal('100') * 3 + Decimal('101') * 4)
+        self.assertEqual([item['product']['id'] for item in response.data['items']], [first, second])
+
+    def test_failed_operation_rolls_back_batch(self):
+        first, second, _ = (product.id for product in self.products)
+        Cart.objects.create(user=self.user, product_id=second, quantity=1)
+        response = self.patch(
+            {'op': 'add', 'product_id': first, 'quantity': 2},
+            {'op': 'remove', 'product_id': second},
+            {'op': 'set', 'product_id': first, 'quantity': 6},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['product_id'], first)
+        self.assertEqual(self.cart(), {second: 1})
+
+        response = self.patch(
+            {'op': 'add', 'product_id': first, 'quantity': 1},
+            {'op': 'add', 'product_id': 999999, 'quantity': 1},
+        )
+        self.assertEqual((response.status_code, response.data['product_id']), (400, 999999))
+        self.assertEqual(self.cart(), {second: 1})
+
+    def test_failed_reservation_rolls_back_written_rows(self):
+        first, second, _ = (product.id for product in self.products)
+        point, other_point = PickupPoint.objects.get(), PickupPoint.objects.create(address='ул. Мира, 2')
+        ProductStock.objects.create(product_id=second, pickup_point=other_point, quantity=5)
+        other = User.objects.create_user(email='other@example.com', password='pass12345', first_name='Пётр', last_name='Петров')
+        Cart.objects.create(user=self.user, product_id=first, quantity=1)
+        with self.settings(CART_RESERVATION_TTL=60):
+            reservations.reserve(other, self.products[1], point, 5)
+            # Общего остатка хватает, поэтому строки корзины записываются;
+            # резерв на выбранном пункте не проходит и откатывает их.
+            response = self.client.patch('/api/cart/', {'pickup_point': point.id, 'operations': [
+                {'op': 'set', 'product_id': first, 'quantity': 3},
+                {'op': 'add', 'product_id': second, 'quantity': 1},
+            ]}, format='json')
+        self.assertEqual((response.status_code, response.data['product_id']), (400, second))
+        self.assertEqual(self.cart(), {first: 1})
+        self.assertFalse(StockReservation.objects.filter(user=self.user).exists())
+
+    def test_invalid_operation_rejected(self):
+        response = self.patch({'op': 'add', 'product_id': self.products[0].id})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('errors', response.data)
+        self.assertEqual(self.cart(), {})
+
+
+class GuestCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        cls.user = User.objects.create_user(
+            email='buyer@example.com', password='pass12345', first_name='Иван', last_name='Иванов', role_id=1,
+        )
+        category = Category.objects.create(name='Корма')
+        point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.products = [Product.objects.create(category=category, name=f'Корм {i}', price=Decimal(100 + i)) for i in range(2)]
+        for product in cls.products:
+            ProductStock.objects.create(product=product, pickup_point=point, quantity=5)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def fill(self, *operations):
+        response = self.client.patch('/api/cart/', {'operations': list(operations)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def cart(self):
+        return {item['product']['id']: item['quantity'] for item in self.client.get('/api/cart/').data['items']}
+
+    def test_cart_kept_in_signed_cookie(self):
+        first = self.products[0].id
+        self.fill({'op': 'add', 'product_id': first, 'quantity': 2})
+        self.assertEqual(self.cart(), {first: 2})
+        self.assertFalse(Cart.objects.exists())
+
+    def test_tampered_cookie_ignored(self):
+        first = self.products[0].id
+        self.fill({'op': 'add', 'product_id': first, 'quantity': 2})
+        signed = self.client.cookies[guest_cart.COOKIE_NAME].value
+        self.assertIn(f'"{first}":2', signed)
+        self.client.cookies[guest_cart.COOKIE_NAME] = signed.replace(f'"{first}":2', f'"{first}":5')
+        self.assertEqual(self.cart(), {})
+        self.client.cookies[guest_cart.COOKIE_NAME] = f'{{"{first}":5}}'
+        self.assertEqual(self.cart(), {})
+
+    def test_merged_into_user_cart_on_login(self):
+        first, second = (product.id for product in self.products)
+        Cart.objects.create(user=self.user, product_id=first, quantity=1)
+        self.fill({'op': 'add', 'product_id': first, 'quantity': 2}, {'op': 'add', 'product_id': second, 'quantity': 5})
+        # Пока гость не вошёл, часть остатка успели раскупить.
+        ProductStock.objects.filter(product_id=second).update(quantity=3)
+        Product.objects.filter(id=second).update(stock=3)
+
+        response = self.client.post('/api/login/', {'email': 'buyer@example.com', 'password': 'pass12345'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies[guest_cart.COOKIE_NAME].value, '')
+        self.assertEqual(dict(Cart.objects.filter(user=self.user).values_list('product_id', 'quantity')), {first: 3, second: 3})
+        self.assertEqual(self.cart(), {first: 3, second: 3})
+
+
+class OrdersReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        Role.objects.create(id=2, name='Администратор')
+        cls.admin = User.objects.create_user(
+            email='admin@example.com', password='pass12345', first_name='Админ', last_name='Админов', role_id=2,
+        )
+        buyer = User.objects.create_user(email='buyer@example.com', password='pass12345', first_name='Иван', last_name='Иванов')
+        point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.food = Category.objects.create(name='Корма')
+        toys = Category.objects.create(name='Игрушки')
+        feed = Product.objects.create(category=cls.food, name='Корм', price=Decimal('100.00'))
+        bowl = Product.objects.create(category=cls.food, name='Миска', price=Decimal('50.00'))
+        ball = Product.objects.create(category=toys, name='Мяч', price=Decimal('30.00'))
+        cls.orders = []
+        for i, items in enumerate([[(feed, 2), (bowl, 1), (ball, 1)], [(ball, 3)], [(bowl, 4), (feed, 1)]]):
+            order = Order.objects.create(
+                user=buyer, order_number=f'N{i}', pickup_point=point, total_price=0,
+                first_name='Иван', last_name='Иванов', email=buyer.email,
+            )
+            for product, quantity in items:
+                OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+            cls.orders.append(order)
+
+    def test_single_grouped_query(self):
+        with self.assertNumQueries(1):
+            rows = list(reports.orders_report('filtered', category_id=self.food.id))
+        self.assertEqual(
+            [(row['order_id'], row['total']) for row in rows],
+            [(self.orders[0].id, Decimal('250.00')), (self.orders[2].id, Decimal('300.00'))],
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(reports.orders_report('filtered'))), 3)
+
+    def test_csv_export_streams_report_rows(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        table = client.get('/api/api/orders-report/', {'type': 'filtered'})
+        with mock.patch.object(db_reports, 'DEFAULT_BATCH_SIZE', 2), self.assertNumQueries(2):
+            response = client.get('/api/api/orders-report/', {'type': 'filtered', 'export': 'csv'})
+            self.assertIsInstance(response, StreamingHttpResponse)
+            content = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(content), delimiter=';'))
+        self.assertEqual(rows[0], list(table.data['columns'].values()))
+        self.assertEqual(rows[1:], [[str(value) for value in row.values()] for row in table.data['data']])
+        self.assertEqual(len(rows), 4)
+
+    def test_error_is_logged_and_hidden(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with mock.patch('petshop.reports.orders_report', side_effect=RuntimeError('секрет')), \
+                self.assertLogs('api_shop.views', 'ERROR'):
+            response = client.get('/api/api/orders-report/', {'type': 'filtered'})
+        self.assertEqual(response.status_code, 500)
+        self.assertNotIn('секрет', response.data['detail'])
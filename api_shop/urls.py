@@ -4,13 +4,14 @@ from rest_framework.routers import DefaultRouter
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from .views import (
-    RegisterAPIView, LoginAPIView, ProfileAPIView, LogoutAPIView, ProductListAPIView, 
+    RegisterAPIView, LoginAPIView, ProfileAPIView, LogoutAPIView, ProductListAPIView, ProductSuggestAPIView, CatalogCacheStatsAPIView,
     ProductDetailAPIView, AddToCartAPIView, CartAPIView, UpdateCartAPIView, 
     RemoveFromCartAPIView, PickupPointsAPIView, CreateOrderAPIView, OrderDetailAPIView,
     CreateReviewAPIView, OrderHistoryAPIView, AgeCategoryViewSet, PurposeViewSet,
     CategoryViewSet, BrandViewSet, ProductTypeViewSet, SpeciesViewSet, ProductPurposeViewSet, PickupPointViewSet,
     ProductStockViewSet, OrderAdminViewSet, ProductViewSet, UserViewSet, OrdersReportAPIView, CreateBackupAPIView,
-    RestoreBackupAPIView, ListBackupsAPIView, ChartsDataAPIView, SummaryTablesAPIView, UsersImportAPIView, UsersExportAPIView
+    RestoreBackupAPIView, ListBackupsAPIView, ChartsDataAPIView, SummaryTablesAPIView, UsersImportAPIView, UsersExportAPIView,
+    ReportJobsAPIView, ReportJobDetailAPIView, ReportJobDownloadAPIView
 )
 from .permissions import IsAdminUserRole
 
@@ -47,6 +48,8 @@ urlpatterns = [
     path('profile/', ProfileAPIView.as_view(), name='api_profile'),
     path('logout/', LogoutAPIView.as_view(), name='logout_api'),
     path('products/public/', ProductListAPIView.as_view(), name='api_products'),
+    path('products/suggest/', ProductSuggestAPIView.as_view(), name='api-product-suggest'),
+    path('admin/catalog-cache/', CatalogCacheStatsAPIView.as_view(), name='api-catalog-cache-stats'),
     path('products/public/<int:pk>/', ProductDetailAPIView.as_view(), name='api-product-detail'),
     path('cart/add/<int:product_id>/', AddToCartAPIView.as_view(), name='api-add-to-cart'),
     path('cart/', CartAPIView.as_view(), name='api-cart'),
@@ -58,6 +61,9 @@ urlpatterns = [
     path('orders/history/', OrderHistoryAPIView.as_view(), name='api-order-history'),
     path('reviews/add/<int:product_id>/', CreateReviewAPIView.as_view(), name='create-review'),
     path('api/orders-report/', OrdersReportAPIView.as_view(), name='api_orders_report'),
+    path('report-jobs/', ReportJobsAPIView.as_view(), name='api_report_jobs'),
+    path('report-jobs/<uuid:job_id>/', ReportJobDetailAPIView.as_view(), name='api_report_job_detail'),
+    path('report-jobs/<uuid:job_id>/download/', ReportJobDownloadAPIView.as_view(), name='api_report_job_download'),
     path('admin/backups/create/', CreateBackupAPIView.as_view(), name='api_create_backup'),
     path('admin/backups/restore/', RestoreBackupAPIView.as_view(), name='api_restore_backup'),
     path('admin/backups/list/', ListBackupsAPIView.as_view(), name='api_list_backups'),
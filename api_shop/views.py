@@ -2,26 +2,31 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions, viewsets
 from django.contrib.auth import login, authenticate
-from django.db import transaction, connection
-from .serializers import RegisterSerializer, ProfileSerializer, ReviewCreateSerializer, AddToCartSerializer, CartItemSerializer, ProductDetailSerializer, PurposeSerializer, CategorySerializer, BrandSerializer, AgeCategorySerializer, ProductTypeSerializer, SpeciesSerializer, ProductPurposeSerializer, PickupPointSerializer, ProductStockSerializer, OrderSerializer, OrderStatusUpdateSerializer, ProductSerializer, ProductCreateUpdateSerializer, UserSerializer, UserCreateUpdateSerializer, RestoreBackupSerializer
+from django.db import transaction, connection, IntegrityError
+from .serializers import RegisterSerializer, ProfileSerializer, ReviewCreateSerializer, AddToCartSerializer, CartBulkUpdateSerializer, CartItemSerializer, ProductDetailSerializer, PurposeSerializer, CategorySerializer, BrandSerializer, AgeCategorySerializer, ProductTypeSerializer, SpeciesSerializer, ProductPurposeSerializer, PickupPointSerializer, ProductStockSerializer, OrderSerializer, OrderStatusUpdateSerializer, ProductSerializer, ProductCreateUpdateSerializer, UserSerializer, UserCreateUpdateSerializer, RestoreBackupSerializer, ReportJobCreateSerializer, ReportJobSerializer
 from rest_framework.permissions import IsAuthenticated
-from petshop.models import UserProfile, User, Product, Cart, OrderItem, Review, Order, PickupPoint, ProductStock, Purpose, Category, Brand, AgeCategory, ProductType, Species, ProductPurpose, OrdersByCategory, OrdersByBrand, OrdersByMonth, Role
+from petshop.models import UserProfile, User, Product, Cart, OrderItem, Review, Order, PickupPoint, ProductStock, Purpose, Category, Brand, AgeCategory, ProductType, Species, ProductPurpose, OrdersByCategory, OrdersByBrand, OrdersByMonth, Role, ReportJob
 from django.contrib.auth import logout
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 import logging
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.http import Http404
 from django.views.generic.edit import FormView
 from petshop.forms import ReviewForm
+from petshop import taxonomy, search, catalog_version, availability, orders, outbox, reservations, stock_totals, carts, guest_cart, reports, db_reports, sales_rollup, report_jobs
+from petshop.csv_export import streaming_csv_response
 from django.utils import timezone
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
-import uuid
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, OuterRef, Subquery
 from .permissions import IsAdminUserRole
+from .query_planner import PlannedQuerysetMixin, plan_queryset
+from .catalog import CatalogFilterError, apply_facet_filters, compute_facets, parse_facet_filters
+from .pagination import CATALOG_SORTS, InvalidCursor, decode_cursor, encode_cursor_values, order_catalog, paginate_by_cursor, parse_page_size
+from . import catalog_index, suggest, response_cache
 from django.http import HttpResponse, JsonResponse
 import csv
 from datetime import datetime, timedelta, date
@@ -42,6 +47,20 @@ logger = logging.getLogger(__name__)
 User = get_user_model()
 
 
+def merge_guest_cart(request, user, response):
+    """Переносит корзину гостя из cookie в Cart после входа и удаляет cookie."""
+    items = guest_cart.read(request)
+    if not items:
+        return response
+    try:
+        guest_cart.merge_into(user, items)
+    except Exception:
+        # Вход важнее корзины: при ошибке cookie остаётся, перенос повторится при следующем входе.
+        logger.exception("Ошибка при переносе гостевой корзины")
+        return response
+    return guest_cart.write(response, {})
+
+
 class RegisterAPIView(APIView):
     @swagger_auto_schema(
         tags=['Регистрация'],
@@ -110,10 +129,10 @@ class RegisterAPIView(APIView):
                         )
 
                     login(request, user_auth)
-                    return Response(
+                    return merge_guest_cart(request, user_auth, Response(
                         {"message": "Регистрация успешна! Вы авторизованы."},
                         status=status.HTTP_201_CREATED
-                    )
+                    ))
 
             except Exception as e:
                 logger.exception("Ошибка при регистрации")
@@ -168,10 +187,10 @@ class LoginAPIView(APIView):
             user = authenticate(request, email=email, password=password)
             if user is not None:
                 login(request, user)
-                return Response(
+                return merge_guest_cart(request, user, Response(
                     {"message": "Вы успешно вошли в систему."},
                     status=status.HTTP_200_OK
-                )
+                ))
 
             return Response(
                 {"Ошибка": "Неверный email или пароль."},
@@ -344,9 +363,46 @@ class LogoutAPIView(APIView):
             )
 
 
+def _catalog_version(request):
+    if not hasattr(request, '_catalog_version'):
+        # Истёкшие резервы снимаются до чтения версии, чтобы ETag и кеш
+        # ответов уже учитывали вернувшиеся в наличие товары.
+        reservations.release_expired_if_any()
+        request._catalog_version = catalog_version.get_version()
+    return request._catalog_version
+
+
+def catalog_etag(request, *args, **kwargs):
+    return str(_catalog_version(request))
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return catalog_version.last_modified(_catalog_version(request))
+
+
+def product_detail_etag(request, pk):
+    # Ответ зависит от пользователя (can_review), поэтому в ETag входят
+    # пользователь и число его полученных позиций с этим товаром.
+    if not request.user.is_authenticated:
+        return f"{_catalog_version(request)}-{pk}-0"
+    received = OrderItem.objects.filter(
+        product_id=pk, order__user=request.user, order__status='Получен'
+    ).count()
+    return f"{_catalog_version(request)}-{pk}-{request.user.id}-{received}"
+
+
+def product_detail_last_modified(request, pk):
+    # Версия каталога не меняется при получении заказа, поэтому для
+    # авторизованных пользователей проверяется только ETag.
+    if request.user.is_authenticated:
+        return None
+    return catalog_last_modified(request)
+
+
 class ProductListAPIView(APIView):
     permission_classes = [permissions.AllowAny]
 
+    @method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified))
     @swagger_auto_schema(
         tags=['Товар'],
         operation_summary="Список товаров с фильтрацией",
@@ -363,10 +419,19 @@ class ProductListAPIView(APIView):
                               items=openapi.Items(type=openapi.TYPE_INTEGER), description="Фильтр по виду животного"),
             openapi.Parameter('purpose', openapi.IN_QUERY, type=openapi.TYPE_ARRAY,
                               items=openapi.Items(type=openapi.TYPE_INTEGER), description="Фильтр по назначению"),
-            openapi.Parameter('search_name', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Поиск по названию"),
+            openapi.Parameter('search_name', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Поиск по названию и описанию, результаты упорядочены по релевантности"),
             openapi.Parameter('price_min', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, description="Минимальная цена"),
             openapi.Parameter('price_max', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, description="Максимальная цена"),
             openapi.Parameter('pickup_point', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="ID пункта выдачи"),
+            openapi.Parameter('sort', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              enum=['price_asc', 'price_desc', 'name_asc', 'name_desc', 'relevance'], description="Сортировка"),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description="Размер страницы (включает постраничный режим с курсором)"),
+            openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Курсор следующей страницы из поля next_cursor"),
+            openapi.Parameter('facets', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+                              description="Вернуть количество товаров по значениям фильтров и диапазон цен"),
         ],
         responses={
             200: openapi.Response(description="Список товаров", schema=ProductSerializer(many=True)),
@@ -376,37 +441,41 @@ class ProductListAPIView(APIView):
         }
     )
     def get(self, request):
-        try:
-            products = Product.objects.filter(is_active=True)
+        cache_key = response_cache.make_key(request.GET, _catalog_version(request))
+        data = response_cache.get(cache_key)
+        if data is not None:
+            response = Response(data, status=status.HTTP_200_OK)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = self._get_uncached(request)
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.set(cache_key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
 
-            filters_map = {
-                'category': 'category',
-                'brand': 'brand',
-                'type': 'product_type',
-                'age': 'age_category',
-                'species': 'species',
-                'purpose': 'purposes'
-            }
+    def _get_uncached(self, request):
+        try:
+            try:
+                selected = parse_facet_filters(request.GET)
+            except CatalogFilterError as e:
+                return Response({"error": str(e)}, status=400)
 
-            for param, field_name in filters_map.items():
-                ids = request.GET.getlist(param)
-                if ids:
-                    try:
-                        ids_int = [int(i) for i in ids]
-                    except ValueError:
-                        return Response({"error": f"Некорректный формат параметра {param}"}, status=400)
-                    
-                    model_class = getattr(Product._meta.get_field(field_name), 'related_model', None)
-                    if model_class:
-                        valid_ids = model_class.objects.filter(id__in=ids_int).values_list('id', flat=True)
-                        invalid_ids = set(ids_int) - set(valid_ids)
-                        if invalid_ids:
-                            return Response({"error": f"Некорректные {param} ID: {', '.join(map(str, invalid_ids))}"}, status=400)
-                    products = products.filter(**{f"{field_name}__id__in": ids_int})
+            products = Product.objects.filter(is_active=True)
 
+            sort = request.GET.get('sort')
             search_name = request.GET.get('search_name')
-            if search_name:
+            matches = search.ranked_matches(search_name) if search_name else None
+            if matches is not None:
+                products = products.filter(id__in=matches.values('product_id')).annotate(
+                    search_rank=Subquery(matches.filter(product_id=OuterRef('pk')).values('rank')[:1])
+                )
+                if sort not in CATALOG_SORTS:
+                    sort = 'relevance'
+            elif search_name:
                 products = products.filter(name__icontains=search_name)
+            if sort == 'relevance' and matches is None:
+                sort = None
 
             price_min = request.GET.get('price_min')
             price_max = request.GET.get('price_max')
@@ -415,13 +484,11 @@ class ProductListAPIView(APIView):
                     price_min = float(price_min)
                     if price_min < 0:
                         return Response({"error": "Минимальная цена не может быть отрицательной"}, status=400)
-                    products = products.filter(price__gte=price_min)
 
                 if price_max is not None:
                     price_max = float(price_max)
                     if price_max < 0:
                         return Response({"error": "Максимальная цена не может быть отрицательной"}, status=400)
-                    products = products.filter(price__lte=price_max)
             except ValueError:
                 return Response({"error": "Некорректное значение цены"}, status=400)
 
@@ -435,41 +502,158 @@ class ProductListAPIView(APIView):
                 pickup_point = PickupPoint.objects.filter(id=pickup_point_id, is_active=True).first()
                 if not pickup_point:
                     return Response({"error": "Пункт выдачи не найден"}, status=404)
-
-                stock_qs = ProductStock.objects.filter(
-                    pickup_point=pickup_point,
-                    quantity__gt=0,
-                    product__is_active=True
-                )
-                product_ids = stock_qs.values_list('product_id', flat=True).distinct()
-                products = products.filter(id__in=product_ids)
             else:
-                stock_qs = ProductStock.objects.filter(quantity__gt=0, product__is_active=True)
-                available_product_ids = stock_qs.values_list('product_id', flat=True).distinct()
-                products = products.filter(id__in=available_product_ids)
+                pickup_point_id = None
+            products = availability.filter_available(products, pickup_point_id)
+
+            index = None
+            if not search_name or (matches is not None and sort != 'relevance'):
+                index = catalog_index.get_index()
+            if index is not None:
+                candidate_ids = None
+                if matches is not None:
+                    candidate_ids = set(matches.values_list('product_id', flat=True))
+                return self._get_from_index(
+                    request, index, selected, pickup_point_id, price_min, price_max, sort, candidate_ids
+                )
 
-            sort = request.GET.get('sort')
-            if sort:
-                if sort == 'price_asc':
-                    products = products.order_by('price')
-                elif sort == 'price_desc':
-                    products = products.order_by('-price')
-                elif sort == 'name_asc':
-                    products = products.order_by('name')
-                elif sort == 'name_desc':
-                    products = products.order_by('-name')
+            facets = None
+            if request.GET.get('facets') in ('1', 'true'):
+                facets = compute_facets(products, selected, price_min, price_max)
 
+            products = apply_facet_filters(products, selected)
+            if price_min is not None:
+                products = products.filter(price__gte=price_min)
+            if price_max is not None:
+                products = products.filter(price__lte=price_max)
+
+            if 'cursor' in request.GET or 'limit' in request.GET:
+                try:
+                    limit = parse_page_size(request.GET.get('limit'))
+                    products = plan_queryset(products, ProductSerializer)
+                    page, next_cursor = paginate_by_cursor(products, sort, request.GET.get('cursor'), limit)
+                except InvalidCursor as e:
+                    return Response({"error": str(e)}, status=400)
+
+                serializer = ProductSerializer(page, many=True)
+                data = {'results': serializer.data, 'next_cursor': next_cursor}
+                if facets is not None:
+                    data.update(facets)
+                return Response(data, status=status.HTTP_200_OK)
+
+            if sort in CATALOG_SORTS:
+                products = order_catalog(products, sort)
+
+            products = plan_queryset(products, ProductSerializer)
             serializer = ProductSerializer(products, many=True)
+            if facets is not None:
+                return Response({'results': serializer.data, **facets}, status=status.HTTP_200_OK)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         except Exception as e:
             logger.exception("Ошибка при получении списка товаров")
             return Response({"Ошибка": "Произошла ошибка на сервере. Попробуйте позже."}, status=500)
 
+    def _get_from_index(self, request, index, selected, pickup_point_id, price_min, price_max, sort, candidate_ids):
+        paginated = 'cursor' in request.GET or 'limit' in request.GET
+        limit = cursor = None
+        if paginated:
+            try:
+                limit = parse_page_size(request.GET.get('limit'))
+                if request.GET.get('cursor'):
+                    cursor = decode_cursor(request.GET['cursor'], sort)
+            except InvalidCursor as e:
+                return Response({"error": str(e)}, status=400)
+
+        facets = None
+        if request.GET.get('facets') in ('1', 'true'):
+            facets = index.facets(selected, pickup_point_id, price_min, price_max, candidate_ids)
+
+        ids, next_key = index.query(selected, pickup_point_id, price_min, price_max, sort, cursor, limit, candidate_ids)
+        rows = plan_queryset(Product.objects.filter(id__in=ids), ProductSerializer).in_bulk()
+        serializer = ProductSerializer([rows[pk] for pk in ids if pk in rows], many=True)
+
+        if paginated:
+            next_cursor = encode_cursor_values(sort, *next_key) if next_key else None
+            data = {'results': serializer.data, 'next_cursor': next_cursor}
+        elif facets is not None:
+            data = {'results': serializer.data}
+        else:
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        if facets is not None:
+            data.update(facets)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class ProductSuggestAPIView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    @swagger_auto_schema(
+        tags=['Товар'],
+        operation_summary="Подсказки для строки поиска",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Начало названия", required=True),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description=f"Количество подсказок каждого вида (не более {suggest.MAX_LIMIT})"),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Подсказки по товарам, брендам и категориям",
+                examples={"application/json": {
+                    "products": [{"id": 1, "name": "Корм для собак"}],
+                    "brands": [{"id": 2, "name": "Корма Плюс"}],
+                    "categories": [{"id": 3, "name": "Корма"}],
+                }}
+            ),
+            400: openapi.Response(description="Некорректные параметры", examples={"application/json": {"error": "Некорректное значение limit"}}),
+            500: openapi.Response(description="Ошибка сервера", examples={"application/json": {"error": "Произошла ошибка на сервере. Попробуйте позже."}}),
+        }
+    )
+    def get(self, request):
+        try:
+            limit = int(request.GET.get('limit', suggest.DEFAULT_LIMIT))
+        except ValueError:
+            return Response({"error": "Некорректное значение limit"}, status=400)
+        if limit < 1:
+            return Response({"error": "Некорректное значение limit"}, status=400)
+
+        try:
+            data = suggest.suggest(request.GET.get('q', ''), min(limit, suggest.MAX_LIMIT))
+        except Exception:
+            logger.exception("Ошибка при получении подсказок")
+            return Response({"error": "Произошла ошибка на сервере. Попробуйте позже."}, status=500)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class CatalogCacheStatsAPIView(APIView):
+    permission_classes = [IsAdminUserRole]
+
+    @swagger_auto_schema(
+        tags=['Товар'],
+        operation_summary="Статистика кеша каталога",
+        responses={
+            200: openapi.Response(
+                description="Счётчики попаданий и промахов",
+                examples={"application/json": {
+                    "backend": "django.core.cache.backends.locmem.LocMemCache",
+                    "hits": 120, "misses": 30, "hit_ratio": 0.8,
+                }}
+            ),
+        }
+    )
+    def get(self, request):
+        return Response(response_cache.stats(), status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(tags=['Товар'], operation_summary="Сброс статистики кеша каталога", responses={204: "Статистика сброшена"})
+    def delete(self, request):
+        response_cache.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class ProductDetailAPIView(APIView):
     permission_classes = [permissions.AllowAny]
 
+    @method_decorator(condition(etag_func=product_detail_etag, last_modified_func=product_detail_last_modified))
     @swagger_auto_schema(
         tags=['Товар'],
         operation_summary="Получение детальной информации о товаре",
@@ -491,7 +675,7 @@ class ProductDetailAPIView(APIView):
     )
     def get(self, request, pk):
         try:
-            product = Product.objects.get(pk=pk, is_active=True)
+            product = plan_queryset(Product.objects.all(), ProductDetailSerializer).get(pk=pk, is_active=True)
         except Product.DoesNotExist:
             return Response(
                 {"error": "Товар не найден"},
@@ -511,7 +695,8 @@ class ProductDetailAPIView(APIView):
 
 
 class AddToCartAPIView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
+    # Гость тоже может класть товары в корзину: она хранится в cookie.
+    permission_classes = [permissions.AllowAny]
 
     @swagger_auto_schema(
         operation_summary="Добавление товара в корзину",
@@ -523,8 +708,8 @@ class AddToCartAPIView(APIView):
             )
         ],
         responses={
-            200: openapi.Response(description="Товар добавлен в корзину", examples={
-                "application/json": {"message": "Товар добавлен в корзину"}
+            200: openapi.Response(description="Товар добавлен в корзину (reserved_until — если товар зарезервирован на пункте выдачи)", examples={
+                "application/json": {"message": "Товар добавлен в корзину", "reserved_until": "2025-01-01T12:15:00Z"}
             }),
             400: openapi.Response(description="Ошибка валидации или превышено количество", examples={
                 "application/json": {"error": "Максимальное кол-во товаров превышено"}
@@ -546,26 +731,42 @@ class AddToCartAPIView(APIView):
                 return Response({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
             quantity = serializer.validated_data['quantity']
+            pickup_point = serializer.validated_data.get('pickup_point')
 
-            total_stock = product.stocks.aggregate(total=Sum('quantity'))['total'] or 0
+            if not request.user.is_authenticated:
+                items = guest_cart.apply_operations(
+                    guest_cart.read(request), [{'op': 'add', 'product_id': product.id, 'quantity': quantity}]
+                )
+                return guest_cart.write(Response({"message": "Товар добавлен в корзину"}, status=status.HTTP_200_OK), items)
 
             existing_item = Cart.objects.filter(user=request.user, product=product).first()
             existing_quantity = existing_item.quantity if existing_item else 0
 
+            # В режиме резервирования товар с указанным пунктом выдачи
+            # удерживается за покупателем CART_RESERVATION_TTL секунд.
+            if pickup_point is not None and reservations.is_enabled():
+                with transaction.atomic():
+                    reservation = reservations.reserve(request.user, product, pickup_point, existing_quantity + quantity)
+                    self._add(request.user, product, existing_item, quantity)
+                return Response(
+                    {"message": "Товар добавлен в корзину", "reserved_until": reservation.expires_at},
+                    status=status.HTTP_200_OK
+                )
+
+            total_stock = reservations.available_total(product, request.user)
+
             if quantity + existing_quantity > total_stock:
                 return Response(
                     {"error": f"Максимальное количество товара превышено. Доступно {total_stock - existing_quantity}"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            if existing_item:
-                existing_item.quantity += quantity
-                existing_item.save()
-            else:
-                Cart.objects.create(user=request.user, product=product, quantity=quantity)
+            self._add(request.user, product, existing_item, quantity)
 
             return Response({"message": "Товар добавлен в корзину"}, status=status.HTTP_200_OK)
 
+        except (reservations.ReservationError, carts.CartError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.exception("Ошибка при добавлении товара в корзину")
             return Response(
@@ -573,13 +774,26 @@ class AddToCartAPIView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @staticmethod
+    def _add(user, product, existing_item, quantity):
+        if existing_item:
+            existing_item.quantity += quantity
+            existing_item.save()
+        else:
+            Cart.objects.create(user=user, product=product, quantity=quantity)
+
 
 class CartAPIView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
+    # Для гостя корзина читается и меняется в подписанной cookie.
+    permission_classes = [permissions.AllowAny]
 
     @swagger_auto_schema(
         tags=['Корзина'],
         operation_summary="Просмотр корзины пользователя",
+        operation_description="С параметром pickup_point для каждой строки возвращается наличие на этом пункте выдачи.",
+        manual_parameters=[
+            openapi.Parameter('pickup_point', openapi.IN_QUERY, description="ID пункта выдачи", type=openapi.TYPE_INTEGER),
+        ],
         responses={
             200: openapi.Response(
                 description="Корзина пользователя",
@@ -595,10 +809,15 @@ class CartAPIView(APIView):
                                     "image": "/media/products/cat_food.jpg"
                                 },
                                 "quantity": 2,
-                                "total": 1000
+                                "total": 1000,
+                                "available_quantity": 5,
+                                "is_available": True
                             }
                         ],
-                        "total_price": 1000
+                        "total_price": 1000,
+                        "items_count": 2,
+                        "pickup_point": 1,
+                        "all_available": True
                     }
                 }
             ),
@@ -613,17 +832,84 @@ class CartAPIView(APIView):
         }
     )
     def get(self, request):
+        pickup_point_id = request.query_params.get('pickup_point')
+        if pickup_point_id is not None:
+            try:
+                pickup_point_id = int(pickup_point_id)
+            except ValueError:
+                return Response({"error": "Некорректный пункт выдачи"}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            cart_items = Cart.objects.filter(user=request.user)
-            serializer = CartItemSerializer(cart_items, many=True)
-            total_price = sum([item['total'] for item in serializer.data])
-            return Response({'items': serializer.data, 'total_price': total_price}, status=status.HTTP_200_OK)
+            if not request.user.is_authenticated:
+                rows, summary = guest_cart.load(guest_cart.read(request), pickup_point_id)
+            else:
+                rows, summary = carts.load(request.user, pickup_point_id)
+            return Response(self._render(rows, summary, pickup_point_id), status=status.HTTP_200_OK)
         except Exception as e:
             logger.exception("Ошибка при получении корзины")
             return Response(
                 {"error": "Произошла ошибка на сервере. Попробуйте позже."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+    @swagger_auto_schema(
+        tags=['Корзина'],
+        operation_summary="Пакетное изменение корзины",
+        operation_description=(
+            "Применяет список операций add/set/remove в одной транзакции и возвращает обновлённую корзину. "
+            "Если хотя бы одна позиция не проходит проверку остатка, корзина не меняется."
+        ),
+        request_body=CartBulkUpdateSerializer,
+        responses={
+            200: openapi.Response(description="Корзина после изменений"),
+            400: openapi.Response(
+                description="Ошибка валидации или превышено количество",
+                examples={"application/json": {"error": "Максимальное количество товара 'Корм для кошек' превышено. Доступно 3", "product_id": 10}}
+            ),
+            500: openapi.Response(
+                description="Ошибка сервера",
+                examples={"application/json": {"error": "Произошла ошибка на сервере. Попробуйте позже."}}
+            ),
+        }
+    )
+    def patch(self, request):
+        serializer = CartBulkUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if not request.user.is_authenticated:
+                items = guest_cart.apply_operations(guest_cart.read(request), serializer.validated_data['operations'])
+                rows, summary = guest_cart.load(items)
+                return guest_cart.write(Response(self._render(rows, summary), status=status.HTTP_200_OK), items)
+
+            carts.apply_operations(
+                request.user,
+                serializer.validated_data['operations'],
+                pickup_point=serializer.validated_data.get('pickup_point'),
+            )
+            rows, summary = carts.load(request.user)
+            return Response(self._render(rows, summary), status=status.HTTP_200_OK)
+        except carts.CartError as e:
+            return Response({"error": str(e), "product_id": e.product_id}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception:
+            logger.exception("Ошибка при пакетном изменении корзины")
+            return Response(
+                {"error": "Произошла ошибка на сервере. Попробуйте позже."},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @staticmethod
+    def _render(rows, summary, pickup_point_id=None):
+        data = {
+            'items': CartItemSerializer(rows, many=True).data,
+            'total_price': summary['total_price'],
+            'items_count': summary['items_count'],
+        }
+        if pickup_point_id is not None:
+            data['pickup_point'] = pickup_point_id
+            data['all_available'] = all(row['is_available'] for row in rows)
+        return data
     
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -649,21 +935,27 @@ class UpdateCartAPIView(APIView):
     )
     def post(self, request, item_id):
         try:
-            cart_item = Cart.objects.get(id=item_id, user=request.user)
+            cart_item = Cart.objects.select_related('product').get(id=item_id, user=request.user)
             quantity = int(request.data.get('quantity', 1))
             if quantity < 1:
                 return Response({"error": "Количество должно быть больше 0"}, status=status.HTTP_400_BAD_REQUEST)
 
-            total_stock = sum(ps.quantity for ps in cart_item.product.stocks.all())
+            total_stock = reservations.available_total(cart_item.product, request.user)
             if quantity > total_stock:
                 return Response({
                     "error": f"Невозможно установить {quantity}. Доступно только {total_stock}",
                     "current_quantity": cart_item.quantity
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            cart_item.quantity = quantity
-            cart_item.save()
+            with transaction.atomic():
+                if reservations.is_enabled():
+                    for hold in reservations.active().filter(user=request.user, product=cart_item.product).select_related('pickup_point'):
+                        reservations.reserve(request.user, cart_item.product, hold.pickup_point, quantity)
+                cart_item.quantity = quantity
+                cart_item.save()
             return Response({"message": "Количество обновлено"}, status=status.HTTP_200_OK)
+        except reservations.ReservationError as e:
+            return Response({"error": str(e), "current_quantity": cart_item.quantity}, status=status.HTTP_400_BAD_REQUEST)
         except Cart.DoesNotExist:
             return Response({"error": "Элемент корзины не найден"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
@@ -686,7 +978,9 @@ class RemoveFromCartAPIView(APIView):
     def delete(self, request, item_id):
         try:
             cart_item = Cart.objects.get(id=item_id, user=request.user)
-            cart_item.delete()
+            with transaction.atomic():
+                cart_item.delete()
+                reservations.release(request.user, [cart_item.product_id])
             return Response({"message": "Товар удалён"}, status=status.HTTP_200_OK)
         except Cart.DoesNotExist:
             return Response({"error": "Элемент корзины не найден"}, status=status.HTTP_404_NOT_FOUND)
@@ -844,12 +1138,22 @@ class PickupPointsAPIView(APIView):
 
 
 
+IDEMPOTENCY_KEY_MAX_LENGTH = Order._meta.get_field('idempotency_key').max_length
+
+
 class CreateOrderAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
         operation_summary="Создание нового заказа",
         tags=['Заказ'],
+        manual_parameters=[
+            openapi.Parameter(
+                'Idempotency-Key', openapi.IN_HEADER, type=openapi.TYPE_STRING, required=False,
+                description=f"Ключ повтора запроса (до {IDEMPOTENCY_KEY_MAX_LENGTH} символов): "
+                            "повторный запрос с тем же ключом вернёт уже созданный заказ"
+            ),
+        ],
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             required=['first_name', 'last_name', 'email', 'phone', 'pickup_point'],
@@ -888,6 +1192,20 @@ class CreateOrderAPIView(APIView):
         user = request.user
         data = request.data
 
+        # Повтор запроса с тем же ключом (например, после таймаута) не создаёт
+        # второй заказ, а возвращает ответ на первый. Проверяем до корзины:
+        # после успешного заказа она уже пуста.
+        idempotency_key = request.headers.get('Idempotency-Key') or None
+        if idempotency_key is not None:
+            if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                return Response(
+                    {"error": f"Idempotency-Key не может быть длиннее {IDEMPOTENCY_KEY_MAX_LENGTH} символов"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            existing = Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
+            if existing:
+                return self._created_response(existing, replayed=True)
+
         cart_items = Cart.objects.filter(user=user)
         if not cart_items.exists():
             return Response({"error": "Корзина пуста"}, status=status.HTTP_400_BAD_REQUEST)
@@ -901,69 +1219,32 @@ class CreateOrderAPIView(APIView):
         except Exception:
             return Response({"error": "Пункт выдачи не найден"}, status=status.HTTP_404_NOT_FOUND)
 
-        total_price = sum(item.get_total_price() for item in cart_items)
-
         try:
             with transaction.atomic():
-                with connection.cursor() as cursor:
-                    cursor.execute("ALTER TABLE petshop_order DISABLE TRIGGER ALL")
-                    cursor.execute("ALTER TABLE petshop_productstock DISABLE TRIGGER ALL")
-
-                order_number = uuid.uuid4().hex[:20]
-                order = Order.objects.create(
-                    user=user,
-                    order_number=order_number,
+                order = orders.place_order(
+                    user,
+                    pickup_point,
                     first_name=data.get('first_name'),
                     last_name=data.get('last_name'),
                     email=data.get('email'),
                     phone=data.get('phone'),
-                    pickup_point=pickup_point,
-                    total_price=total_price,
-                    status='В обработке'
+                    idempotency_key=idempotency_key,
                 )
+                outbox.enqueue_order_email(order, f"Ваш заказ №{order.id} оформлен")
 
-                for item in cart_items:
-                    order.items.create(
-                        product=item.product,
-                        quantity=item.quantity,
-                        price=item.product.price
-                    )
-
-                    stock = ProductStock.objects.filter(
-                        product=item.product,
-                        pickup_point=pickup_point
-                    ).first()
-
-                    if not stock:
-                        raise ValueError(f"Товар '{item.product.name}' отсутствует на выбранном пункте выдачи")
-                    if stock.quantity < item.quantity:
-                        raise ValueError(f"Недостаточно товара '{item.product.name}' на пункте выдачи")
-                    
-                    stock.quantity -= item.quantity
-                    stock.save()
-
-                cart_items.delete()
-
-                with connection.cursor() as cursor:
-                    cursor.execute("ALTER TABLE petshop_order ENABLE TRIGGER ALL")
-                    cursor.execute("ALTER TABLE petshop_productstock ENABLE TRIGGER ALL")
-
-                subject = f"Ваш заказ №{order.id} оформлен"
-                html_content = render_to_string('shablons/email.html', {'order': order})
-                email = EmailMultiAlternatives(
-                    subject=subject,
-                    body="Ваш email клиент не поддерживает HTML",
-                    from_email="ksenpank03@mail.ru",
-                    to=[order.email]
-                )
-                email.attach_alternative(html_content, "text/html")
-                email.send()
+            return self._created_response(order)
 
+        except IntegrityError:
+            # Параллельный запрос с тем же ключом успел создать заказ первым;
+            # наша транзакция откатилась вместе со списанием остатков.
+            existing = idempotency_key and Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
+            if existing:
+                return self._created_response(existing, replayed=True)
+            logger.exception("Ошибка при создании заказа")
             return Response(
-                {"message": f"Заказ №{order.id} успешно создан", "order_id": order.id},
-                status=status.HTTP_201_CREATED
+                {"error": "Произошла внутренняя ошибка сервера"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-
         except ValueError as ve:
             return Response({"error": str(ve)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception:
@@ -973,6 +1254,16 @@ class CreateOrderAPIView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @staticmethod
+    def _created_response(order, replayed=False):
+        response = Response(
+            {"message": f"Заказ №{order.id} успешно создан", "order_id": order.id},
+            status=status.HTTP_201_CREATED
+        )
+        if replayed:
+            response['Idempotent-Replayed'] = 'true'
+        return response
+
     
 class OrderDetailAPIView(APIView):
     permission_classes = [IsAuthenticated]
@@ -1005,9 +1296,9 @@ class OrderDetailAPIView(APIView):
     )
     def get(self, request, pk):
         try:
-            order = get_object_or_404(Order, id=pk)
+            order = get_object_or_404(plan_queryset(Order.objects.all(), OrderSerializer), id=pk)
 
-            if order.user != request.user:
+            if order.user_id != request.user.id:
                 return Response(
                     {"detail": "Нет прав для выполнения действия"},
                     status=status.HTTP_403_FORBIDDEN
@@ -1043,7 +1334,7 @@ class OrderHistoryAPIView(APIView):
                     "application/json": [
                         {
                             "id": 1,
-                            "order_number": "a1b2c3d4e5f6g7h8i9j0",
+                            "order_number": "0370122969089392640",
                             "status": "В обработке",
                             "total_price": 6076.0,
                             "pickup_point": "ул. Ленина, д.10",
@@ -1064,7 +1355,7 @@ class OrderHistoryAPIView(APIView):
     )
     def get(self, request):
         try:
-            orders = request.user.orders.all().order_by('-date_created')
+            orders = request.user.orders.select_related('pickup_point').order_by('-date_created')
             data = [
                 {
                     "id": o.id,
@@ -1836,7 +2127,7 @@ class ProductPurposeViewSet(viewsets.ModelViewSet):
             logger.exception("Ошибка при удалении ProductPurpose")
             return Response({"error": "Произошла внутренняя ошибка сервера"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-class ProductStockViewSet(viewsets.ModelViewSet):
+class ProductStockViewSet(PlannedQuerysetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAdminUserRole]
     queryset = ProductStock.objects.all()
     serializer_class = ProductStockSerializer
@@ -1965,7 +2256,7 @@ class ProductStockViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class OrderAdminViewSet(viewsets.ModelViewSet):
+class OrderAdminViewSet(PlannedQuerysetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAdminUserRole]
     queryset = Order.objects.all().order_by('-date_created')
     serializer_class = OrderSerializer
@@ -2078,7 +2369,7 @@ class OrderAdminViewSet(viewsets.ModelViewSet):
             )
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(PlannedQuerysetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAdminUserRole]
     queryset = Product.objects.all().order_by('id')
     serializer_class = ProductSerializer
@@ -2310,92 +2601,52 @@ class OrdersReportAPIView(APIView):
             user_id = request.GET.get('user_id')
             export = request.GET.get('export')
 
-            if report_type not in ['day', 'week', 'month', 'filtered']:
+            if report_type not in reports.REPORT_TYPES:
                 return Response(
                     {"detail": "Неверный тип отчета. Допустимые значения: day, week, month, filtered."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            orders = Order.objects.all().prefetch_related('items', 'items__product', 'user', 'pickup_point')
-
+            target_date = None
             if date_str:
                 try:
                     target_date = datetime.strptime(date_str, python_format).date()
-
-                    today = date.today()
-                    if target_date > today:
-                        return Response(
-                            {"detail": f"Дата не может быть в будущем. Сегодня: {today.strftime(python_format)}"},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-
-                    if report_type == 'day':
-                        orders = orders.filter(date_created__date=target_date)
-                    elif report_type == 'week':
-                        start_date = target_date
-                        end_date = target_date + timedelta(days=6)
-                        orders = orders.filter(date_created__date__range=[start_date, end_date])
-                    elif report_type == 'month':
-                        orders = orders.filter(
-                            date_created__year=target_date.year,
-                            date_created__month=target_date.month
-                        )
-
                 except ValueError:
                     return Response(
                         {"detail": f"Некорректный формат даты. Используйте формат: {user_format}"},
                         status=status.HTTP_400_BAD_REQUEST
                     )
 
+                today = date.today()
+                if target_date > today:
+                    return Response(
+                        {"detail": f"Дата не может быть в будущем. Сегодня: {today.strftime(python_format)}"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
 
-            if user_id:
-                orders = orders.filter(user_id=user_id)
-            if product_id:
-                orders = orders.filter(items__product_id=product_id)
-            if category_id:
-                orders = orders.filter(items__product__category_id=category_id)
-            if brand_id:
-                orders = orders.filter(items__product__brand_id=brand_id)
+            rows = reports.orders_report(
+                report_type, target_date,
+                product_id=product_id, category_id=category_id, brand_id=brand_id, user_id=user_id,
+            )
 
             if export == 'csv':
-                return self.export_to_csv(orders, report_type, date_str, python_format, product_id, category_id, brand_id)
+                return self.export_to_csv(rows, report_type, date_str, python_format)
 
-            return self.get_table_data(orders, report_type, python_format, product_id, category_id, brand_id)
+            return self.get_table_data(rows, report_type, python_format)
 
-        except Exception as e:
-            print(f"Unexpected error: {e}")
+        except Exception:
+            logger.exception("Ошибка при построении отчета по заказам")
             return Response(
-                {"detail": f"Произошла непредвиденная ошибка: {str(e)}"},
+                {"detail": "Произошла ошибка на сервере. Попробуйте позже."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    def get_filtered_items(self, order_items, product_id=None, category_id=None, brand_id=None):
-        filtered_items = order_items
-        if product_id:
-            filtered_items = filtered_items.filter(product_id=product_id)
-        if category_id:
-            filtered_items = filtered_items.filter(product__category_id=category_id)
-        if brand_id:
-            filtered_items = filtered_items.filter(product__brand_id=brand_id)
-        return filtered_items
-
-    def get_table_data(self, orders, report_type, python_format, product_id=None, category_id=None, brand_id=None):
-        columns_config = self.get_columns_config(report_type)
-        data = []
+    def format_row(self, row, python_format):
+        return reports.format_row(row, python_format)
 
-        for order in orders.distinct():
-            filtered_items = self.get_filtered_items(order.items.all(), product_id, category_id, brand_id)
-            if not filtered_items.exists():
-                continue
-
-            filtered_total = sum(item.quantity * item.price for item in filtered_items)
-
-            data.append({
-                'id': order.id,
-                'user': f"{order.first_name} {order.last_name}",
-                'total_price': f"{filtered_total:.2f}",
-                'date_created': order.date_created.strftime(f"{python_format} %H:%M"),
-            })
+    def get_table_data(self, rows, report_type, python_format):
+        columns_config = self.get_columns_config(report_type)
+        data = [self.format_row(row, python_format) for row in rows]
 
         return Response({
             'data': data,
@@ -2404,60 +2655,24 @@ class OrdersReportAPIView(APIView):
             'report_type': report_type
         })
 
-    def export_to_csv(self, orders, report_type, date_str, python_format, product_id=None, category_id=None, brand_id=None):
-        response = HttpResponse(content_type='application/vnd.ms-excel; charset=utf-8')
-
+    def export_to_csv(self, rows, report_type, date_str, python_format):
         filename = f"orders_report_{report_type}"
         if date_str:
             filename += f"_{date_str}"
         filename += ".csv"
 
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        response.write('\ufeff'.encode('utf-8'))
-
-        writer = csv.writer(response, delimiter=';')
-        columns_config = self.get_columns_config(report_type)
-        writer.writerow(list(columns_config.values()))
-
-        for order in orders.distinct():
-            filtered_items = self.get_filtered_items(order.items.all(), product_id, category_id, brand_id)
-            if not filtered_items.exists():
-                continue
-
-            filtered_total = sum(item.quantity * item.price for item in filtered_items)
-
-            row = [
-                order.id,
-                f"{order.first_name} {order.last_name}",
-                f"{filtered_total:.2f}",
-                order.date_created.strftime(f"{python_format} %H:%M")
-            ]
-            writer.writerow(row)
-
-        return response
+        # Строки читаются из базы пачками по мере отправки ответа.
+        return streaming_csv_response(
+            (self.format_row(row, python_format).values() for row in db_reports.iter_keyset(rows, ['order_id'], db_reports.DEFAULT_BATCH_SIZE)),
+            filename,
+            header=list(self.get_columns_config(report_type).values()),
+            content_type='application/vnd.ms-excel; charset=utf-8',
+            delimiter=';',
+        )
 
     def get_columns_config(self, report_type):
-        if report_type in ['day', 'week', 'month']:
-            return {
-                'id': 'ID заказа',
-                'user': 'Пользователь',
-                'total_price': 'Итоговая цена',
-                'date_created': 'Дата создания',
-            }
-        elif report_type == 'filtered':
-            return {
-                'id': 'ID заказа',
-                'user': 'Пользователь',
-                'total_price': 'Сумма заказа',
-                'date_created': 'Дата создания',
-            }
-        else:
-            return {
-                'id': 'ID заказа',
-                'user': 'Пользователь',
-                'total_price': 'Итоговая цена',
-                'date_created': 'Дата создания',
-            }
+        return reports.columns(report_type)
+
     def reports_view(request):
         user_format = getattr(getattr(request.user, 'profile', None), 'date_format', '%Y-%m-%d')
         return render(request, 'admin/reports.html', {
@@ -2469,6 +2684,95 @@ class OrdersReportAPIView(APIView):
         })
 
 
+class ReportJobsAPIView(APIView):
+    permission_classes = [IsAdminUserRole]
+
+    @swagger_auto_schema(
+        operation_summary="Поставить отчёт в очередь",
+        operation_description=(
+            "Отчёт строится в фоне воркером run_report_jobs. `kind` — `orders_report` "
+            "(как /api/orders-report/) или `admin_statement` (ведомость), `format` — `csv` или `json`, "
+            "`params` — параметры отчёта, дата в формате пользователя. "
+            "Статус задания — по ссылке из заголовка Location."
+        ),
+        tags=['Отчеты'],
+        request_body=ReportJobCreateSerializer,
+        responses={
+            202: openapi.Response(description="Задание поставлено в очередь", schema=ReportJobSerializer),
+            400: openapi.Response(description="Некорректные параметры"),
+            429: openapi.Response(description="Слишком много незавершённых заданий"),
+        }
+    )
+    def post(self, request):
+        serializer = ReportJobCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user_format = getattr(getattr(request.user, 'profile', None), 'date_format', '%d.%m.%Y')
+        python_format = user_format.replace('ГГГГ', '%Y').replace('ММ', '%m').replace('ДД', '%d')
+        try:
+            params = report_jobs.prepare_params(
+                serializer.validated_data['kind'], serializer.validated_data['params'], python_format, user_format,
+            )
+        except report_jobs.ReportJobError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            job = report_jobs.submit(request.user, serializer.validated_data['kind'], serializer.validated_data['format'], params)
+        except report_jobs.ReportJobError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+        response = Response(ReportJobSerializer(job, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
+        response['Location'] = request.build_absolute_uri(reverse('api_report_job_detail', args=[job.pk]))
+        return response
+
+    @swagger_auto_schema(
+        operation_summary="Последние задания на отчёты текущего пользователя",
+        tags=['Отчеты'],
+        responses={200: ReportJobSerializer(many=True)}
+    )
+    def get(self, request):
+        jobs = ReportJob.objects.filter(user=request.user).order_by('-created_at')[:20]
+        return Response(ReportJobSerializer(jobs, many=True, context={'request': request}).data)
+
+
+class ReportJobDetailAPIView(APIView):
+    permission_classes = [IsAdminUserRole]
+
+    @swagger_auto_schema(
+        operation_summary="Статус задания на отчёт",
+        tags=['Отчеты'],
+        responses={200: ReportJobSerializer, 404: openapi.Response(description="Задание не найдено")}
+    )
+    def get(self, request, job_id):
+        job = get_object_or_404(ReportJob, pk=job_id, user=request.user)
+        return Response(ReportJobSerializer(job, context={'request': request}).data)
+
+
+class ReportJobDownloadAPIView(APIView):
+    permission_classes = [IsAdminUserRole]
+
+    @swagger_auto_schema(
+        operation_summary="Скачать готовый отчёт",
+        tags=['Отчеты'],
+        responses={
+            200: openapi.Response(description="Файл отчёта"),
+            404: openapi.Response(description="Задание не найдено или файл удалён"),
+            409: openapi.Response(description="Отчёт ещё не готов"),
+        }
+    )
+    def get(self, request, job_id):
+        job = get_object_or_404(ReportJob, pk=job_id, user=request.user)
+        if job.status != 'done':
+            return Response({"detail": "Отчёт ещё не готов", "status": job.status}, status=status.HTTP_409_CONFLICT)
+        if not job.result or not os.path.exists(job.result.path):
+            return Response({"detail": "Файл отчёта удалён"}, status=status.HTTP_404_NOT_FOUND)
+
+        content_type = 'application/json' if job.format == 'json' else 'application/vnd.ms-excel; charset=utf-8'
+        filename = f"{job.kind}_{job.params.get('type')}_{job.created_at:%Y%m%d_%H%M}.{job.format}"
+        return FileResponse(open(job.result.path, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
+
+
 BACKUP_DIR = os.path.join(settings.MEDIA_ROOT, 'backups')
 os.makedirs(BACKUP_DIR, exist_ok=True)
 
@@ -2687,6 +2991,13 @@ class RestoreBackupAPIView(APIView):
                             )
                     cursor.execute("SET session_replication_role = 'origin';")
 
+            stock_totals.reconcile()
+            sales_rollup.rebuild()
+            availability.rebuild_availability()
+            taxonomy.invalidate()
+            suggest.invalidate()
+            catalog_index.reset()
+            catalog_version.bump()
             return Response({'success': True, 'message': 'База данных успешно восстановлена'})
 
         except Exception as e:
@@ -2795,31 +3106,14 @@ class ChartsDataAPIView(APIView):
     )
     def get(self, request):
         try:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT * FROM get_sales_by_category()")
-                category_rows = cursor.fetchall()
-
             category_data = [
-                {'category': row[0], 'total_sales': float(row[1])}
-                for row in category_rows
+                {'category': row['category_name'], 'total_sales': float(row['total_sales'])}
+                for row in sales_rollup.sales_by_category()
+            ]
+            month_data = [
+                {'month': row['month'].strftime('%Y-%m'), 'total_sales': float(row['total_sales'])}
+                for row in sales_rollup.sales_by_month()
             ]
-
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT * FROM get_sales_by_month()")
-                month_rows = cursor.fetchall()
-
-            month_data = []
-            for row in month_rows:
-                month_date = row[0]
-                if isinstance(month_date, str):
-                    formatted_month = month_date[:7] 
-                else:
-                    formatted_month = month_date.strftime('%Y-%m')
-
-                month_data.append({
-                    'month': formatted_month,
-                    'total_sales': float(row[1])
-                })
 
             return Response({
                 'success': True,
@@ -2901,18 +3195,14 @@ class SummaryTablesAPIView(APIView):
             return Response({'success': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def get_categories_summary(self):
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT category_name, total_orders, total_sales, avg_order_value FROM petshop_orders_by_category")
-            rows = cursor.fetchall()
-
         data = [
             {
-                'category_name': row[0],
-                'total_orders': row[1],
-                'total_sales': float(row[2]) if row[2] else 0,
-                'avg_order_value': float(row[3]) if row[3] else 0
+                'category_name': row['category_name'],
+                'total_orders': row['total_orders'],
+                'total_sales': float(row['total_sales']),
+                'avg_order_value': float(row['avg_order_value'])
             }
-            for row in rows
+            for row in sales_rollup.sales_by_category()
         ]
 
         return Response({
@@ -2929,20 +3219,15 @@ class SummaryTablesAPIView(APIView):
         })
 
     def get_months_summary(self):
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT month, total_orders, total_sales, avg_order_value FROM petshop_orders_by_month")
-            rows = cursor.fetchall()
-
-        data = []
-        for row in rows:
-            month_date = row[0]
-            formatted_month = month_date[:7] if isinstance(month_date, str) else month_date.strftime('%Y-%m')
-            data.append({
-                'month': formatted_month,
-                'total_orders': row[1],
-                'total_sales': float(row[2]) if row[2] else 0,
-                'avg_order_value': float(row[3]) if row[3] else 0
-            })
+        data = [
+            {
+                'month': row['month'].strftime('%Y-%m'),
+                'total_orders': row['total_orders'],
+                'total_sales': float(row['total_sales']),
+                'avg_order_value': float(row['avg_order_value'])
+            }
+            for row in sales_rollup.sales_by_month()
+        ]
 
         return Response({
             'success': True,
@@ -2958,18 +3243,14 @@ class SummaryTablesAPIView(APIView):
         })
 
     def get_brands_summary(self):
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT brand_name, total_orders, total_sales, avg_order_value FROM petshop_orders_by_brand")
-            rows = cursor.fetchall()
-
         data = [
             {
-                'brand_name': row[0] if row[0] else 'Без бренда',
-                'total_orders': row[1],
-                'total_sales': float(row[2]) if row[2] else 0,
-                'avg_order_value': float(row[3]) if row[3] else 0
+                'brand_name': row['brand_name'] or 'Без бренда',
+                'total_orders': row['total_orders'],
+                'total_sales': float(row['total_sales']),
+                'avg_order_value': float(row['avg_order_value'])
             }
-            for row in rows
+            for row in sales_rollup.sales_by_brand()
         ]
 
         return Response({
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class PetshopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'petshop'
-    verbose_name = 'Магазин "Yes of кусь"'
\ No newline at end of file
+    verbose_name = 'Магазин "Yes of кусь"'
+
+    def ready(self):
+        from . import signals  # noqa: F401
\ No newline at end of file
@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from . import reservations
+from .models import Product, ProductStock, ProductAvailability
+
+
+def refresh_availability(product_ids):
+    """
+    Приводит ProductAvailability для указанных товаров в соответствие
+    с остатками: строка (товар, пункт выдачи) есть тогда и только тогда,
+    когда товар активен и его количество на пункте за вычетом действующих
+    резервов больше нуля.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+
+    with transaction.atomic():
+        wanted = set(
+            reservations.with_available(ProductStock.objects.filter(product_id__in=product_ids, product__is_active=True))
+            .filter(available__gt=0)
+            .values_list('product_id', 'pickup_point_id')
+            .distinct()
+        )
+        existing = set(
+            ProductAvailability.objects
+            .filter(product_id__in=product_ids)
+            .values_list('product_id', 'pickup_point_id')
+        )
+
+        stale = existing - wanted
+        if stale:
+            condition = Q()
+            for product_id, pickup_point_id in stale:
+                condition |= Q(product_id=product_id, pickup_point_id=pickup_point_id)
+            ProductAvailability.objects.filter(condition).delete()
+
+        missing = wanted - existing
+        if missing:
+            ProductAvailability.objects.bulk_create([
+                ProductAvailability(product_id=product_id, pickup_point_id=pickup_point_id)
+                for product_id, pickup_point_id in missing
+            ], ignore_conflicts=True)
+
+
+def rebuild_availability():
+    with transaction.atomic():
+        ProductAvailability.objects.all().delete()
+        ProductAvailability.objects.bulk_create([
+            ProductAvailability(product_id=product_id, pickup_point_id=pickup_point_id)
+            for product_id, pickup_point_id in reservations.with_available(ProductStock.objects.filter(product__is_active=True))
+            .filter(available__gt=0)
+            .values_list('product_id', 'pickup_point_id')
+            .distinct()
+        ], batch_size=1000)
+
+
+def available_products(pickup_point_id=None):
+    availability = ProductAvailability.objects.filter(product=OuterRef('pk'))
+    if pickup_point_id is not None:
+        availability = availability.filter(pickup_point_id=pickup_point_id)
+    return Exists(availability)
+
+
+def filter_available(products, pickup_point_id=None):
+    return products.filter(available_products(pickup_point_id))
@@ -0,0 +1,200 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value, Window
+from django.db.models.functions import Coalesce
+
+from . import reservations
+from .models import Cart, Product, ProductStock
+
+
+OPERATIONS = ('add', 'set', 'remove')
+MAX_OPERATIONS = 200
+
+
+class CartError(ValueError):
+    def __init__(self, message, product_id=None):
+        self.product_id = product_id
+        super().__init__(message)
+
+
+def available_at(pickup_point, user=None, now=None, product=OuterRef('product_id')):
+    """Выражение: сколько единиц товара можно получить на пункте выдачи."""
+    stock = (
+        ProductStock.objects
+        .filter(product_id=product, pickup_point=pickup_point)
+        .values('product_id')
+        .annotate(total=Sum('quantity'))
+        .values('total')[:1]
+    )
+    available = Coalesce(Subquery(stock, output_field=IntegerField()), Value(0))
+    if reservations.is_enabled():
+        available = available - reservations.held_quantity(
+            now, exclude_user=user, product=product, pickup_point=pickup_point
+        )
+    return available
+
+
+def load(user, pickup_point=None, now=None):
+    """
+    Корзина одним запросом: поля товара, сумма каждой строки и итоги по
+    корзине (оконными функциями), а с pickup_point — сколько каждого
+    товара можно получить на этом пункте выдачи.
+    Возвращает (строки, {'total_price': ..., 'items_count': ...}).
+    """
+    line_total = ExpressionWrapper(
+        F('quantity') * F('product__price'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    items = Cart.objects.filter(user=user).annotate(
+        line_total=line_total,
+        cart_total=Window(Sum(line_total)),
+        cart_quantity=Window(Sum('quantity')),
+    )
+    fields = ['id', 'quantity', 'product_id', 'line_total', 'cart_total', 'cart_quantity']
+    if pickup_point is not None:
+        pickup_point = getattr(pickup_point, 'pk', pickup_point)
+        items = items.annotate(available_quantity=available_at(pickup_point, user, now))
+        fields.append('available_quantity')
+
+    rows = list(
+        items.values(
+            *fields,
+            product_name=F('product__name'),
+            product_price=F('product__price'),
+            product_image=F('product__image'),
+            product_is_active=F('product__is_active'),
+        ).order_by('id')
+    )
+    for row in rows:
+        if pickup_point is not None:
+            row['available_quantity'] = max(row['available_quantity'], 0)
+            row['is_available'] = row['product_is_active'] and row['available_quantity'] >= row['quantity']
+
+    summary = {
+        'total_price': rows[0]['cart_total'] if rows else Decimal('0.00'),
+        'items_count': rows[0]['cart_quantity'] if rows else 0,
+    }
+    return rows, summary
+
+
+def fold_operations(quantities, operations):
+    """Применяет операции по порядку к {id товара: количество}, не трогая базу."""
+    quantities = dict(quantities)
+    for operation in operations:
+        product_id = operation['product_id']
+        if operation['op'] == 'add':
+            quantities[product_id] = quantities.get(product_id, 0) + operation['quantity']
+        elif operation['op'] == 'set':
+            quantities[product_id] = operation['quantity']
+        else:
+            quantities[product_id] = 0
+    return quantities
+
+
+def load_products(product_ids, clamp=False):
+    """
+    Активные товары по id одним запросом. Без clamp отсутствующий товар —
+    ошибка, с clamp он просто пропускается.
+    """
+    products = Product.objects.filter(id__in=product_ids, is_active=True).only('id', 'name', 'stock').in_bulk()
+    if not clamp:
+        for product_id in product_ids:
+            if product_id not in products:
+                raise CartError(f"Товар #{product_id} не найден", product_id)
+    return products
+
+
+def check_available(products, quantities, user=None, clamp=False):
+    """
+    Проверяет количества по остаткам (одним запросом на все товары).
+    С clamp вместо ошибки уменьшает количество до доступного.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if product_id in products}
+    available = reservations.available_totals(list(products.values()), user)
+    for product_id, quantity in quantities.items():
+        if quantity <= available[product_id]:
+            continue
+        if clamp:
+            quantities[product_id] = max(available[product_id], 0)
+        else:
+            raise CartError(
+                f"Максимальное количество товара '{products[product_id].name}' превышено. "
+                f"Доступно {max(available[product_id], 0)}",
+                product_id,
+            )
+    return quantities
+
+
+def apply_operations(user, operations, pickup_point=None, clamp=False):
+    """
+    Применяет к корзине пользователя список операций
+    {'op': 'add' | 'set' | 'remove', 'product_id': ..., 'quantity': ...}
+    в одной транзакции: операции выполняются по порядку, остатки всех
+    затронутых товаров читаются одним запросом, корзина записывается
+    пачками. Если хотя бы одна позиция не проходит проверку, корзина
+    не меняется (с clamp количество урезается до доступного, а
+    недоступные товары пропускаются). С pickup_point в режиме
+    резервирования товары резервируются на этом пункте выдачи.
+    """
+    product_ids = {operation['product_id'] for operation in operations}
+
+    with transaction.atomic():
+        products = load_products(product_ids, clamp)
+
+        rows = {}
+        duplicates, merged = [], set()
+        for item in Cart.objects.select_for_update().filter(user=user, product_id__in=product_ids).order_by('id'):
+            if item.product_id in rows:
+                # Старые корзины могли накопить несколько строк на товар.
+                rows[item.product_id].quantity += item.quantity
+                duplicates.append(item.id)
+                merged.add(item.product_id)
+            else:
+                rows[item.product_id] = item
+        before = {product_id: item.quantity for product_id, item in rows.items()}
+
+        quantities = check_available(products, fold_operations(before, operations), user, clamp)
+
+        to_create, to_update, to_delete = [], [], list(duplicates)
+        for product_id, quantity in quantities.items():
+            item = rows.get(product_id)
+            if item is None:
+                if quantity:
+                    to_create.append(Cart(user=user, product_id=product_id, quantity=quantity))
+            elif not quantity:
+                to_delete.append(item.id)
+            elif quantity != before[product_id] or product_id in merged:
+                item.quantity = quantity
+                to_update.append(item)
+
+        if to_delete:
+            Cart.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            Cart.objects.bulk_update(to_update, ['quantity'])
+        if to_create:
+            Cart.objects.bulk_create(to_create)
+
+        if reservations.is_enabled():
+            _sync_reservations(user, products, quantities, pickup_point)
+
+
+def _sync_reservations(user, products, quantities, pickup_point):
+    removed = [product_id for product_id, quantity in quantities.items() if not quantity]
+    if removed:
+        reservations.release(user, removed)
+
+    targets = {}
+    for hold in reservations.active().filter(user=user, product_id__in=quantities).select_related('pickup_point'):
+        targets.setdefault(hold.product_id, set()).add(hold.pickup_point)
+    if pickup_point is not None:
+        for product_id in quantities:
+            targets.setdefault(product_id, set()).add(pickup_point)
+
+    for product_id, points in targets.items():
+        if quantities[product_id]:
+            for point in points:
+                try:
+                    reservations.reserve(user, products[product_id], point, quantities[product_id])
+                except reservations.ReservationError as e:
+                    raise CartError(str(e), product_id)
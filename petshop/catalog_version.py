@@ -0,0 +1,31 @@
+import time
+from datetime import datetime, timezone
+
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import CatalogVersion
+
+
+NAME = 'catalog'
+
+
+def _now():
+    return time.time_ns() // 1000
+
+
+def get_version():
+    """
+    Версия каталога — время последнего изменения в микросекундах. Хранится
+    строкой в базе, чтобы все процессы видели одно значение без общего кеша.
+    """
+    return CatalogVersion.objects.values_list('version', flat=True).get(name=NAME)
+
+
+def bump():
+    # Версия только растёт, даже если часы процесса отстают.
+    CatalogVersion.objects.filter(name=NAME).update(version=Greatest(F('version') + 1, Value(_now())))
+
+
+def last_modified(version):
+    return datetime.fromtimestamp(version // 1_000_000, tz=timezone.utc)
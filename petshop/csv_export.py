@@ -0,0 +1,31 @@
+import csv
+
+from django.http import StreamingHttpResponse
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: вместо записи возвращает строку."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, header=None, bom=True, **writer_options):
+    """Кодированные строки CSV по одной, без накопления файла в памяти."""
+    writer = csv.writer(_Echo(), **writer_options)
+    if bom:
+        yield '\ufeff'.encode('utf-8')
+    if header is not None:
+        yield writer.writerow(header).encode('utf-8')
+    for row in rows:
+        yield writer.writerow(row).encode('utf-8')
+
+
+def streaming_csv_response(rows, filename, header=None, content_type='text/csv; charset=utf-8', **writer_options):
+    """
+    CSV-ответ, который отдаётся клиенту по мере чтения rows: первые байты
+    уходят сразу, память не зависит от размера выгрузки.
+    """
+    response = StreamingHttpResponse(iter_csv(rows, header, **writer_options), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
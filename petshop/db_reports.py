@@ -1,28 +1,254 @@
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
 from django.db import connection
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
 
-def get_orders_report(product_id=None, category_id=None, brand_id=None, user_id=None):
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT * FROM get_orders_report(%s, %s, %s, %s);
-        """, [product_id, category_id, brand_id, user_id])
-        columns = [col[0] for col in cursor.description]
-        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-    return results
+from .models import OrderItem
 
-def get_orders_by_day(date):
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM get_orders_by_day(%s);", [date])
-        columns = [col[0] for col in cursor.description]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
-def get_orders_by_week(date):
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM get_orders_by_week(%s);", [date])
-        columns = [col[0] for col in cursor.description]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+DEFAULT_BATCH_SIZE = 2000
+
+# Заголовки колонок отчётов get_*.
+COLUMN_NAMES = {
+    "order_id": "ID заказа",
+    "user_name": "Пользователь",
+    "total": "Сумма заказа",
+    "order_date": "Дата создания",
+    "product_name": "Товар",
+    "brand_name": "Бренд",
+    "category_name": "Категория",
+    "quantity": "Кол-во товара"
+}
+
 
-def get_orders_by_month(date):
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM get_orders_by_month(%s);", [date])
+def iter_rows(sql, params, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Строки запроса словарями, пачками по batch_size через fetchmany.
+    На Postgres курсор серверный, поэтому результат не держится в памяти
+    целиком ни в драйвере базы, ни в Python.
+    """
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
         columns = [col[0] for col in cursor.description]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
\ No newline at end of file
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(columns, row))
+
+
+def iter_keyset(queryset, fields, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Строки queryset.values(), упорядоченного по уникальному набору полей
+    fields, пачками по batch_size: каждая пачка — отдельный запрос со
+    строками после последней строки предыдущей. iterator() на MySQL
+    память не экономит (драйвер читает весь результат сразу), а здесь она
+    не зависит от размера выборки на любой базе. Пачки читаются разными
+    запросами, поэтому строки, изменённые во время выгрузки, могут попасть
+    в неё уже изменёнными.
+    """
+    after = Q()
+    while True:
+        rows = list(queryset.filter(after)[:batch_size])
+        yield from rows
+        if len(rows) < batch_size:
+            break
+        last = [rows[-1][field] for field in fields]
+        after = Q()
+        for i, field in enumerate(fields):
+            after |= Q(**dict(zip(fields[:i], last[:i])), **{f'{field}__gt': last[i]})
+
+
+# Функции get_* в Postgres ставятся вручную и в миграциях их нет, поэтому
+# по умолчанию отчёты строятся через ORM (engine='orm') и работают на
+# любой базе. engine='sql' вызывает функции базы — для сверки
+# (check_report_parity) и для баз, где они уже установлены.
+ENGINES = ('orm', 'sql')
+
+# Функции считают даты в часовом поясе соединения, а Django открывает
+# соединение с Postgres в UTC: date_created::DATE и date_trunc дают дату
+# по UTC. ORM-версии повторяют это, чтобы выдача совпадала.
+REPORT_TZ = dt_timezone.utc
+
+
+def _engine(engine):
+    engine = engine or getattr(settings, 'REPORTS_ENGINE', 'orm')
+    if engine not in ENGINES:
+        raise ValueError(f"Неизвестный движок отчётов: {engine}")
+    return engine
+
+
+def _line_total():
+    return ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def _order_date():
+    return TruncDate('order__date_created', tzinfo=REPORT_TZ)
+
+
+def period_bounds(report_type, day):
+    """[начало, конец) дня, недели (с понедельника) или месяца, куда попадает day, в REPORT_TZ."""
+    if report_type == 'day':
+        start, end = day, day + timedelta(days=1)
+    elif report_type == 'week':
+        start = day - timedelta(days=day.weekday())
+        end = start + timedelta(days=7)
+    elif report_type == 'month':
+        start = day.replace(day=1)
+        end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    else:
+        raise ValueError(f"Неизвестный период: {report_type}")
+    return (
+        datetime.combine(start, time.min, tzinfo=REPORT_TZ),
+        datetime.combine(end, time.min, tzinfo=REPORT_TZ),
+    )
+
+
+def _orm_orders_by_period(report_type, day, batch_size):
+    start, end = period_bounds(report_type, day)
+    rows = (
+        OrderItem.objects
+        .filter(order__date_created__gte=start, order__date_created__lt=end)
+        .values('order_id', 'order__user__first_name', 'order__user__last_name', order_date=_order_date())
+        .annotate(total=Sum(_line_total()))
+        .order_by('order_id')
+    )
+    for row in iter_keyset(rows, ['order_id'], batch_size):
+        yield {
+            'order_id': row['order_id'],
+            'user_name': f"{row['order__user__first_name']} {row['order__user__last_name']}",
+            'total': row['total'],
+            'order_date': row['order_date'],
+        }
+
+
+def _orm_orders_report(product_id, category_id, brand_id, user_id, batch_size):
+    # Как в функции: позиции товаров без бренда в отчёт не попадают.
+    items = OrderItem.objects.filter(product__brand__isnull=False)
+    if product_id:
+        items = items.filter(product_id=product_id)
+    if category_id:
+        items = items.filter(product__category_id=category_id)
+    if brand_id:
+        items = items.filter(product__brand_id=brand_id)
+    if user_id:
+        items = items.filter(order__user_id=user_id)
+
+    rows = (
+        items
+        .annotate(total=_line_total(), order_date=_order_date())
+        .values(
+            'order_id', 'id', 'product__name', 'product__brand__name', 'product__category__name',
+            'order__user__first_name', 'order__user__last_name', 'quantity', 'total', 'order_date',
+        )
+        .order_by('order_id', 'id')
+    )
+    for row in iter_keyset(rows, ['order_id', 'id'], batch_size):
+        yield {
+            'order_id': row['order_id'],
+            'product_name': row['product__name'],
+            'brand_name': row['product__brand__name'],
+            'category_name': row['product__category__name'],
+            'user_name': f"{row['order__user__first_name']} {row['order__user__last_name']}",
+            'quantity': row['quantity'],
+            'total': row['total'],
+            'order_date': row['order_date'],
+        }
+
+
+def _orm_sales_by_category():
+    rows = (
+        OrderItem.objects
+        .values(category_name=F('product__category__name'))
+        .annotate(total_sales=Sum(_line_total()))
+        .order_by('-total_sales', 'category_name')
+    )
+    return [{'category_name': row['category_name'], 'total_sales': row['total_sales']} for row in rows]
+
+
+def _orm_sales_by_month():
+    rows = (
+        OrderItem.objects
+        .values(month=TruncMonth('order__date_created', tzinfo=REPORT_TZ))
+        .annotate(total_sales=Sum(_line_total()))
+        .order_by('month')
+    )
+    return [{'month': row['month'].date(), 'total_sales': row['total_sales']} for row in rows]
+
+
+def iter_orders_report(product_id=None, category_id=None, brand_id=None, user_id=None, batch_size=DEFAULT_BATCH_SIZE, engine=None):
+    if _engine(engine) == 'sql':
+        return iter_rows("SELECT * FROM get_orders_report(%s, %s, %s, %s);",
+                         [product_id, category_id, brand_id, user_id], batch_size)
+    return _orm_orders_report(product_id, category_id, brand_id, user_id, batch_size)
+
+
+def iter_orders_by_day(date, batch_size=DEFAULT_BATCH_SIZE, engine=None):
+    if _engine(engine) == 'sql':
+        return iter_rows("SELECT * FROM get_orders_by_day(%s);", [date], batch_size)
+    return _orm_orders_by_period('day', date, batch_size)
+
+
+def iter_orders_by_week(date, batch_size=DEFAULT_BATCH_SIZE, engine=None):
+    if _engine(engine) == 'sql':
+        return iter_rows("SELECT * FROM get_orders_by_week(%s);", [date], batch_size)
+    return _orm_orders_by_period('week', date, batch_size)
+
+
+def iter_orders_by_month(date, batch_size=DEFAULT_BATCH_SIZE, engine=None):
+    if _engine(engine) == 'sql':
+        return iter_rows("SELECT * FROM get_orders_by_month(%s);", [date], batch_size)
+    return _orm_orders_by_period('month', date, batch_size)
+
+
+def iter_report(report_type, date, product_id=None, category_id=None, brand_id=None, user_id=None,
+                batch_size=DEFAULT_BATCH_SIZE, engine=None):
+    """Отчёт day/week/month за дату или отчёт по фильтрам для остальных типов."""
+    if report_type == 'day':
+        return iter_orders_by_day(date, batch_size, engine)
+    if report_type == 'week':
+        return iter_orders_by_week(date, batch_size, engine)
+    if report_type == 'month':
+        return iter_orders_by_month(date, batch_size, engine)
+    return iter_orders_report(product_id, category_id, brand_id, user_id, batch_size, engine)
+
+
+def iter_table(rows):
+    """Строки для CSV: заголовок по колонкам первой строки, затем значения; пустой отчёт — без заголовка."""
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+    yield [COLUMN_NAMES.get(column, column) for column in first]
+    yield list(first.values())
+    for row in rows:
+        yield list(row.values())
+
+
+def get_orders_report(product_id=None, category_id=None, brand_id=None, user_id=None, engine=None):
+    return list(iter_orders_report(product_id, category_id, brand_id, user_id, engine=engine))
+
+def get_orders_by_day(date, engine=None):
+    return list(iter_orders_by_day(date, engine=engine))
+
+def get_orders_by_week(date, engine=None):
+    return list(iter_orders_by_week(date, engine=engine))
+
+def get_orders_by_month(date, engine=None):
+    return list(iter_orders_by_month(date, engine=engine))
+
+def get_sales_by_category(engine=None):
+    """Продажи по названию категории, по убыванию; строки category_name, total_sales."""
+    if _engine(engine) == 'sql':
+        return list(iter_rows("SELECT * FROM get_sales_by_category();", []))
+    return _orm_sales_by_category()
+
+def get_sales_by_month(engine=None):
+    """Продажи по месяцам (month — первое число месяца), по возрастанию."""
+    if _engine(engine) == 'sql':
+        return list(iter_rows("SELECT * FROM get_sales_by_month();", []))
+    return _orm_sales_by_month()
+
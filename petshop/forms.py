@@ -192,10 +192,9 @@ class CartAddForm(forms.ModelForm):
         product = self.cleaned_data.get('product')
 
         if product and quantity:
-            total_stock = sum(stock.quantity for stock in product.stocks.all())
-            if quantity > total_stock:
+            if quantity > product.stock:
                 raise forms.ValidationError(
-                    f"Невозможно добавить {quantity} шт. товара '{product.name}'. В наличии только {total_stock} шт."
+                    f"Невозможно добавить {quantity} шт. товара '{product.name}'. В наличии только {product.stock} шт."
                 )
         return quantity
 
@@ -0,0 +1,113 @@
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import OuterRef
+
+from . import carts
+from .models import Product
+
+
+# Корзина гостя хранится целиком в подписанной cookie: пока покупатель не
+# вошёл, изменения корзины не пишут в базу. При входе она одной пачкой
+# переносится в Cart (merge_into).
+COOKIE_NAME = 'guest_cart'
+SALT = 'petshop.guest_cart'
+MAX_LINES = 50
+
+
+def read(request):
+    """{id товара: количество} из cookie; подделанная или испорченная cookie — пустая корзина."""
+    raw = request.get_signed_cookie(COOKIE_NAME, default=None, salt=SALT, max_age=settings.GUEST_CART_MAX_AGE)
+    if not raw:
+        return {}
+    try:
+        return {int(product_id): int(quantity) for product_id, quantity in json.loads(raw).items() if int(quantity) > 0}
+    except (ValueError, TypeError, AttributeError):
+        return {}
+
+
+def write(response, items):
+    if items:
+        response.set_signed_cookie(
+            COOKIE_NAME,
+            json.dumps({str(product_id): quantity for product_id, quantity in items.items()}, separators=(',', ':')),
+            salt=SALT,
+            max_age=settings.GUEST_CART_MAX_AGE,
+            httponly=True,
+            samesite='Lax',
+            secure=settings.SESSION_COOKIE_SECURE,
+        )
+    else:
+        response.delete_cookie(COOKIE_NAME, samesite='Lax')
+    return response
+
+
+def apply_operations(items, operations):
+    """
+    Те же операции, что carts.apply_operations, но над корзиной из cookie.
+    Возвращает новую корзину; остатки проверяются одним запросом.
+    """
+    quantities = carts.fold_operations(items, operations)
+    changed = {operation['product_id'] for operation in operations}
+    products = carts.load_products(changed)
+    checked = carts.check_available(products, {product_id: quantities[product_id] for product_id in changed})
+
+    result = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in changed}
+    result.update(checked)
+    result = {product_id: quantity for product_id, quantity in result.items() if quantity}
+    if len(result) > MAX_LINES:
+        raise carts.CartError(f"В корзине может быть не больше {MAX_LINES} разных товаров. Войдите, чтобы добавить больше")
+    return result
+
+
+def load(items, pickup_point=None):
+    """
+    Строки корзины гостя в том же виде, что carts.load, одним запросом к
+    товарам. Товары, которых больше нет в каталоге, пропускаются.
+    """
+    products = Product.objects.filter(id__in=items)
+    fields = ['id', 'name', 'price', 'image', 'is_active']
+    if pickup_point is not None:
+        pickup_point = getattr(pickup_point, 'pk', pickup_point)
+        products = products.annotate(available_quantity=carts.available_at(pickup_point, product=OuterRef('pk')))
+        fields.append('available_quantity')
+
+    rows = []
+    for product in products.values(*fields).order_by('id'):
+        quantity = items[product['id']]
+        row = {
+            'id': product['id'],
+            'quantity': quantity,
+            'product_id': product['id'],
+            'line_total': product['price'] * quantity,
+            'product_name': product['name'],
+            'product_price': product['price'],
+            'product_image': product['image'],
+            'product_is_active': product['is_active'],
+        }
+        if pickup_point is not None:
+            row['available_quantity'] = max(product['available_quantity'], 0)
+            row['is_available'] = product['is_active'] and row['available_quantity'] >= quantity
+        rows.append(row)
+
+    summary = {
+        'total_price': sum((row['line_total'] for row in rows), Decimal('0.00')),
+        'items_count': sum(row['quantity'] for row in rows),
+    }
+    return rows, summary
+
+
+def merge_into(user, items):
+    """
+    Переносит корзину гостя в Cart пользователя одной пачкой: количества
+    складываются с уже лежащими в корзине и урезаются до доступного
+    остатка, пропавшие из каталога товары отбрасываются.
+    """
+    if not items:
+        return
+    carts.apply_operations(
+        user,
+        [{'op': 'add', 'product_id': product_id, 'quantity': quantity} for product_id, quantity in items.items()],
+        clamp=True,
+    )
@@ -0,0 +1,157 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from petshop import taxonomy, availability
+from petshop.models import (
+    Product, ProductPurpose, ProductStock, PickupPoint,
+    Category, Brand, AgeCategory, ProductType, Species, Purpose,
+)
+from api_shop import catalog_index
+from api_shop.catalog import apply_facet_filters, compute_facets
+from api_shop.pagination import paginate_by_cursor
+
+TAXONOMY_SIZES = {
+    'category': 20, 'brand': 40, 'type': 10, 'age': 4, 'species': 8, 'purpose': 12, 'pickup_point': 10,
+}
+
+SCENARIOS = [
+    ('Категория, цена по возрастанию', {'category': {1}}, None, None, 'price_asc', False),
+    ('Бренд + назначение, название по убыванию', {'brand': {1, 2, 3}, 'purpose': {2}}, None, None, 'name_desc', False),
+    ('Пункт выдачи + диапазон цен', {'species': {1}}, 1, (500, 1500), None, False),
+    ('Фасеты по категории', {'category': {1, 2}}, None, None, None, True),
+]
+
+
+def synthetic_catalog(size, seed=1):
+    rnd = random.Random(seed)
+    products, purposes, stocks = [], [], []
+    for i in range(1, size + 1):
+        products.append({
+            'id': i,
+            'name': f'Товар {rnd.randint(1, size)}',
+            'price': Decimal(rnd.randint(50, 5000)),
+            'is_active': rnd.random() > 0.05,
+            'category_id': rnd.randint(1, TAXONOMY_SIZES['category']),
+            'brand_id': rnd.randint(1, TAXONOMY_SIZES['brand']),
+            'product_type_id': rnd.randint(1, TAXONOMY_SIZES['type']),
+            'age_category_id': rnd.randint(1, TAXONOMY_SIZES['age']),
+            'species_id': rnd.randint(1, TAXONOMY_SIZES['species']),
+        })
+        for purpose_id in rnd.sample(range(1, TAXONOMY_SIZES['purpose'] + 1), rnd.randint(1, 2)):
+            purposes.append((i, purpose_id))
+        for pickup_point_id in rnd.sample(range(1, TAXONOMY_SIZES['pickup_point'] + 1), rnd.randint(0, 3)):
+            stocks.append((i, pickup_point_id, rnd.randint(0, 20)))
+    return products, purposes, stocks
+
+
+class Command(BaseCommand):
+    help = "Сравнивает время ответа каталога из индекса в памяти и через ORM"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--orm', action='store_true',
+                            help="Загрузить данные в БД (транзакция откатывается) и замерить ORM")
+
+    def handle(self, *args, **options):
+        if catalog_index.np is None:
+            raise CommandError("Для индекса каталога требуется numpy")
+
+        for size in options['sizes']:
+            self.stdout.write(f"\n=== {size} товаров ===")
+            products, purposes, stocks = synthetic_catalog(size)
+
+            if not options['orm']:
+                started = time.perf_counter()
+                index = catalog_index.CatalogIndex().build(products, purposes, stocks)
+                self.stdout.write(f"Построение индекса: {time.perf_counter() - started:.2f} с")
+                self._report(index, None, options['repeat'])
+                continue
+
+            with transaction.atomic():
+                ids = self._load(products, purposes, stocks)
+                started = time.perf_counter()
+                index = catalog_index.CatalogIndex().build()
+                self.stdout.write(f"Построение индекса из БД: {time.perf_counter() - started:.2f} с")
+                self._report(index, ids, options['repeat'])
+                transaction.set_rollback(True)
+            taxonomy.invalidate()
+
+    def _load(self, products, purposes, stocks):
+        def create(model, field, count):
+            return [model.objects.create(**{field: f'Бенчмарк {i}'}).id for i in range(count)]
+
+        ids = {
+            'category': create(Category, 'name', TAXONOMY_SIZES['category']),
+            'brand': create(Brand, 'name', TAXONOMY_SIZES['brand']),
+            'type': create(ProductType, 'type_name', TAXONOMY_SIZES['type']),
+            'age': create(AgeCategory, 'age_name', TAXONOMY_SIZES['age']),
+            'species': create(Species, 'species_name', TAXONOMY_SIZES['species']),
+            'purpose': create(Purpose, 'purpose_name', TAXONOMY_SIZES['purpose']),
+            'pickup_point': create(PickupPoint, 'address', TAXONOMY_SIZES['pickup_point']),
+        }
+        fields = {
+            'category_id': 'category', 'brand_id': 'brand', 'product_type_id': 'type',
+            'age_category_id': 'age', 'species_id': 'species',
+        }
+
+        product_ids = {}
+        batch = []
+        for values in products:
+            kwargs = {field: ids[param][values[field] - 1] for field, param in fields.items()}
+            batch.append(Product(name=values['name'], price=values['price'], is_active=values['is_active'], **kwargs))
+        for values, product in zip(products, Product.objects.bulk_create(batch, batch_size=5000)):
+            product_ids[values['id']] = product.id
+
+        ProductPurpose.objects.bulk_create([
+            ProductPurpose(product_id=product_ids[p], purpose_id=ids['purpose'][u - 1]) for p, u in purposes
+        ], batch_size=5000)
+        ProductStock.objects.bulk_create([
+            ProductStock(product_id=product_ids[p], pickup_point_id=ids['pickup_point'][pp - 1], quantity=q)
+            for p, pp, q in stocks
+        ], batch_size=5000)
+        availability.rebuild_availability()
+        return ids
+
+    def _report(self, index, ids, repeat):
+        for title, selected, pickup_point, prices, sort, with_facets in SCENARIOS:
+            if ids is not None:
+                selected = {param: {ids[param][i - 1] for i in values} for param, values in selected.items()}
+                pickup_point = ids['pickup_point'][pickup_point - 1] if pickup_point else None
+            price_min, price_max = prices or (None, None)
+
+            if with_facets:
+                run_index = lambda: index.facets(selected, pickup_point, price_min, price_max)
+            else:
+                run_index = lambda: index.query(selected, pickup_point, price_min, price_max, sort, limit=24)
+            line = f"{title}: индекс {self._measure(run_index, repeat):.2f} мс"
+
+            if ids is not None:
+                run_orm = lambda: self._orm(selected, pickup_point, price_min, price_max, sort, with_facets)
+                line += f", ORM {self._measure(run_orm, max(1, repeat // 4)):.2f} мс"
+            self.stdout.write(line)
+
+    def _orm(self, selected, pickup_point, price_min, price_max, sort, with_facets):
+        products = availability.filter_available(Product.objects.filter(is_active=True), pickup_point)
+        if with_facets:
+            return compute_facets(products, selected, price_min, price_max)
+
+        products = apply_facet_filters(products, selected)
+        if price_min is not None:
+            products = products.filter(price__gte=price_min)
+        if price_max is not None:
+            products = products.filter(price__lte=price_max)
+        return paginate_by_cursor(products.only('id', 'name', 'price'), sort, None, 24)
+
+    def _measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,107 @@
+import random
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+
+from petshop import orders
+from petshop.models import User, Product, ProductStock, PickupPoint, Category, Cart
+
+
+class Command(BaseCommand):
+    help = "Нагрузочный тест оформления заказов: N параллельных покупателей на общих остатках"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=20, help="Заказов на одного покупателя")
+        parser.add_argument('--products', type=int, default=10)
+        parser.add_argument('--lines', type=int, default=3, help="Позиций в корзине")
+        parser.add_argument('--stock', type=int, default=None,
+                            help="Начальный остаток каждого товара (по умолчанию хватает на все заказы)")
+        parser.add_argument('--keep', action='store_true', help="Не удалять тестовые данные")
+
+    def handle(self, *args, **options):
+        buyers, per_buyer = options['buyers'], options['orders']
+        lines = min(options['lines'], options['products'])
+        initial_stock = options['stock'] or buyers * per_buyer * 2
+
+        suffix = int(time.time())
+        category = Category.objects.create(name=f'Бенчмарк заказов {suffix}')
+        pickup_point = PickupPoint.objects.create(address=f'Бенчмарк заказов {suffix}')
+        products = [
+            Product.objects.create(category=category, name=f'Бенчмарк {i}', price=Decimal(100 + i))
+            for i in range(options['products'])
+        ]
+        for product in products:
+            ProductStock.objects.create(product=product, pickup_point=pickup_point, quantity=initial_stock)
+        users = [
+            User.objects.create_user(email=f'bench{suffix}_{i}@example.com', password=None,
+                                     first_name='Бенчмарк', last_name=str(i))
+            for i in range(buyers)
+        ]
+
+        results = {'ok': 0, 'rejected': 0, 'failed': 0, 'sold': 0}
+        latencies = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(buyers)
+
+        def buyer(user, seed):
+            rnd = random.Random(seed)
+            try:
+                barrier.wait()
+                for _ in range(per_buyer):
+                    cart = [(product, rnd.randint(1, 2)) for product in rnd.sample(products, lines)]
+                    started = time.perf_counter()
+                    try:
+                        Cart.objects.bulk_create([Cart(user=user, product=p, quantity=q) for p, q in cart])
+                        orders.place_order(user, pickup_point, user.first_name, user.last_name, user.email, None)
+                        outcome = 'ok'
+                    except orders.OrderError:
+                        outcome = 'rejected'
+                        Cart.objects.filter(user=user).delete()
+                    except Exception as e:
+                        outcome = 'failed'
+                        self.stderr.write(f"Ошибка: {e}")
+                        Cart.objects.filter(user=user).delete()
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        results[outcome] += 1
+                        latencies.append(elapsed)
+                        if outcome == 'ok':
+                            results['sold'] += sum(q for _, q in cart)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer, args=(user, i)) for i, user in enumerate(users)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        remaining = ProductStock.objects.filter(pickup_point=pickup_point).aggregate(total=Sum('quantity'))['total']
+        negative = ProductStock.objects.filter(pickup_point=pickup_point, quantity__lt=0).count()
+        consistent = remaining == initial_stock * len(products) - results['sold'] and not negative
+
+        latencies.sort()
+        self.stdout.write(f"Покупателей: {buyers}, заказов: {len(latencies)} за {elapsed:.2f} с")
+        self.stdout.write(f"Пропускная способность: {results['ok'] / elapsed:.1f} заказов/с")
+        if latencies:
+            self.stdout.write(
+                f"Время оформления: p50 {statistics.median(latencies):.1f} мс, "
+                f"p95 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.1f} мс"
+            )
+        self.stdout.write(f"Успешно: {results['ok']}, отказ по остатку: {results['rejected']}, ошибок: {results['failed']}")
+        style = self.style.SUCCESS if consistent else self.style.ERROR
+        self.stdout.write(style(f"Остатки согласованы: {'да' if consistent else 'нет'}"))
+
+        if not options['keep']:
+            User.objects.filter(id__in=[u.id for u in users]).delete()
+            Product.objects.filter(id__in=[p.id for p in products]).delete()
+            pickup_point.delete()
+            category.delete()
@@ -0,0 +1,80 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from petshop import order_numbers, reports
+from petshop.models import Brand, Category, Order, OrderItem, PickupPoint, Product, User
+
+
+class Command(BaseCommand):
+    help = "Замер отчёта по заказам: число запросов и время на диапазонах разного размера"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000', help="Размеры диапазона (заказов) через запятую")
+        parser.add_argument('--items', type=int, default=3, help="Позиций в заказе")
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        suffix = int(time.time())
+        rnd = random.Random(1)
+
+        categories = [Category.objects.create(name=f'Бенчмарк отчётов {suffix} {i}') for i in range(3)]
+        brands = [Brand.objects.create(name=f'Бенчмарк отчётов {suffix} {i}') for i in range(3)]
+        products = [
+            Product.objects.create(category=categories[i % 3], brand=brands[i // 3 % 3],
+                                   name=f'Бенчмарк отчётов {i}', price=Decimal(100 + i))
+            for i in range(30)
+        ]
+        pickup_point = PickupPoint.objects.create(address=f'Бенчмарк отчётов {suffix}')
+        user = User.objects.create_user(email=f'bench_reports{suffix}@example.com', password=None,
+                                        first_name='Бенчмарк', last_name='Отчёты')
+        today = timezone.localdate()
+
+        try:
+            created = 0
+            for size in sizes:
+                self._create_orders(size - created, user, pickup_point, products, options['items'], rnd)
+                created = size
+
+                cases = [
+                    ('месяц', dict(report_type='month', target_date=today)),
+                    ('месяц + категория', dict(report_type='month', target_date=today, category_id=categories[0].id)),
+                    ('все заказы + бренд и пользователь', dict(report_type='filtered', brand_id=brands[1].id, user_id=user.id)),
+                ]
+                for title, params in cases:
+                    timings = []
+                    for _ in range(options['repeat']):
+                        with CaptureQueriesContext(connection) as queries:
+                            started = time.perf_counter()
+                            rows = list(reports.orders_report(**params))
+                            timings.append(time.perf_counter() - started)
+                    self.stdout.write(
+                        f"{size} заказов, {title}: строк {len(rows)}, запросов {len(queries)}, "
+                        f"{min(timings) * 1000:.1f} мс"
+                    )
+        finally:
+            Order.objects.filter(user=user).delete()
+            Product.objects.filter(id__in=[p.id for p in products]).delete()
+            pickup_point.delete()
+            user.delete()
+            Category.objects.filter(id__in=[c.id for c in categories]).delete()
+            Brand.objects.filter(id__in=[b.id for b in brands]).delete()
+
+    def _create_orders(self, count, user, pickup_point, products, items_per_order, rnd):
+        for offset in range(0, count, 1000):
+            batch = Order.objects.bulk_create([
+                Order(user=user, pickup_point=pickup_point, order_number=order_numbers.next_number(),
+                      first_name='Бенчмарк', last_name='Отчёты', total_price=Decimal('0'))
+                for _ in range(min(1000, count - offset))
+            ])
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=rnd.randint(1, 3), price=product.price)
+                for order in batch
+                for product in rnd.sample(products, items_per_order)
+            ], batch_size=1000)
@@ -0,0 +1,76 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from petshop import search
+from petshop.models import Product, Category
+
+WORDS = [
+    'корм', 'сухой', 'влажный', 'кошек', 'собак', 'щенков', 'котят', 'птиц', 'грызунов', 'рыб',
+    'игрушка', 'мяч', 'когтеточка', 'лежанка', 'домик', 'клетка', 'аквариум', 'наполнитель',
+    'ошейник', 'поводок', 'шампунь', 'витамины', 'лакомство', 'миска', 'переноска', 'курица',
+    'говядина', 'лосось', 'индейка', 'ягненок', 'гипоаллергенный', 'стерилизованных', 'крупных', 'мелких',
+]
+
+SYLLABLES = ['ба', 'ве', 'ги', 'до', 'жу', 'зо', 'ки', 'ла', 'ме', 'но', 'пу', 'ро', 'си', 'ту', 'фа', 'ха', 'це', 'шо']
+
+QUERIES = ['корм', 'корм кошек', 'сухой корм собак', 'игрушк', 'лакомство индейка', 'гипоаллергенный корм крупных']
+
+
+class Command(BaseCommand):
+    help = "Замеряет время поиска товаров по индексу и полным просмотром через icontains"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--target-ms', type=float, default=50.0,
+                            help="Целевое время ответа (p95) для поиска по индексу")
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            self.stdout.write(f"\n=== {size} товаров ===")
+            with transaction.atomic():
+                self._load(size)
+                started = time.perf_counter()
+                terms = search.rebuild_index()
+                self.stdout.write(f"Построение индекса: {terms} термов за {time.perf_counter() - started:.2f} с")
+
+                for query in QUERIES:
+                    indexed = self._measure(lambda: list(search.ranked_matches(query).order_by('-rank')), options['repeat'])
+                    scan = self._measure(lambda: list(Product.objects.filter(
+                        Q(name__icontains=query) | Q(description__icontains=query)
+                    ).values_list('id', flat=True)), options['repeat'])
+                    verdict = 'OK' if indexed[1] <= options['target_ms'] else 'превышено'
+                    self.stdout.write(
+                        f"«{query}»: индекс p50 {indexed[0]:.2f} мс / p95 {indexed[1]:.2f} мс ({verdict}), "
+                        f"icontains p50 {scan[0]:.2f} мс / p95 {scan[1]:.2f} мс"
+                    )
+                transaction.set_rollback(True)
+
+    def _load(self, size):
+        rnd = random.Random(size)
+        vocabulary = list({''.join(rnd.choices(SYLLABLES, k=4)) for _ in range(5000)})
+        category = Category.objects.create(name='Бенчмарк поиска')
+        Product.objects.bulk_create([
+            Product(
+                category=category,
+                name=' '.join(rnd.sample(WORDS, 2) + rnd.sample(vocabulary, 1)).capitalize(),
+                description=' '.join(rnd.choices(WORDS, k=3) + rnd.choices(vocabulary, k=12)),
+                price=Decimal(rnd.randint(50, 5000)),
+            )
+            for _ in range(size)
+        ], batch_size=5000)
+
+    def _measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
@@ -0,0 +1,135 @@
+import random
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from petshop import db_reports
+from petshop.models import OrderItem
+
+
+def _functions_installed():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_proc WHERE proname = 'get_orders_report'")
+        return cursor.fetchone() is not None
+
+
+class SqlReports:
+    """Отчёты функциями базы (db_reports с engine='sql')."""
+
+    def orders_by_period(self, report_type, day):
+        return list(db_reports.iter_report(report_type, day, engine='sql'))
+
+    def orders_report(self, **filters):
+        return db_reports.get_orders_report(engine='sql', **filters)
+
+    def sales_by_category(self):
+        return db_reports.get_sales_by_category(engine='sql')
+
+    def sales_by_month(self):
+        return db_reports.get_sales_by_month(engine='sql')
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет ORM-версии отчётов db_reports с функциями get_* в Postgres на данных "
+        "базы: те же строки, колонки, типы и порядок. Без функций отчёты проверяют "
+        "тесты petshop.tests.ReportParityTests"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dates', type=int, default=10, help="Сколько дат с заказами проверить в отчётах за период")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if not _functions_installed():
+            raise CommandError("Функции get_* в базе не найдены")
+        reference = SqlReports()
+
+        failed = 0
+        for title, actual, expected, order_key in self._cases(reference, options['dates'], random.Random(options['seed'])):
+            problem = self._compare(actual(), expected(), order_key)
+            if problem:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"{title}: {problem}"))
+            else:
+                self.stdout.write(f"{title}: совпадает")
+
+        if failed:
+            raise CommandError(f"Расхождений: {failed}")
+        self.stdout.write(self.style.SUCCESS("Все отчёты совпадают"))
+
+    def _cases(self, reference, dates_count, rnd):
+        dates = sorted({item_date.astimezone(dt_timezone.utc).date() for item_date in
+                        OrderItem.objects.values_list('order__date_created', flat=True).distinct()})
+        dates = sorted(rnd.sample(dates, min(dates_count, len(dates)))) + [timezone.now().astimezone(dt_timezone.utc).date()]
+        for day in dates:
+            for report_type in ('day', 'week', 'month'):
+                yield (
+                    f"{report_type} {day}",
+                    lambda report_type=report_type, day=day: list(db_reports.iter_report(report_type, day, engine='orm')),
+                    lambda report_type=report_type, day=day: reference.orders_by_period(report_type, day),
+                    None,
+                )
+
+        sample = OrderItem.objects.filter(product__brand__isnull=False).select_related('order', 'product').order_by('?').first()
+        filters = [{}]
+        if sample is not None:
+            filters += [
+                {'product_id': sample.product_id},
+                {'category_id': sample.product.category_id},
+                {'brand_id': sample.product.brand_id},
+                {'user_id': sample.order.user_id},
+                {'brand_id': sample.product.brand_id, 'user_id': sample.order.user_id},
+            ]
+        for params in filters:
+            # Функция сортирует только по заказу, порядок позиций внутри
+            # заказа не задан.
+            yield (
+                f"orders_report {params or 'без фильтров'}",
+                lambda params=params: db_reports.get_orders_report(engine='orm', **params),
+                lambda params=params: reference.orders_report(**params),
+                lambda row: row['order_id'],
+            )
+
+        yield (
+            'sales_by_category',
+            lambda: db_reports.get_sales_by_category(engine='orm'),
+            reference.sales_by_category,
+            lambda row: -row['total_sales'],
+        )
+        yield 'sales_by_month', lambda: db_reports.get_sales_by_month(engine='orm'), reference.sales_by_month, None
+
+    @staticmethod
+    def _compare(actual, expected, order_key):
+        """
+        Строки должны совпасть по колонкам, их порядку, типам и значениям.
+        Если order_key задан, порядок проверяется только по нему, а строки
+        с равным ключом сравниваются без учёта порядка.
+        """
+        if len(actual) != len(expected):
+            return f"строк {len(actual)}, ожидалось {len(expected)}"
+
+        def key(row):
+            return [(column, type(value).__name__, value) for column, value in row.items()]
+
+        def canonical(row):
+            return repr([
+                (column, type(value).__name__, str(value.normalize()) if isinstance(value, Decimal) else value)
+                for column, value in row.items()
+            ])
+
+        if order_key is not None:
+            keys = [order_key(row) for row in actual]
+            if keys != sorted(keys):
+                return "строки идут не в том порядке"
+            actual = sorted(actual, key=lambda row: (order_key(row), canonical(row)))
+            expected = sorted(expected, key=lambda row: (order_key(row), canonical(row)))
+        for index, (got, want) in enumerate(zip(actual, expected)):
+            if key(got) != key(want):
+                return f"строка {index}: {got!r}, ожидалось {want!r}"
+        return None
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from petshop import sales_rollup
+
+
+class Command(BaseCommand):
+    help = "Пересобирает сводку продаж (SalesRollup) по всем заказам; нужен для первичного заполнения и после правок заказов в обход приложения"
+
+    def handle(self, *args, **options):
+        created = sales_rollup.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Сводка продаж пересобрана, корзин: {created}"))
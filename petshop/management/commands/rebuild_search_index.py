@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from petshop import search
+
+
+class Command(BaseCommand):
+    help = "Перестраивает поисковый индекс товаров"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = search.rebuild_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Поисковый индекс перестроен: {total} термов за {time.perf_counter() - started:.2f} с"
+        ))
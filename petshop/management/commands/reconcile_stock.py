@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from petshop import stock_totals
+
+
+class Command(BaseCommand):
+    help = "Сверяет Product.stock с суммой остатков по пунктам выдачи и исправляет расхождения"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=stock_totals.DEFAULT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Только показать расхождения, ничего не менять")
+
+    def handle(self, *args, **options):
+        fixed = stock_totals.reconcile(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        for product_id, stock, actual in fixed[:20]:
+            self.stdout.write(f"Товар #{product_id}: {stock} -> {actual}")
+        if len(fixed) > 20:
+            self.stdout.write(f"... и ещё {len(fixed) - 20}")
+
+        if not fixed:
+            self.stdout.write(self.style.SUCCESS("Расхождений нет"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Найдено расхождений: {len(fixed)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Исправлено товаров: {len(fixed)}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from petshop import reservations
+
+
+class Command(BaseCommand):
+    help = "Снимает истёкшие резервы товаров в корзинах"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=reservations.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        released = reservations.release_expired(batch_size=options['batch_size'])
+        self.stdout.write(f"Снято резервов: {released}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from petshop import report_jobs
+
+
+class Command(BaseCommand):
+    help = "Строит отчёты из очереди (ReportJob) в пуле процессов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help="Процессов в пуле; по умолчанию REPORT_JOB_CONCURRENCY")
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно, опрашивая очередь")
+        parser.add_argument('--interval', type=float, default=1.0, help="Пауза между опросами очереди, с")
+
+    def handle(self, *args, **options):
+        processed = report_jobs.run_pending(options['concurrency'], loop=options['loop'], interval=options['interval'])
+        if processed:
+            self.stdout.write(f"Построено отчётов: {processed}")
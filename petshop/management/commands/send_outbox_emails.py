@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from petshop import outbox
+
+
+class Command(BaseCommand):
+    help = "Отправляет письма из очереди (OutboxEmail)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.DEFAULT_BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=outbox.DEFAULT_MAX_ATTEMPTS)
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно, опрашивая очередь")
+        parser.add_argument('--interval', type=float, default=5.0, help="Пауза между опросами в режиме --loop, с")
+
+    def handle(self, *args, **options):
+        while True:
+            total_sent = total_failed = 0
+            while True:
+                sent, failed = outbox.send_pending(options['batch_size'], options['max_attempts'])
+                total_sent += sent
+                total_failed += failed
+                if sent + failed < options['batch_size']:
+                    break
+
+            if total_sent or total_failed or not options['loop']:
+                self.stdout.write(f"Отправлено писем: {total_sent}, ошибок: {total_failed}")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:56
+
+import re
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Копия токенизатора petshop.search на момент миграции: миграция должна
+# строить тот же индекс, как бы ни менялся код приложения.
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+MIN_STEM_LENGTH = 3
+MAX_TERM_LENGTH = 64
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'иях', 'ией', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ях', 'ах', 'ов', 'ев', 'ей', 'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие',
+    'ым', 'им', 'ом', 'ем', 'ых', 'их', 'ую', 'юю', 'ам', 'ям', 'ию', 'ья', 'ье', 'ьи', 'ью',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+
+
+def stem(word):
+    if word.isdigit():
+        return word
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [stem(word.lower().replace('ё', 'е'))[:MAX_TERM_LENGTH] for word in WORD_RE.findall(text)]
+
+
+def product_terms(product):
+    weights = Counter()
+    for term in tokenize(product.name):
+        weights[term] += NAME_WEIGHT
+    for term in tokenize(product.description):
+        weights[term] += DESCRIPTION_WEIGHT
+    return weights
+
+
+def build_search_index(apps, schema_editor):
+    Product = apps.get_model('petshop', 'Product')
+    ProductSearchToken = apps.get_model('petshop', 'ProductSearchToken')
+    tokens = [
+        ProductSearchToken(term=term, product_id=product.id, weight=weight)
+        for product in Product.objects.only('id', 'name', 'description').iterator()
+        for term, weight in product_terms(product).items()
+    ]
+    ProductSearchToken.objects.bulk_create(tokens, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0012_alter_userprofile_date_format'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Терм')),
+                ('weight', models.PositiveIntegerField(default=1, verbose_name='Вес')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='petshop.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Терм поискового индекса',
+                'verbose_name_plural': 'Поисковый индекс товаров',
+                'unique_together': {('term', 'product')},
+            },
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
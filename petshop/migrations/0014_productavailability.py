@@ -0,0 +1,40 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_availability(apps, schema_editor):
+    ProductStock = apps.get_model('petshop', 'ProductStock')
+    ProductAvailability = apps.get_model('petshop', 'ProductAvailability')
+    ProductAvailability.objects.bulk_create([
+        ProductAvailability(product_id=product_id, pickup_point_id=pickup_point_id)
+        for product_id, pickup_point_id in ProductStock.objects
+        .filter(quantity__gt=0, product__is_active=True)
+        .values_list('product_id', 'pickup_point_id')
+        .distinct()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0013_productsearchtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pickup_point', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='available_products', to='petshop.pickuppoint', verbose_name='Пункт выдачи')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='petshop.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Наличие товара на пункте выдачи',
+                'verbose_name_plural': 'Наличие товаров на пунктах выдачи',
+                'unique_together': {('pickup_point', 'product')},
+            },
+        ),
+        migrations.RunPython(fill_availability, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0014_productavailability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to_email', models.EmailField(max_length=254, verbose_name='Получатель')),
+                ('from_email', models.CharField(blank=True, max_length=254, null=True, verbose_name='Отправитель')),
+                ('subject', models.CharField(max_length=255, verbose_name='Тема')),
+                ('template', models.CharField(default='shablons/email.html', max_length=100, verbose_name='Шаблон')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='Последняя ошибка')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='emails', to='petshop.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Письмо в очереди',
+                'verbose_name_plural': 'Очередь писем',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='petshop_out_status_ce0b2b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0016_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Действует до')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('pickup_point', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='petshop.pickuppoint', verbose_name='Пункт выдачи')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='petshop.product', verbose_name='Товар')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Резерв товара',
+                'verbose_name_plural': 'Резервы товаров',
+                'indexes': [models.Index(fields=['product', 'pickup_point', 'expires_at'], name='petshop_sto_product_d51db7_idx')],
+                'unique_together': {('user', 'product', 'pickup_point')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:10
+
+from django.db import migrations, models
+from django.db.models import IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_stock_totals(apps, schema_editor):
+    Product = apps.get_model('petshop', 'Product')
+    ProductStock = apps.get_model('petshop', 'ProductStock')
+    total = (
+        ProductStock.objects
+        .filter(product_id=OuterRef('pk'))
+        .values('product_id')
+        .annotate(total=Sum('quantity'))
+        .values('total')[:1]
+    )
+    Product.objects.update(stock=Coalesce(Subquery(total, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0017_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='stock',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Остаток'),
+        ),
+        migrations.RunPython(fill_stock_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0018_product_stock_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('brand_key', models.IntegerField(default=0, verbose_name='ID бренда')),
+                ('status', models.CharField(max_length=20, verbose_name='Статус заказа')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Продано, шт.')),
+                ('lines', models.IntegerField(default=0, verbose_name='Позиций заказов')),
+                ('total_sales', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма продаж')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='petshop.category', verbose_name='Категория')),
+                ('pickup_point', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='petshop.pickuppoint', verbose_name='Пункт выдачи')),
+            ],
+            options={
+                'verbose_name': 'Сводка продаж',
+                'verbose_name_plural': 'Сводки продаж',
+                'constraints': [models.UniqueConstraint(fields=('day', 'pickup_point', 'category', 'brand_key', 'status'), name='unique_sales_rollup_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:23
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0019_salesrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('orders_report', 'Отчёт по заказам'), ('admin_statement', 'Ведомость')], max_length=20, verbose_name='Отчёт')),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('json', 'JSON')], default='csv', max_length=10, verbose_name='Формат')),
+                ('params', models.JSONField(default=dict, verbose_name='Параметры')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готов'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('result', models.FileField(blank=True, upload_to='reports/', verbose_name='Файл результата')),
+                ('rows_count', models.PositiveIntegerField(blank=True, null=True, verbose_name='Строк')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Запущено')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задание на отчёт',
+                'verbose_name_plural': 'Задания на отчёты',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='petshop_rep_status_b87cfc_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:37
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_stocks(apps, schema_editor):
+    # Остатки товара на одном пункте выдачи, заведённые несколькими
+    # строками, складываются в строку с меньшим id.
+    ProductStock = apps.get_model('petshop', 'ProductStock')
+    duplicates = (
+        ProductStock.objects.values('product_id', 'pickup_point_id')
+        .annotate(rows=Count('id'), keep_id=Min('id'), total=Sum('quantity'))
+        .filter(rows__gt=1)
+    )
+    for row in duplicates:
+        same = ProductStock.objects.filter(product_id=row['product_id'], pickup_point_id=row['pickup_point_id'])
+        same.exclude(id=row['keep_id']).delete()
+        same.filter(id=row['keep_id']).update(quantity=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0020_reportjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_stocks, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productstock',
+            constraint=models.UniqueConstraint(fields=('product', 'pickup_point'), name='unique_product_stock'),
+        ),
+    ]
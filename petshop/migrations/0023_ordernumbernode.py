@@ -0,0 +1,31 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:41
+
+from django.db import migrations, models
+
+
+def create_nodes(apps, schema_editor):
+    OrderNumberNode = apps.get_model('petshop', 'OrderNumberNode')
+    OrderNumberNode.objects.bulk_create([OrderNumberNode(node_id=node_id) for node_id in range(1024)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0022_alter_outboxemail_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberNode',
+            fields=[
+                ('node_id', models.PositiveSmallIntegerField(primary_key=True, serialize=False, verbose_name='Номер узла')),
+                ('owner', models.CharField(blank=True, max_length=100, verbose_name='Процесс')),
+                ('expires_ms', models.BigIntegerField(default=0, verbose_name='Аренда до, мс от начала эпохи генератора')),
+            ],
+            options={
+                'verbose_name': 'Номер узла генератора заказов',
+                'verbose_name_plural': 'Номера узлов генератора заказов',
+            },
+        ),
+        migrations.RunPython(create_nodes, migrations.RunPython.noop),
+    ]
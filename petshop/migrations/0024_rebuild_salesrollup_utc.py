@@ -0,0 +1,49 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:44
+
+from datetime import timezone as dt_timezone
+
+from django.db import migrations
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+# Сводка заполняется заново с днями по UTC, как в petshop.db_reports.
+# Код — копия petshop.sales_rollup на момент миграции.
+def rebuild_rollup(apps, schema_editor):
+    SalesRollup = apps.get_model('petshop', 'SalesRollup')
+    OrderItem = apps.get_model('petshop', 'OrderItem')
+    line_total = ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    rows = (
+        OrderItem.objects
+        .values(
+            day=TruncDate('order__date_created', tzinfo=dt_timezone.utc),
+            point=F('order__pickup_point_id'),
+            category=F('product__category_id'),
+            brand=Coalesce('product__brand_id', Value(0)),
+            order_status=F('order__status'),
+        )
+        .annotate(sold=Sum('quantity'), line_count=Count('id'), sales=Sum(line_total))
+        .order_by()
+    )
+    SalesRollup.objects.all().delete()
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(SalesRollup(
+            day=row['day'], pickup_point_id=row['point'], category_id=row['category'], brand_key=row['brand'],
+            status=row['order_status'], quantity=row['sold'], lines=row['line_count'], total_sales=row['sales'],
+        ))
+        if len(batch) >= 1000:
+            SalesRollup.objects.bulk_create(batch)
+            batch = []
+    SalesRollup.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0023_ordernumbernode'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+def create_lock(apps, schema_editor):
+    apps.get_model('petshop', 'ReportJobLock').objects.create(name='claim')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0024_rebuild_salesrollup_utc'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJobLock',
+            fields=[
+                ('name', models.CharField(max_length=20, primary_key=True, serialize=False, verbose_name='Название')),
+            ],
+            options={
+                'verbose_name': 'Блокировка очереди отчётов',
+                'verbose_name_plural': 'Блокировки очереди отчётов',
+            },
+        ),
+        migrations.RunPython(create_lock, migrations.RunPython.noop),
+    ]
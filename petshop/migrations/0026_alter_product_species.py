@@ -0,0 +1,19 @@
+# Generated by Django 5.2.2 on 2026-10-18 09:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0025_reportjoblock'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='species',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='petshop.species', verbose_name='Вид'),
+        ),
+    ]
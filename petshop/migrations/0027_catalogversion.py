@@ -0,0 +1,33 @@
+# Generated by Django 5.2.2 on 2026-10-18 09:03
+
+import time
+
+from django.db import migrations, models
+
+
+def create_version(apps, schema_editor):
+    # Начальная версия — текущее время: она больше всех версий, выданных
+    # раньше из кеша.
+    apps.get_model('petshop', 'CatalogVersion').objects.create(name='catalog', version=time.time_ns() // 1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petshop', '0026_alter_product_species'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('name', models.CharField(max_length=20, primary_key=True, serialize=False, verbose_name='Название')),
+                ('version', models.BigIntegerField(verbose_name='Версия, мкс')),
+            ],
+            options={
+                'verbose_name': 'Версия каталога',
+                'verbose_name_plural': 'Версии каталога',
+            },
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
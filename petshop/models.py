@@ -3,6 +3,7 @@ from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
 from django.utils import timezone
+import uuid
 
 class Role(models.Model):
     name = models.CharField("Название роли", max_length=50, unique=True)
@@ -137,7 +138,9 @@ class Product(models.Model):
     name = models.CharField("Название товара", max_length=100)
     description = models.TextField("Описание", blank=True, null=True)
     price = models.DecimalField("Цена", max_digits=10, decimal_places=2)
-    stock = models.IntegerField("Остаток", default=0)
+    # Сумма ProductStock.quantity по всем пунктам выдачи; ведётся сигналами
+    # и заказами (petshop.stock_totals), вручную не редактируется.
+    stock = models.IntegerField("Остаток", default=0, editable=False)
     image = models.ImageField("Изображение", max_length=255, blank=True, null=True)
     is_active = models.BooleanField("Активен", default=True)
     purposes = models.ManyToManyField(Purpose, through='ProductPurpose', related_name='products')
@@ -165,7 +168,7 @@ class Cart(models.Model):
         return self.product.price * self.quantity
     
     def get_stock(self):
-        return sum(stock.quantity for stock in self.product.stocks.all())
+        return self.product.stock
 
 class PickupPoint(models.Model):
     address = models.CharField("Адрес", max_length=255)
@@ -188,6 +191,45 @@ class ProductStock(models.Model):
     class Meta:
         verbose_name = "Остаток на пункте выдачи"
         verbose_name_plural = "Остатки на пунктах выдачи"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'pickup_point'], name='unique_product_stock'),
+        ]
+
+
+class StockReservation(models.Model):
+    user = models.ForeignKey(User, verbose_name="Пользователь", on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, verbose_name="Товар", on_delete=models.CASCADE, related_name='reservations')
+    pickup_point = models.ForeignKey(PickupPoint, verbose_name="Пункт выдачи", on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField("Количество")
+    expires_at = models.DateTimeField("Действует до", db_index=True)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Резерв товара"
+        verbose_name_plural = "Резервы товаров"
+        unique_together = ('user', 'product', 'pickup_point')
+        indexes = [models.Index(fields=['product', 'pickup_point', 'expires_at'])]
+
+
+class ProductAvailability(models.Model):
+    product = models.ForeignKey(Product, verbose_name="Товар", on_delete=models.CASCADE, related_name='availability')
+    pickup_point = models.ForeignKey(PickupPoint, verbose_name="Пункт выдачи", on_delete=models.CASCADE, related_name='available_products')
+
+    class Meta:
+        verbose_name = "Наличие товара на пункте выдачи"
+        verbose_name_plural = "Наличие товаров на пунктах выдачи"
+        unique_together = ('pickup_point', 'product')
+
+
+class ProductSearchToken(models.Model):
+    term = models.CharField("Терм", max_length=64)
+    product = models.ForeignKey(Product, verbose_name="Товар", on_delete=models.CASCADE, related_name='search_tokens')
+    weight = models.PositiveIntegerField("Вес", default=1)
+
+    class Meta:
+        verbose_name = "Терм поискового индекса"
+        verbose_name_plural = "Поисковый индекс товаров"
+        unique_together = ('term', 'product')
 
 
 class Order(models.Model):
@@ -209,10 +251,26 @@ class Order(models.Model):
     last_name = models.CharField("Фамилия", max_length=50)
     email = models.EmailField("Email")
     phone = models.CharField("Телефон", max_length=20, blank=True, null=True)
+    idempotency_key = models.CharField("Ключ идемпотентности", max_length=64, blank=True, null=True)
 
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_order_idempotency_key'),
+        ]
+
+class OrderNumberNode(models.Model):
+    # Номера узлов генератора номеров заказов (petshop/order_numbers.py),
+    # которые процессы берут в аренду; строки 0–1023 создаёт миграция.
+    node_id = models.PositiveSmallIntegerField("Номер узла", primary_key=True)
+    owner = models.CharField("Процесс", max_length=100, blank=True)
+    expires_ms = models.BigIntegerField("Аренда до, мс от начала эпохи генератора", default=0)
+
+    class Meta:
+        verbose_name = "Номер узла генератора заказов"
+        verbose_name_plural = "Номера узлов генератора заказов"
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -221,6 +279,53 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
 
+class SalesRollup(models.Model):
+    # Продажи за день в разрезе пункта выдачи, категории, бренда и статуса
+    # заказа; ведётся в petshop/sales_rollup.py. Бренд хранится числом
+    # (0 — без бренда), чтобы ключ корзины был уникален и без NULL.
+    day = models.DateField("День")
+    pickup_point = models.ForeignKey(PickupPoint, verbose_name="Пункт выдачи", on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, verbose_name="Категория", on_delete=models.CASCADE, related_name='+')
+    brand_key = models.IntegerField("ID бренда", default=0)
+    status = models.CharField("Статус заказа", max_length=20)
+    quantity = models.IntegerField("Продано, шт.", default=0)
+    lines = models.IntegerField("Позиций заказов", default=0)
+    total_sales = models.DecimalField("Сумма продаж", max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Сводка продаж"
+        verbose_name_plural = "Сводки продаж"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'pickup_point', 'category', 'brand_key', 'status'], name='unique_sales_rollup_bucket'),
+        ]
+
+
+class OutboxEmail(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает отправки'),
+        ('sending', 'Отправляется'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    ]
+
+    order = models.ForeignKey(Order, verbose_name="Заказ", on_delete=models.CASCADE, related_name='emails')
+    to_email = models.EmailField("Получатель")
+    from_email = models.CharField("Отправитель", max_length=254, blank=True, null=True)
+    subject = models.CharField("Тема", max_length=255)
+    template = models.CharField("Шаблон", max_length=100, default='shablons/email.html')
+    status = models.CharField("Статус", max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField("Попыток", default=0)
+    last_error = models.TextField("Последняя ошибка", blank=True, null=True)
+    next_attempt_at = models.DateTimeField("Следующая попытка", default=timezone.now)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    sent_at = models.DateTimeField("Отправлено", blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Письмо в очереди"
+        verbose_name_plural = "Очередь писем"
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
@@ -264,6 +369,62 @@ class OrdersByMonth(models.Model):
         db_table = 'petshop_orders_by_month'
 
 
+class ReportJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готов'),
+        ('failed', 'Ошибка'),
+    ]
+    KIND_CHOICES = [
+        ('orders_report', 'Отчёт по заказам'),
+        ('admin_statement', 'Ведомость'),
+    ]
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('json', 'JSON'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, verbose_name="Пользователь", on_delete=models.CASCADE, related_name='report_jobs')
+    kind = models.CharField("Отчёт", max_length=20, choices=KIND_CHOICES)
+    format = models.CharField("Формат", max_length=10, choices=FORMAT_CHOICES, default='csv')
+    params = models.JSONField("Параметры", default=dict)
+    status = models.CharField("Статус", max_length=10, choices=STATUS_CHOICES, default='pending')
+    result = models.FileField("Файл результата", upload_to='reports/', blank=True)
+    rows_count = models.PositiveIntegerField("Строк", blank=True, null=True)
+    error = models.TextField("Ошибка", blank=True, null=True)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    started_at = models.DateTimeField("Запущено", blank=True, null=True)
+    finished_at = models.DateTimeField("Завершено", blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Задание на отчёт"
+        verbose_name_plural = "Задания на отчёты"
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+
+
+class CatalogVersion(models.Model):
+    # Версия каталога для ETag и кеша ответов (petshop/catalog_version.py);
+    # единственную строку создаёт миграция.
+    name = models.CharField("Название", max_length=20, primary_key=True)
+    version = models.BigIntegerField("Версия, мкс")
+
+    class Meta:
+        verbose_name = "Версия каталога"
+        verbose_name_plural = "Версии каталога"
+
+class ReportJobLock(models.Model):
+    # Единственная строка (её создаёт миграция): воркеры отчётов
+    # блокируют её, чтобы по очереди проверять лимит и забирать задания.
+    name = models.CharField("Название", max_length=20, primary_key=True)
+
+    class Meta:
+        verbose_name = "Блокировка очереди отчётов"
+        verbose_name_plural = "Блокировки очереди отчётов"
+
+
 class AuditLog(models.Model):
     ACTION_CHOICES = [
         ('CREATE', 'Создание'),
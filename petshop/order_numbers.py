@@ -0,0 +1,226 @@
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import OrderNumberNode
+
+
+# Номер заказа — 63-битное число, записанное 19 цифрами с ведущими нулями:
+# миллисекунды от EPOCH (41 бит), номер узла (10 бит) и счётчик внутри
+# миллисекунды (12 бит). Номера одного узла строго возрастают, а разные
+# узлы не пересекаются, поэтому уникальность не зависит от случайности,
+# а новые строки попадают в конец уникального индекса.
+#
+# Номер узла каждый процесс берёт в аренду в таблице OrderNumberNode (или
+# он задан в ORDER_NUMBER_NODE_ID), так что два живых процесса не могут
+# получить один номер. Номер завершившегося процесса освобождается, когда
+# истекает аренда: при выходе из процесса соединения с базой может уже не быть.
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+WIDTH = 19
+# Сколько свободных номеров узла пробовать при одной попытке аренды.
+LEASE_CANDIDATES = 32
+
+_EPOCH_MS = int(EPOCH.timestamp() * 1000)
+
+
+class OrderNumberError(RuntimeError):
+    pass
+
+
+def _now_ms():
+    return time.time_ns() // 1_000_000 - _EPOCH_MS
+
+
+def _transaction_state():
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return None
+    return connection.atomic_blocks[0], tuple(connection.savepoint_ids)
+
+
+def _still_in(state):
+    """Идёт та же транзакция, и точки сохранения state не откатывались."""
+    current = _transaction_state()
+    if current is None or current[0] is not state[0]:
+        return False
+    return current[1][:len(state[1])] == state[1]
+
+
+class NodeLease:
+    """
+    Аренда номера узла в OrderNumberNode на ttl_ms. Свободный номер
+    (аренда истекла) забирается условным UPDATE, поэтому его получает
+    только один процесс; с половины срока аренда продлевается при выдаче
+    очередного номера. Запросы идут в текущей транзакции: аренда
+    считается полученной, только когда транзакция зафиксирована, а до
+    тех пор строка узла заблокирована для других процессов. Если
+    транзакция откатилась, номера, выданные под аренду, тоже не
+    сохранились, и при следующем вызове аренда берётся заново.
+    """
+
+    def __init__(self, ttl_ms):
+        self.ttl_ms = ttl_ms
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:100]
+        self.node_id = None
+        self._renew_at = None
+        self._pending = None
+        self._token = 0
+
+    def get(self):
+        now = _now_ms()
+        if self.node_id is not None:
+            if self._renew_at is not None and now < self._renew_at:
+                return self.node_id
+            if self._pending is not None and _still_in(self._pending):
+                # Аренда взята в ещё не завершённой транзакции, и её
+                # точка сохранения не откатывалась.
+                return self.node_id
+
+        node_id = self._renew(now) if self.node_id is not None else None
+        if node_id is None:
+            node_id = self._acquire(now)
+        self.node_id = node_id
+        self._renew_at = None
+        self._pending = _transaction_state()
+        self._token += 1
+        token = self._token
+        transaction.on_commit(lambda: self._confirm(token, now))
+        return node_id
+
+    def _confirm(self, token, leased_at):
+        if token == self._token:
+            self._renew_at = leased_at + self.ttl_ms // 2
+            self._pending = None
+
+    def _renew(self, now):
+        renewed = OrderNumberNode.objects.filter(node_id=self.node_id, owner=self.owner).update(expires_ms=now + self.ttl_ms)
+        return self.node_id if renewed else None
+
+    def _acquire(self, now):
+        candidates = list(
+            OrderNumberNode.objects.filter(expires_ms__lt=now)
+            .order_by('expires_ms').values_list('node_id', flat=True)[:LEASE_CANDIDATES]
+        )
+        random.shuffle(candidates)
+        for node_id in candidates:
+            taken = OrderNumberNode.objects.filter(node_id=node_id, expires_ms__lt=now).update(
+                owner=self.owner, expires_ms=now + self.ttl_ms,
+            )
+            if taken:
+                return node_id
+        raise OrderNumberError("Нет свободных номеров узла для генератора номеров заказов")
+
+    def release(self):
+        if self.node_id is not None:
+            OrderNumberNode.objects.filter(node_id=self.node_id, owner=self.owner).update(expires_ms=0)
+            self.node_id = None
+
+
+class OrderNumberGenerator:
+    """Генератор с заданным номером узла или, без node_id, с арендованным."""
+
+    def __init__(self, node_id=None, clock=_now_ms, lease_ttl=600):
+        if node_id is not None and not 0 <= node_id <= MAX_NODE:
+            raise ValueError(f"Номер узла должен быть от 0 до {MAX_NODE}")
+        self._configured_node = node_id
+        self._clock = clock
+        self._lease_ttl_ms = lease_ttl * 1000
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self.node_id = self._configured_node
+        self.lease = NodeLease(self._lease_ttl_ms) if self._configured_node is None else None
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_value(self):
+        with self._lock:
+            if os.getpid() != self._pid:
+                # После fork дочерний процесс получает свой номер узла.
+                self._reset()
+            if self.lease is not None:
+                self.node_id = self.lease.get()
+
+            now = self._clock()
+            if now < self._last_ms:
+                # Часы ушли назад: продолжаем от последней выданной
+                # миллисекунды, чтобы номера не повторились.
+                now = self._last_ms
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Счётчик миллисекунды исчерпан: занимаем следующую,
+                    # не дожидаясь часов.
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now
+
+            return (now << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+
+    def next_number(self):
+        return format_number(self.next_value())
+
+    def drop_node(self):
+        """Отказывается от арендованного номера узла: следующий номер будет выдан под новым."""
+        with self._lock:
+            if self.lease is not None:
+                self.lease.node_id = None
+
+
+def format_number(value):
+    return f"{value:0{WIDTH}d}"
+
+
+def parse_number(number):
+    """(время выдачи, номер узла, счётчик) по номеру заказа."""
+    value = int(number)
+    ms = value >> (NODE_BITS + SEQUENCE_BITS)
+    node_id = (value >> SEQUENCE_BITS) & MAX_NODE
+    sequence = value & MAX_SEQUENCE
+    return datetime.fromtimestamp((ms + _EPOCH_MS) / 1000, tz=timezone.utc), node_id, sequence
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                node_id = getattr(settings, 'ORDER_NUMBER_NODE_ID', None)
+                _generator = OrderNumberGenerator(
+                    int(node_id) if node_id not in (None, '') else None,
+                    lease_ttl=getattr(settings, 'ORDER_NUMBER_NODE_LEASE', 600),
+                )
+    return _generator
+
+
+def next_number():
+    return get_generator().next_number()
+
+
+def _after_fork_in_child():
+    # Блокировка могла быть захвачена другим потоком родителя в момент fork.
+    if _generator is not None:
+        _generator._lock = threading.Lock()
+        _generator._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,167 @@
+import logging
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, F, FilteredRelation, IntegerField, Q, Value, When
+
+from . import order_numbers, reservations, sales_rollup, stock_totals
+from .models import Cart, Order, OrderItem, ProductStock, StockReservation
+from .signals import stock_changed
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз пробовать новый номер, если сгенерированный уже занят.
+ORDER_NUMBER_ATTEMPTS = 3
+
+
+class OrderError(ValueError):
+    pass
+
+
+class ProductUnavailable(OrderError):
+    def __init__(self, product_name):
+        self.product_name = product_name
+        super().__init__(f"Товар '{product_name}' отсутствует на выбранном пункте выдачи")
+
+
+class InsufficientStock(OrderError):
+    def __init__(self, product_name, available):
+        self.product_name = product_name
+        self.available = available
+        super().__init__(f"Недостаточно товара '{product_name}' на пункте выдачи")
+
+
+def _set_audit_user(user):
+    # Триггеры аудита (log_insert/log_update/log_delete в базе) пишут в
+    # журнал пользователя из myapp.current_user_id; set_config(..., true)
+    # действует до конца текущей транзакции.
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('myapp.current_user_id', %s, true)", [str(user.pk)])
+
+
+def load_cart(user, pickup_point):
+    """
+    Корзина вместе с товарами и остатком на выбранном пункте выдачи —
+    одним запросом с LEFT JOIN на ProductStock.
+    """
+    return list(
+        Cart.objects
+        .filter(user=user)
+        .annotate(point_stock=FilteredRelation('product__stocks', condition=Q(product__stocks__pickup_point=pickup_point)))
+        .values(
+            'id', 'quantity', 'product_id',
+            product_name=F('product__name'),
+            product_price=F('product__price'),
+            stock_id=F('point_stock__id'),
+            stock_quantity=F('point_stock__quantity'),
+        )
+        .order_by('id')
+    )
+
+
+def lock_stocks(stock_ids):
+    """
+    Блокирует строки остатков в порядке id, поэтому параллельные заказы
+    с пересекающимися товарами ждут друг друга, а не попадают во
+    взаимную блокировку. Возвращает остатки на момент блокировки: {id: количество}.
+    """
+    return dict(ProductStock.objects.select_for_update().filter(id__in=stock_ids).order_by('id').values_list('id', 'quantity'))
+
+
+def decrement_stocks(requested, reserved=None):
+    """
+    Списывает остатки одним условным UPDATE: каждая строка уменьшается на
+    свою величину и только если остатка хватает (с учётом чужих резервов
+    reserved). Возвращает число изменённых строк; если оно меньше числа
+    позиций, заказ нужно отменить.
+    """
+    reserved = reserved or {}
+    enough = Q()
+    for stock_id, quantity in requested.items():
+        enough |= Q(id=stock_id, quantity__gte=quantity + reserved.get(stock_id, 0))
+    return ProductStock.objects.filter(enough).update(
+        quantity=F('quantity') - Case(
+            *[When(id=stock_id, then=Value(quantity)) for stock_id, quantity in requested.items()],
+            output_field=IntegerField(),
+        )
+    )
+
+
+def create_order(order_number=None, **fields):
+    """
+    Создаёт заказ с номером order_number или номером из генератора. Если
+    сгенерированный номер уже занят, узел генератора берётся заново и
+    выдаётся следующий номер; нарушение других ограничений (повтор
+    Idempotency-Key) пробрасывается вызывающему.
+    """
+    for attempt in range(1, ORDER_NUMBER_ATTEMPTS + 1):
+        number = order_number or order_numbers.next_number()
+        try:
+            with transaction.atomic():
+                return Order.objects.create(order_number=number, **fields)
+        except IntegrityError:
+            if order_number or attempt == ORDER_NUMBER_ATTEMPTS or not Order.objects.filter(order_number=number).exists():
+                raise
+            logger.warning("Номер заказа %s уже занят, номер узла генератора будет получен заново", number)
+            order_numbers.get_generator().drop_node()
+
+
+def place_order(user, pickup_point, first_name, last_name, email, phone, order_number=None, idempotency_key=None):
+    """
+    Оформляет заказ из корзины пользователя. Число запросов не зависит
+    от количества позиций в корзине.
+    """
+    with transaction.atomic():
+        _set_audit_user(user)
+
+        lines = load_cart(user, pickup_point)
+        if not lines:
+            raise OrderError("Корзина пуста")
+
+        requested = {}
+        for line in lines:
+            if line['stock_id'] is None:
+                raise ProductUnavailable(line['product_name'])
+            requested[line['stock_id']] = requested.get(line['stock_id'], 0) + line['quantity']
+
+        locked = lock_stocks(list(requested))
+        reserved = reservations.held_by_others(user, list(requested)) if reservations.is_enabled() else {}
+        if decrement_stocks(requested, reserved) != len(requested):
+            # UPDATE уже списал строки, где остатка хватило, поэтому
+            # доступное количество берётся из остатков до списания.
+            available = {stock_id: quantity - reserved.get(stock_id, 0) for stock_id, quantity in locked.items()}
+            for line in lines:
+                if available[line['stock_id']] < requested[line['stock_id']]:
+                    raise InsufficientStock(line['product_name'], max(available[line['stock_id']], 0))
+            raise OrderError("Не удалось списать остатки, попробуйте оформить заказ ещё раз")
+
+        order = create_order(
+            order_number,
+            user=user,
+            first_name=first_name,
+            last_name=last_name,
+            email=email,
+            phone=phone,
+            pickup_point=pickup_point,
+            total_price=sum(line['product_price'] * line['quantity'] for line in lines),
+            status='В обработке',
+            idempotency_key=idempotency_key,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=line['product_id'], quantity=line['quantity'], price=line['product_price'])
+            for line in lines
+        ])
+        Cart.objects.filter(id__in=[line['id'] for line in lines]).delete()
+        sales_rollup.add_orders([order.pk])
+
+        sold = {}
+        for line in lines:
+            sold[line['product_id']] = sold.get(line['product_id'], 0) - line['quantity']
+        stock_totals.apply_deltas(sold)
+        if reservations.is_enabled():
+            StockReservation.objects.filter(user=user, product_id__in={line['product_id'] for line in lines}).delete()
+
+        stock_changed.send(sender=Order, product_ids={line['product_id'] for line in lines})
+
+    return order
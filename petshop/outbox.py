@@ -0,0 +1,133 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_ATTEMPTS = 5
+TEXT_BODY = "Ваш email клиент не поддерживает HTML"
+
+
+def enqueue_order_email(order, subject, from_email=None):
+    """
+    Ставит письмо о заказе в очередь. Вызывается в той же транзакции, что
+    и создание заказа: письмо появится в очереди только вместе с заказом.
+    """
+    return OutboxEmail.objects.create(order=order, to_email=order.email, subject=subject, from_email=from_email)
+
+
+def retry_delay(attempts):
+    return timedelta(minutes=min(2 ** attempts, 60))
+
+
+def _build_message(entry, connection):
+    html_content = render_to_string(entry.template, {'order': entry.order})
+    message = EmailMultiAlternatives(
+        subject=entry.subject,
+        body=TEXT_BODY,
+        from_email=entry.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=[entry.to_email],
+        connection=connection,
+    )
+    message.attach_alternative(html_content, "text/html")
+    return message
+
+
+def sending_lease(batch_size):
+    """
+    Сколько письмо остаётся за воркером, который его взял: вся пачка
+    должна успеть уйти даже при таймауте SMTP на каждом письме. Письма
+    воркера, упавшего раньше, после этого срока возьмёт другой воркер.
+    """
+    return timedelta(seconds=(getattr(settings, 'EMAIL_TIMEOUT', None) or 60) * (batch_size + 1))
+
+
+def claim(batch_size=DEFAULT_BATCH_SIZE, max_attempts=DEFAULT_MAX_ATTEMPTS, now=None):
+    """
+    Забирает пачку писем: в короткой транзакции переводит их в sending до
+    истечения аренды, засчитывает попытку и сразу фиксирует. Строки
+    выбираются с SKIP LOCKED, поэтому воркеры не возьмут одно письмо
+    одновременно. Письма с истёкшей арендой забираются снова.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        OutboxEmail.objects.filter(status='sending', next_attempt_at__lte=now, attempts__gte=max_attempts).update(
+            status='failed', last_error="Отправка не завершилась",
+        )
+        entries = list(
+            OutboxEmail.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(status__in=('pending', 'sending'), next_attempt_at__lte=now)
+            .select_related('order')
+            .order_by('id')[:batch_size]
+        )
+        OutboxEmail.objects.filter(id__in=[entry.id for entry in entries]).update(
+            status='sending', next_attempt_at=now + sending_lease(batch_size), attempts=F('attempts') + 1,
+        )
+    for entry in entries:
+        entry.attempts += 1
+    return entries
+
+
+def send_pending(batch_size=DEFAULT_BATCH_SIZE, max_attempts=DEFAULT_MAX_ATTEMPTS, now=None):
+    """
+    Отправляет одну пачку писем из очереди через одно SMTP-соединение.
+    Письма забираются claim, отправляются вне транзакции, а результат
+    каждого письма сохраняется сразу после отправки, поэтому сбой посреди
+    пачки не вернёт в очередь уже отправленные письма. Возвращает
+    (отправлено, ошибок).
+    """
+    now = now or timezone.now()
+    entries = claim(batch_size, max_attempts, now)
+    if not entries:
+        return 0, 0
+
+    try:
+        connection = get_connection()
+        connection.open()
+    except Exception as e:
+        logger.exception("Не удалось подключиться к почтовому серверу")
+        for entry in entries:
+            _mark_failed(entry, e, max_attempts, now)
+        return 0, len(entries)
+
+    sent = failed = 0
+    try:
+        for entry in entries:
+            try:
+                _build_message(entry, connection).send()
+            except Exception as e:
+                logger.warning("Не удалось отправить письмо #%s", entry.id, exc_info=True)
+                _mark_failed(entry, e, max_attempts, now)
+                failed += 1
+            else:
+                _mark_sent(entry)
+                sent += 1
+    finally:
+        connection.close()
+
+    return sent, failed
+
+
+def _mark_sent(entry):
+    OutboxEmail.objects.filter(id=entry.id, status='sending').update(
+        status='sent', sent_at=timezone.now(), last_error=None,
+    )
+
+
+def _mark_failed(entry, error, max_attempts, now):
+    OutboxEmail.objects.filter(id=entry.id, status='sending').update(
+        status='failed' if entry.attempts >= max_attempts else 'pending',
+        last_error=str(error),
+        next_attempt_at=now + retry_delay(entry.attempts),
+    )
@@ -0,0 +1,284 @@
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from . import db_reports, report_process, reports
+from .csv_export import iter_csv
+from .models import ReportJob, ReportJobLock
+
+
+logger = logging.getLogger(__name__)
+
+# Тяжёлые отчёты строятся не в HTTP-запросе, а воркером run_report_jobs:
+# задание ставится в очередь (ReportJob), воркер забирает не больше
+# REPORT_JOB_CONCURRENCY заданий сразу и строит каждый отчёт в отдельном
+# процессе, результат пишется в MEDIA_ROOT/reports/. Процесс отчёта
+# живёт не дольше REPORT_JOB_TIMEOUT с момента захвата задания.
+RESULT_DIR = 'reports'
+ACTIVE_STATUSES = ('pending', 'running')
+FILTER_PARAMS = ('product_id', 'category_id', 'brand_id', 'user_id')
+TIMEOUT_ERROR = "Превышено время построения отчёта"
+
+# Запас к REPORT_JOB_TIMEOUT, после которого fail_stale считает задание
+# брошенным: на разницу часов серверов с воркерами, с.
+STALE_GRACE = 60
+
+
+class ReportJobError(Exception):
+    pass
+
+
+def _optional_id(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ReportJobError(f"Некорректное значение {name}")
+
+
+def prepare_params(kind, params, python_format, format_label=None):
+    """
+    Проверяет параметры отчёта при постановке в очередь, чтобы ошибка
+    вернулась сразу, а не из воркера. Дата приходит в формате
+    пользователя, сохраняется в ISO.
+    """
+    report_type = params.get('type', 'day')
+    if report_type not in reports.REPORT_TYPES:
+        raise ReportJobError("Неверный тип отчета. Допустимые значения: day, week, month, filtered.")
+
+    target_date = None
+    if params.get('date'):
+        try:
+            target_date = datetime.strptime(str(params['date']), python_format).date()
+        except ValueError:
+            raise ReportJobError(f"Некорректный формат даты. Используйте формат: {format_label or python_format}")
+        if target_date > date.today():
+            raise ReportJobError(f"Дата не может быть в будущем. Сегодня: {date.today().strftime(python_format)}")
+    elif kind == 'admin_statement':
+        # Как в admin_statement: без даты — отчёт за сегодня.
+        target_date = date.today()
+
+    prepared = {
+        'type': report_type,
+        'date': target_date.isoformat() if target_date else None,
+        'date_format': python_format,
+    }
+    for name in FILTER_PARAMS:
+        prepared[name] = _optional_id(params, name)
+    return prepared
+
+
+def submit(user, kind, result_format, params):
+    """Ставит отчёт в очередь; params уже проверены prepare_params."""
+    if ReportJob.objects.filter(user=user, status__in=ACTIVE_STATUSES).count() >= settings.REPORT_JOB_MAX_ACTIVE_PER_USER:
+        raise ReportJobError(
+            f"Незавершённых заданий на отчёты уже {settings.REPORT_JOB_MAX_ACTIVE_PER_USER} — дождитесь их завершения"
+        )
+    return ReportJob.objects.create(user=user, kind=kind, format=result_format, params=params)
+
+
+def _target_date(params):
+    return date.fromisoformat(params['date']) if params.get('date') else None
+
+
+def _orders_report(params):
+    rows = db_reports.iter_keyset(reports.orders_report(
+        params['type'], _target_date(params),
+        **{name: params.get(name) for name in FILTER_PARAMS},
+    ), ['order_id'], db_reports.DEFAULT_BATCH_SIZE)
+    columns = reports.columns(params['type'])
+    formatted = (reports.format_row(row, params['date_format']) for row in rows)
+    # Как у выгрузки OrdersReportAPIView: заголовок есть и у пустого отчёта.
+    return formatted, columns, list(columns), {'delimiter': ';'}
+
+
+def _admin_statement(params):
+    rows = db_reports.iter_report(
+        params['type'], _target_date(params),
+        **{name: params.get(name) for name in FILTER_PARAMS},
+    )
+    return rows, db_reports.COLUMN_NAMES, None, {'dialect': 'excel'}
+
+
+# kind -> функция параметров, которая возвращает (строки-словари,
+# {колонка: заголовок}, порядок колонок или None — по первой строке,
+# настройки csv.writer).
+KINDS = {
+    'orders_report': _orders_report,
+    'admin_statement': _admin_statement,
+}
+
+
+def _write_csv(fh, rows, columns, keys, writer_options):
+    rows = iter(rows)
+    first = next(rows, None)
+    if keys is None:
+        if first is None:
+            return 0
+        keys = list(first)
+
+    def values():
+        if first is not None:
+            yield [first[key] for key in keys]
+        for row in rows:
+            yield [row[key] for key in keys]
+
+    count = 0
+    for line in iter_csv(values(), [columns.get(key, key) for key in keys], **writer_options):
+        fh.write(line)
+        count += 1
+    # Первые две строки — BOM и заголовок.
+    return max(count - 2, 0)
+
+
+def _write_json(fh, rows, columns, report_type):
+    # Пишется по строке, чтобы не держать отчёт в памяти целиком; формат
+    # тот же, что у ответа OrdersReportAPIView.
+    fh.write(b'{"data": [')
+    count = 0
+    for row in rows:
+        if count:
+            fh.write(b', ')
+        fh.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8'))
+        count += 1
+    tail = {'total_count': count, 'columns': columns, 'report_type': report_type}
+    fh.write(b'], ' + json.dumps(tail, ensure_ascii=False).encode('utf-8')[1:])
+    return count
+
+
+def run(job_id):
+    """Строит отчёт задания, уже переведённого claim в running."""
+    job = ReportJob.objects.get(pk=job_id)
+    name = f"{RESULT_DIR}/{job.kind}_{job.pk.hex}.{job.format}"
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    partial = f"{path}.part"
+    try:
+        rows, columns, keys, writer_options = KINDS[job.kind](job.params)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(partial, 'wb') as fh:
+            if job.format == 'json':
+                count = _write_json(fh, rows, columns, job.params['type'])
+            else:
+                count = _write_csv(fh, rows, columns, keys, writer_options)
+        os.replace(partial, path)
+    except Exception as e:
+        logger.exception("Не удалось построить отчёт %s", job.pk)
+        if os.path.exists(partial):
+            os.remove(partial)
+        ReportJob.objects.filter(pk=job.pk, status='running').update(
+            status='failed', error=str(e), finished_at=timezone.now(),
+        )
+        return
+    # Задание, которое успели признать зависшим, остаётся failed.
+    ReportJob.objects.filter(pk=job.pk, status='running').update(
+        status='done', result=name, rows_count=count, finished_at=timezone.now(),
+    )
+
+
+def fail_stale(now=None):
+    """
+    Помечает сбойными задания, которые выполняются дольше REPORT_JOB_TIMEOUT
+    и STALE_GRACE (воркер упал и не записал статус). Процесс отчёта к
+    этому времени уже остановлен (см. report_process), так что места в
+    лимите освобождаются только за завершёнными процессами.
+    """
+    now = now or timezone.now()
+    return ReportJob.objects.filter(
+        status='running', started_at__lt=now - timedelta(seconds=settings.REPORT_JOB_TIMEOUT + STALE_GRACE),
+    ).update(status='failed', error=TIMEOUT_ERROR, finished_at=now)
+
+
+def claim(limit, now=None):
+    """
+    Переводит в running до limit заданий из очереди, не превышая
+    REPORT_JOB_CONCURRENCY одновременно выполняемых заданий с учётом
+    других воркеров. Возвращает id.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        # Проверка лимита и захват идут под одной блокировкой: иначе два
+        # воркера одновременно видят одни и те же свободные места.
+        ReportJobLock.objects.select_for_update().get(name='claim')
+        fail_stale(now)
+        free = min(limit, settings.REPORT_JOB_CONCURRENCY - ReportJob.objects.filter(status='running').count())
+        if free <= 0:
+            return []
+        job_ids = list(
+            ReportJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending')
+            .order_by('created_at')
+            .values_list('id', flat=True)[:free]
+        )
+        ReportJob.objects.filter(id__in=job_ids).update(status='running', started_at=now)
+    return job_ids
+
+
+def delete_expired(now=None):
+    """Удаляет завершённые задания старше REPORT_JOB_RESULT_TTL вместе с файлами."""
+    now = now or timezone.now()
+    expired = ReportJob.objects.filter(
+        status__in=('done', 'failed'), finished_at__lt=now - timedelta(seconds=settings.REPORT_JOB_RESULT_TTL),
+    )
+    for job in expired.exclude(result=''):
+        job.result.delete(save=False)
+    return expired.delete()[0]
+
+
+def _finish(job_id, process, deadline):
+    """Записывает статус задания, процесс которого завершился или остановлен по времени."""
+    if process.is_alive():
+        process.kill()
+    process.join()
+    if process.exitcode == 0:
+        return
+    error = TIMEOUT_ERROR if time.time() >= deadline else f"Процесс отчёта завершился с кодом {process.exitcode}"
+    logger.error("Отчёт %s не построен: %s", job_id, error)
+    # run не успел записать статус.
+    ReportJob.objects.filter(pk=job_id, status='running').update(
+        status='failed', error=error, finished_at=timezone.now(),
+    )
+
+
+def run_pending(concurrency=None, loop=False, interval=1.0):
+    """
+    Выполняет задания из очереди, не больше concurrency процессов сразу.
+    Без loop возвращается, когда очередь пуста и запущенные задания
+    завершены. Возвращает число выполненных заданий.
+    """
+    concurrency = concurrency or settings.REPORT_JOB_CONCURRENCY
+    delete_expired()
+    processed = 0
+    # spawn: дочерние процессы не наследуют открытые соединения с базой.
+    context = multiprocessing.get_context('spawn')
+    running = {}
+    while True:
+        now = timezone.now()
+        deadline = now.timestamp() + settings.REPORT_JOB_TIMEOUT
+        for job_id in claim(concurrency - len(running), now):
+            process = context.Process(target=report_process.main, args=(job_id, deadline), daemon=True)
+            process.start()
+            running[job_id] = (process, deadline)
+        if not running:
+            if not loop:
+                return processed
+            time.sleep(interval)
+            continue
+        multiprocessing.connection.wait([process.sentinel for process, _ in running.values()], timeout=interval)
+        for job_id, (process, deadline) in list(running.items()):
+            if process.is_alive() and time.time() < deadline:
+                continue
+            del running[job_id]
+            _finish(job_id, process, deadline)
+            processed += 1
@@ -0,0 +1,28 @@
+import math
+import signal
+import time
+
+import django
+
+
+# Точка входа процесса отчёта, который запускает report_jobs.run_pending
+# (spawn). Модуль импортируется в новом процессе до django.setup(),
+# поэтому модели здесь подключаются только внутри main.
+def main(job_id, deadline):
+    """
+    Строит отчёт задания. SIGALRM без обработчика завершает процесс к
+    deadline (time.time()), даже если воркер, запустивший его, уже упал.
+    """
+    if hasattr(signal, 'alarm'):
+        signal.alarm(max(1, math.ceil(deadline - time.time())))
+    django.setup()
+
+    from django.db import close_old_connections
+
+    from . import report_jobs
+
+    close_old_connections()
+    try:
+        report_jobs.run(job_id)
+    finally:
+        close_old_connections()
@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+from .models import OrderItem
+
+
+REPORT_TYPES = ('day', 'week', 'month', 'filtered')
+
+
+def columns(report_type):
+    """Заголовки колонок отчёта по заказам в порядке вывода."""
+    return {
+        'id': 'ID заказа',
+        'user': 'Пользователь',
+        'total_price': 'Сумма заказа' if report_type == 'filtered' else 'Итоговая цена',
+        'date_created': 'Дата создания',
+    }
+
+
+def format_row(row, python_format):
+    """Строка orders_report в виде для вывода; python_format — формат даты пользователя."""
+    return {
+        'id': row['order_id'],
+        'user': f"{row['first_name']} {row['last_name']}",
+        'total_price': f"{row['total']:.2f}",
+        'date_created': row['date_created'].strftime(f"{python_format} %H:%M"),
+    }
+
+
+def orders_report(report_type, target_date=None, product_id=None, category_id=None, brand_id=None, user_id=None):
+    """
+    Отчёт по заказам одним сгруппированным запросом по позициям заказов.
+    Фильтры по товару, категории и бренду применяются к позициям, поэтому
+    сумма заказа считается только по подходящим позициям, а заказы без
+    таких позиций в отчёт не попадают. Строки — словари с ключами
+    order_id, first_name, last_name, date_created, total.
+    """
+    items = OrderItem.objects.all()
+
+    if target_date is not None:
+        if report_type == 'day':
+            items = items.filter(order__date_created__date=target_date)
+        elif report_type == 'week':
+            items = items.filter(order__date_created__date__range=[target_date, target_date + timedelta(days=6)])
+        elif report_type == 'month':
+            items = items.filter(order__date_created__year=target_date.year, order__date_created__month=target_date.month)
+
+    if user_id:
+        items = items.filter(order__user_id=user_id)
+    if product_id:
+        items = items.filter(product_id=product_id)
+    if category_id:
+        items = items.filter(product__category_id=category_id)
+    if brand_id:
+        items = items.filter(product__brand_id=brand_id)
+
+    line_total = ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    return (
+        items
+        .values(
+            'order_id',
+            first_name=F('order__first_name'),
+            last_name=F('order__last_name'),
+            date_created=F('order__date_created'),
+        )
+        .annotate(total=Sum(line_total))
+        .order_by('order_id')
+    )
@@ -0,0 +1,182 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import signals
+from .models import ProductStock, StockReservation
+
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class ReservationError(ValueError):
+    def __init__(self, message, available=0):
+        self.available = available
+        super().__init__(message)
+
+
+def is_enabled():
+    return settings.CART_RESERVATION_TTL > 0
+
+
+def ttl():
+    return timedelta(seconds=settings.CART_RESERVATION_TTL)
+
+
+def active(now=None):
+    return StockReservation.objects.filter(expires_at__gt=now or timezone.now())
+
+
+def held_quantity(now=None, exclude_user=None, product=OuterRef('product_id'), pickup_point=OuterRef('pickup_point_id')):
+    """
+    Выражение для запросов к ProductStock: сколько единиц товара на этом
+    пункте выдачи удерживают действующие резервы (кроме резервов exclude_user).
+    Для других моделей товар и пункт выдачи передаются явно.
+    """
+    holds = active(now).filter(product_id=product, pickup_point_id=pickup_point)
+    if exclude_user is not None:
+        holds = holds.exclude(user=exclude_user)
+    total = holds.values('product_id').annotate(total=Sum('quantity')).values('total')[:1]
+    return Coalesce(Subquery(total, output_field=IntegerField()), Value(0))
+
+
+def with_available(stocks, now=None, exclude_user=None):
+    """
+    Добавляет к queryset остатков поле available — количество, которое
+    ещё можно купить. Если резервирование выключено, оно равно quantity.
+    """
+    if not is_enabled():
+        return stocks.annotate(available=F('quantity'))
+    return stocks.annotate(available=F('quantity') - held_quantity(now, exclude_user))
+
+
+def available_totals(products, user=None, now=None):
+    """
+    {id товара: сколько единиц можно добавить в корзину по всем пунктам
+    выдачи}. Без резервирования это просто Product.stock, с ним — один
+    запрос на все товары.
+    """
+    if not is_enabled():
+        return {product.pk: product.stock for product in products}
+    totals = dict(
+        with_available(ProductStock.objects.filter(product__in=products), now, exclude_user=user)
+        .values('product_id')
+        .annotate(total=Sum('available'))
+        .values_list('product_id', 'total')
+    )
+    return {product.pk: totals.get(product.pk, 0) for product in products}
+
+
+def available_total(product, user=None, now=None):
+    return available_totals([product], user, now)[product.pk]
+
+
+def held_by_others(user, stock_ids, now=None):
+    """{id остатка: количество в чужих резервах} для оформления заказа."""
+    return {
+        stock_id: held
+        for stock_id, held in ProductStock.objects
+        .filter(id__in=stock_ids)
+        .annotate(held=held_quantity(now, exclude_user=user))
+        .values_list('id', 'held')
+        if held
+    }
+
+
+def reserve(user, product, pickup_point, quantity, now=None):
+    """
+    Устанавливает резерв пользователя на товар в пункте выдачи равным
+    quantity и продлевает его на CART_RESERVATION_TTL. Строки остатка
+    блокируются так же, как при оформлении заказа, поэтому два покупателя
+    не зарезервируют одни и те же единицы.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        quantities = list(
+            ProductStock.objects.select_for_update()
+            .filter(product=product, pickup_point=pickup_point)
+            .order_by('id')
+            .values_list('quantity', flat=True)
+        )
+        if not quantities:
+            raise ReservationError(f"Товар '{product.name}' отсутствует на выбранном пункте выдачи")
+
+        holds = active(now).filter(product=product, pickup_point=pickup_point)
+        held = holds.exclude(user=user).aggregate(total=Sum('quantity'))['total'] or 0
+        own = holds.filter(user=user).aggregate(total=Sum('quantity'))['total'] or 0
+        available = sum(quantities) - held
+        if quantity > available:
+            raise ReservationError(f"Недостаточно товара '{product.name}' на пункте выдачи. Доступно {max(available, 0)}",
+                                   available=max(available, 0))
+
+        reservation, _ = StockReservation.objects.update_or_create(
+            user=user, product=product, pickup_point=pickup_point,
+            defaults={'quantity': quantity, 'expires_at': now + ttl()},
+        )
+
+        # Наличие в каталоге меняется, только когда резерв забирает
+        # последние свободные единицы или возвращает их.
+        if (available - own > 0) != (available - quantity > 0):
+            signals.stock_changed.send(sender=StockReservation, product_ids={product.pk})
+    return reservation
+
+
+def release(user, product_ids=None, now=None):
+    """Снимает резервы пользователя (на все товары или на указанные)."""
+    holds = StockReservation.objects.filter(user=user)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    with transaction.atomic():
+        released = set(holds.filter(expires_at__gt=now or timezone.now()).values_list('product_id', flat=True))
+        holds.delete()
+        if released:
+            signals.stock_changed.send(sender=StockReservation, product_ids=released)
+
+
+def release_expired(now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Удаляет истёкшие резервы пачками по batch_size и обновляет наличие
+    затронутых товаров. Возвращает число снятых резервов.
+    """
+    now = now or timezone.now()
+    released = 0
+    product_ids = set()
+    while True:
+        with transaction.atomic():
+            batch = list(
+                StockReservation.objects
+                .filter(expires_at__lte=now)
+                .order_by('id')
+                .values_list('id', 'product_id')[:batch_size]
+            )
+            if not batch:
+                break
+            # Резерв могли продлить между выборкой и удалением, поэтому
+            # условие на срок повторяется.
+            deleted, _ = StockReservation.objects.filter(id__in=[pk for pk, _ in batch], expires_at__lte=now).delete()
+            released += deleted
+            product_ids.update(product_id for _, product_id in batch)
+        if len(batch) < batch_size:
+            break
+
+    if product_ids:
+        signals.stock_changed.send(sender=StockReservation, product_ids=product_ids)
+    return released
+
+
+def release_expired_if_any(now=None):
+    """
+    Снимает истёкшие резервы при чтении каталога, не дожидаясь cron: иначе
+    ProductAvailability до его запуска скрывает уже освободившиеся единицы.
+    Если истёкших резервов нет, это один запрос по индексу expires_at.
+    """
+    if not is_enabled():
+        return 0
+    now = now or timezone.now()
+    if not StockReservation.objects.filter(expires_at__lte=now).exists():
+        return 0
+    return release_expired(now)
@@ -0,0 +1,206 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+
+from .db_reports import REPORT_TZ, period_bounds
+from .models import Brand, Order, OrderItem, SalesRollup
+
+
+# Сводка продаж хранится корзинами (день, пункт выдачи, категория, бренд,
+# статус заказа) и меняется приращениями при оформлении заказа, смене его
+# статуса или пункта выдачи, удалении заказа, а также при смене категории
+# или бренда товара: продажи переносятся в корзины с новыми значениями, как
+# их разнесла бы пересборка. Изменения в обход save() (update()) сводка не
+# видит, после них нужна rebuild(). Отчёты суммируют корзины и не читают
+# OrderItem. Как и прежние представления petshop_orders_by_*, сводные
+# таблицы считают позиции заказов: total_orders — число позиций,
+# avg_order_value — средняя сумма позиции. Дни и месяцы считаются в
+# REPORT_TZ (UTC), как в отчётах db_reports и прежних представлениях.
+NO_BRAND = 0
+
+_KEY = ('day', 'point', 'category', 'brand', 'status')
+_FIELDS = ('quantity', 'lines', 'total_sales')
+
+
+def _contributions(items):
+    """{(день, пункт, категория, бренд, статус): [шт., позиций, сумма]}."""
+    line_total = ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    rows = (
+        items
+        .values(
+            day=TruncDate('order__date_created', tzinfo=REPORT_TZ),
+            point=F('order__pickup_point_id'),
+            category=F('product__category_id'),
+            brand=Coalesce('product__brand_id', Value(NO_BRAND)),
+            order_status=F('order__status'),
+        )
+        .annotate(sold=Sum('quantity'), lines=Count('id'), sales=Sum(line_total))
+        .order_by()
+    )
+    return {
+        (row['day'], row['point'], row['category'], row['brand'], row['order_status']): [row['sold'], row['lines'], row['sales']]
+        for row in rows.iterator(chunk_size=2000)
+    }
+
+
+def _apply(deltas):
+    """Прибавляет приращения к корзинам: вставка недостающих, блокировка и один UPDATE."""
+    deltas = {key: values for key, values in deltas.items() if any(values)}
+    if not deltas:
+        return
+    with transaction.atomic(savepoint=False):
+        SalesRollup.objects.bulk_create(
+            [
+                SalesRollup(day=day, pickup_point_id=point, category_id=category, brand_key=brand, status=status)
+                for day, point, category, brand, status in sorted(deltas)
+            ],
+            ignore_conflicts=True,
+        )
+        match = Q()
+        for day, point, category, brand, status in deltas:
+            match |= Q(day=day, pickup_point_id=point, category_id=category, brand_key=brand, status=status)
+        ids = {
+            (day, point, category, brand, status): rollup_id
+            for rollup_id, day, point, category, brand, status in (
+                SalesRollup.objects.select_for_update().filter(match).order_by('id')
+                .values_list('id', 'day', 'pickup_point_id', 'category_id', 'brand_key', 'status')
+            )
+        }
+
+        changes = {}
+        for index, field in enumerate(_FIELDS):
+            output = DecimalField(max_digits=14, decimal_places=2) if field == 'total_sales' else IntegerField()
+            changes[field] = F(field) + Case(
+                *[When(id=ids[key], then=Value(values[index])) for key, values in deltas.items()],
+                default=Value(0),
+                output_field=output,
+            )
+        SalesRollup.objects.filter(id__in=ids.values()).update(**changes)
+
+
+def _negate(totals):
+    return {key: [-value for value in values] for key, values in totals.items()}
+
+
+def add_orders(order_ids):
+    """Учитывает новые заказы; вызывается после создания их позиций."""
+    _apply(_contributions(OrderItem.objects.filter(order_id__in=order_ids)))
+
+
+def remove_orders(order_ids):
+    """Вычитает заказы из сводки; вызывается до удаления их позиций."""
+    _apply(_negate(_contributions(OrderItem.objects.filter(order_id__in=order_ids))))
+
+
+def _move(items, previous):
+    """
+    Переносит уже сохранённые позиции items из корзин, где части ключа
+    имели прежние значения previous ({'point': ..., 'status': ...}).
+    """
+    deltas = {}
+    for key, values in _contributions(items).items():
+        old_key = tuple(previous.get(part, value) for part, value in zip(_KEY, key))
+        if old_key == key:
+            continue
+        for target, sign in ((key, 1), (old_key, -1)):
+            totals = deltas.setdefault(target, [0, 0, 0])
+            for index, value in enumerate(values):
+                totals[index] += sign * value
+    _apply(deltas)
+
+
+def move_order(order_id, previous):
+    """Переносит сохранённый заказ из корзин с прежними статусом и (или) пунктом выдачи."""
+    _move(OrderItem.objects.filter(order_id=order_id), previous)
+
+
+def move_product(product_id, previous):
+    """Переносит продажи товара из корзин с прежними категорией и (или) брендом (NO_BRAND вместо None)."""
+    _move(OrderItem.objects.filter(product_id=product_id), previous)
+
+
+def rebuild():
+    """
+    Пересобирает сводку по всем заказам помесячно. Заказы, оформленные во
+    время пересборки, могут учесться дважды, поэтому её стоит запускать
+    в спокойное время. Возвращает число корзин.
+    """
+    months = (
+        Order.objects.annotate(month=TruncMonth('date_created', tzinfo=REPORT_TZ))
+        .values_list('month', flat=True).distinct().order_by('month')
+    )
+    created = 0
+    with transaction.atomic():
+        SalesRollup.objects.all().delete()
+        for month in months:
+            month = month.date() if hasattr(month, 'date') else month
+            start, end = period_bounds('month', month)
+            items = OrderItem.objects.filter(order__date_created__gte=start, order__date_created__lt=end)
+            rows = [
+                SalesRollup(
+                    day=day, pickup_point_id=point, category_id=category, brand_key=brand, status=status,
+                    **dict(zip(_FIELDS, values)),
+                )
+                for (day, point, category, brand, status), values in _contributions(items).items()
+            ]
+            SalesRollup.objects.bulk_create(rows, batch_size=1000)
+            created += len(rows)
+    return created
+
+
+def _rollups(statuses=None):
+    rollups = SalesRollup.objects.all()
+    if statuses is not None:
+        rollups = rollups.filter(status__in=statuses)
+    return rollups
+
+
+def _with_average(row):
+    row['avg_order_value'] = row['total_sales'] / row['total_orders'] if row['total_orders'] else Decimal('0.00')
+    return row
+
+
+def sales_by_category(statuses=None):
+    """Строки category_name, total_orders, total_sales, avg_order_value по убыванию продаж."""
+    rows = (
+        _rollups(statuses)
+        .values(category_name=F('category__name'))
+        .annotate(total_orders=Sum('lines'), total_sales=Sum('total_sales'))
+        .filter(total_orders__gt=0)
+        .order_by('-total_sales', 'category_name')
+    )
+    return [_with_average(row) for row in rows]
+
+
+def sales_by_brand(statuses=None):
+    """Как sales_by_category, но по названию бренда; brand_name — None для товаров без бренда."""
+    buckets = list(
+        _rollups(statuses)
+        .values('brand_key')
+        .annotate(total_orders=Sum('lines'), total_sales=Sum('total_sales'))
+        .filter(total_orders__gt=0)
+    )
+    names = dict(Brand.objects.filter(id__in=[row['brand_key'] for row in buckets]).values_list('id', 'name'))
+    rows = {}
+    for bucket in buckets:
+        name = names.get(bucket['brand_key'])
+        row = rows.setdefault(name, {'brand_name': name, 'total_orders': 0, 'total_sales': Decimal('0.00')})
+        row['total_orders'] += bucket['total_orders']
+        row['total_sales'] += bucket['total_sales']
+    ordered = sorted(rows.values(), key=lambda row: (-row['total_sales'], row['brand_name'] or ''))
+    return [_with_average(row) for row in ordered]
+
+
+def sales_by_month(statuses=None):
+    """Строки month (первое число месяца), total_orders, total_sales, avg_order_value по возрастанию месяца."""
+    rows = (
+        _rollups(statuses)
+        .annotate(month=TruncMonth('day'))
+        .values('month')
+        .annotate(total_orders=Sum('lines'), total_sales=Sum('total_sales'))
+        .filter(total_orders__gt=0)
+        .order_by('month')
+    )
+    return [_with_average(row) for row in rows]
@@ -0,0 +1,125 @@
+import re
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Max, Q, Sum, When
+
+from .models import Product, ProductSearchToken
+
+
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+MIN_STEM_LENGTH = 3
+MAX_TERM_LENGTH = 64
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'иях', 'ией', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ях', 'ах', 'ов', 'ев', 'ей', 'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие',
+    'ым', 'им', 'ом', 'ем', 'ых', 'их', 'ую', 'юю', 'ам', 'ям', 'ию', 'ья', 'ье', 'ьи', 'ью',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+
+
+def normalize(word):
+    return word.lower().replace('ё', 'е')
+
+
+def stem(word):
+    """
+    Лёгкий стеммер: отрезает самое длинное падежное окончание, если
+    после этого остаётся основа не короче MIN_STEM_LENGTH.
+    """
+    if word.isdigit():
+        return word
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [stem(normalize(word))[:MAX_TERM_LENGTH] for word in WORD_RE.findall(text)]
+
+
+def product_terms(product):
+    weights = Counter()
+    for term in tokenize(product.name):
+        weights[term] += NAME_WEIGHT
+    for term in tokenize(product.description):
+        weights[term] += DESCRIPTION_WEIGHT
+    return weights
+
+
+def index_products(products):
+    products = list(products)
+    tokens = [
+        ProductSearchToken(term=term, product_id=product.id, weight=weight)
+        for product in products
+        for term, weight in product_terms(product).items()
+    ]
+    with transaction.atomic():
+        ProductSearchToken.objects.filter(product_id__in=[p.id for p in products]).delete()
+        ProductSearchToken.objects.bulk_create(tokens, batch_size=1000)
+    return len(tokens)
+
+
+def index_product(product):
+    return index_products([product])
+
+
+def rebuild_index(batch_size=1000):
+    ProductSearchToken.objects.all().delete()
+    total = 0
+    last_id = 0
+    while True:
+        batch = list(Product.objects.filter(id__gt=last_id).order_by('id').only('id', 'name', 'description')[:batch_size])
+        if not batch:
+            return total
+        total += index_products(batch)
+        last_id = batch[-1].id
+
+
+def prefix_condition(prefix):
+    condition = Q(term__startswith=prefix)
+    # В SQLite строки сравниваются по кодам символов, и явный диапазон
+    # позволяет использовать индекс по term, который LIKE 'префикс%' там
+    # не использует. В MySQL с сопоставлением *_ci и в Postgres с языковым
+    # сопоставлением порядок другой, и диапазон терял бы термы.
+    if connection.vendor == 'sqlite':
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        condition &= Q(term__gte=prefix, term__lt=upper)
+    return condition
+
+
+def ranked_matches(query):
+    """
+    Возвращает queryset (product_id, rank) товаров, содержащих все слова
+    запроса; последнее слово ищется по префиксу, чтобы поиск работал по
+    мере ввода. Ранг — сумма весов совпавших термов. None, если в запросе
+    нет ни одного слова.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return None
+
+    conditions = [Q(term=term) for term in terms[:-1]] + [prefix_condition(terms[-1])]
+    any_term = Q()
+    for condition in conditions:
+        any_term |= condition
+
+    matched = {
+        f'matched_{i}': Max(Case(When(condition, then=1), default=0, output_field=IntegerField()))
+        for i, condition in enumerate(conditions)
+    }
+    return (
+        ProductSearchToken.objects
+        .filter(any_term)
+        .values('product_id')
+        .annotate(rank=Sum('weight'), **matched)
+        .filter(**{name: 1 for name in matched})
+        .values('product_id', 'rank')
+    )
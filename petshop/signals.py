@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
+from django.dispatch import Signal
+
+from . import taxonomy, search, catalog_version, availability, stock_totals, sales_rollup
+from .models import Product, ProductStock, ProductPurpose, Review, PickupPoint, Order
+
+
+# Остатки изменены в обход save() (массовым UPDATE); аргумент product_ids.
+stock_changed = Signal()
+
+
+def invalidate_taxonomy_cache(sender, **kwargs):
+    taxonomy.invalidate(sender)
+
+
+def bump_catalog_version(sender, **kwargs):
+    transaction.on_commit(catalog_version.bump)
+
+
+def refresh_product_availability(sender, instance, **kwargs):
+    product_id = instance.pk if sender is Product else instance.product_id
+    availability.refresh_availability([product_id])
+
+
+def refresh_changed_stock(sender, product_ids, **kwargs):
+    availability.refresh_availability(product_ids)
+    transaction.on_commit(catalog_version.bump)
+
+
+def refresh_stock_total(sender, instance, created=False, raw=False, **kwargs):
+    # Product.save() записывает все поля, в том числе stock, который мог
+    # устареть в памяти; новому товару пересчитывать нечего.
+    if raw or (sender is Product and created):
+        return
+    product_id = instance.pk if sender is Product else instance.product_id
+    stock_totals.refresh_totals([product_id])
+
+
+# Поля, входящие в ключ корзины сводки продаж: {модель: {часть ключа: поле}}.
+ROLLUP_KEY_FIELDS = {
+    Order: {'status': 'status', 'point': 'pickup_point_id'},
+    Product: {'category': 'category_id', 'brand': 'brand_id'},
+}
+
+
+def remember_rollup_key(sender, instance, raw=False, update_fields=None, **kwargs):
+    fields = ROLLUP_KEY_FIELDS[sender]
+    if raw or instance.pk is None:
+        return
+    names = set(fields.values()) | {field.removesuffix('_id') for field in fields.values()}
+    if update_fields is not None and not names & set(update_fields):
+        return
+    previous = sender.objects.filter(pk=instance.pk).values(*fields.values()).first()
+    if previous is not None:
+        instance._rollup_key = {part: previous[field] for part, field in fields.items()}
+
+
+def move_in_rollup(sender, instance, created=False, raw=False, **kwargs):
+    # Новый заказ учитывает place_order: в момент сохранения Order его
+    # позиций ещё нет; у нового товара продаж нет.
+    previous = instance.__dict__.pop('_rollup_key', None)
+    if raw or created or previous is None:
+        return
+    changed = {
+        part: value for part, value in previous.items()
+        if value != getattr(instance, ROLLUP_KEY_FIELDS[sender][part])
+    }
+    if 'brand' in changed:
+        changed['brand'] = changed['brand'] or sales_rollup.NO_BRAND
+    if not changed:
+        return
+    if sender is Order:
+        sales_rollup.move_order(instance.pk, changed)
+    else:
+        sales_rollup.move_product(instance.pk, changed)
+
+
+def remove_order_from_rollup(sender, instance, **kwargs):
+    # pre_delete: позиции заказа удаляются каскадом раньше самого заказа.
+    sales_rollup.remove_orders([instance.pk])
+
+
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_product(instance)
+
+
+for model in taxonomy.TAXONOMY_MODELS:
+    post_save.connect(invalidate_taxonomy_cache, sender=model, dispatch_uid=f'taxonomy_{model.__name__}_save')
+    post_delete.connect(invalidate_taxonomy_cache, sender=model, dispatch_uid=f'taxonomy_{model.__name__}_delete')
+
+post_save.connect(update_search_index, sender=Product, dispatch_uid='search_index_product_save')
+
+post_save.connect(refresh_product_availability, sender=Product, dispatch_uid='availability_product_save')
+post_save.connect(refresh_product_availability, sender=ProductStock, dispatch_uid='availability_stock_save')
+post_delete.connect(refresh_product_availability, sender=ProductStock, dispatch_uid='availability_stock_delete')
+stock_changed.connect(refresh_changed_stock, dispatch_uid='availability_stock_changed')
+
+for model in ROLLUP_KEY_FIELDS:
+    pre_save.connect(remember_rollup_key, sender=model, dispatch_uid=f'sales_rollup_{model.__name__}_pre_save')
+    post_save.connect(move_in_rollup, sender=model, dispatch_uid=f'sales_rollup_{model.__name__}_save')
+pre_delete.connect(remove_order_from_rollup, sender=Order, dispatch_uid='sales_rollup_order_delete')
+
+post_save.connect(refresh_stock_total, sender=Product, dispatch_uid='stock_total_product_save')
+post_save.connect(refresh_stock_total, sender=ProductStock, dispatch_uid='stock_total_stock_save')
+post_delete.connect(refresh_stock_total, sender=ProductStock, dispatch_uid='stock_total_stock_delete')
+
+# Заказы на каталог не влияют: остатки при оформлении меняются через
+# stock_changed, а can_review в карточке товара учитывается в её ETag.
+for model in (Product, ProductStock, ProductPurpose, Review, PickupPoint) + taxonomy.TAXONOMY_MODELS:
+    post_save.connect(bump_catalog_version, sender=model, dispatch_uid=f'catalog_version_{model.__name__}_save')
+    post_delete.connect(bump_catalog_version, sender=model, dispatch_uid=f'catalog_version_{model.__name__}_delete')
@@ -0,0 +1,87 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Product, ProductStock
+
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def stock_sum():
+    """Выражение для запросов к Product: сумма остатков товара по всем пунктам выдачи."""
+    total = (
+        ProductStock.objects
+        .filter(product_id=OuterRef('pk'))
+        .values('product_id')
+        .annotate(total=Sum('quantity'))
+        .values('total')[:1]
+    )
+    return Coalesce(Subquery(total, output_field=IntegerField()), Value(0))
+
+
+def _lock(product_ids):
+    # Строки товаров блокируются в порядке id: после этого сумма по
+    # ProductStock видит все изменения, закоммиченные до нас, а
+    # параллельные обновления того же товара ждут нашего коммита.
+    return list(Product.objects.select_for_update().filter(id__in=product_ids).order_by('id').values_list('id', flat=True))
+
+
+def apply_deltas(deltas):
+    """
+    Сдвигает Product.stock на известные величины ({id товара: изменение})
+    одним UPDATE. Используется при оформлении заказа, где изменение
+    остатков уже посчитано.
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    with transaction.atomic(savepoint=False):
+        _lock(list(deltas))
+        Product.objects.filter(id__in=deltas).update(
+            stock=F('stock') + Case(
+                *[When(id=product_id, then=Value(delta)) for product_id, delta in deltas.items()],
+                output_field=IntegerField(),
+            )
+        )
+
+
+def refresh_totals(product_ids):
+    """Пересчитывает Product.stock указанных товаров по ProductStock."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    with transaction.atomic(savepoint=False):
+        _lock(list(product_ids))
+        Product.objects.filter(id__in=product_ids).update(stock=stock_sum())
+
+
+def drifted(product_ids=None):
+    """Товары, у которых Product.stock расходится с суммой остатков; поле actual — верное значение."""
+    products = Product.objects.all() if product_ids is None else Product.objects.filter(id__in=product_ids)
+    return products.annotate(actual=stock_sum()).exclude(stock=F('actual'))
+
+
+def reconcile(batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """
+    Находит и исправляет расхождения Product.stock пачками по batch_size
+    товаров. Возвращает список (id, было, стало).
+    """
+    fixed = []
+    last_id = 0
+    while True:
+        ids = list(Product.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        last_id = ids[-1]
+        with transaction.atomic():
+            if not dry_run:
+                _lock(ids)
+            rows = list(drifted(ids).values_list('id', 'stock', 'actual'))
+            if rows and not dry_run:
+                Product.objects.bulk_update(
+                    [Product(id=product_id, stock=actual) for product_id, _, actual in rows],
+                    ['stock'],
+                )
+        fixed.extend(rows)
+    return fixed
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Category, Brand, AgeCategory, ProductType, Species, Purpose
+
+
+TAXONOMY_MODELS = (Category, Brand, AgeCategory, ProductType, Species, Purpose)
+
+_lock = threading.Lock()
+_cache = {}
+_generations = {}
+
+
+def _load(model):
+    objects = list(model.objects.order_by('id'))
+    return {
+        'names': {obj.id: str(obj) for obj in objects},
+        'active_ids': frozenset(obj.id for obj in objects if obj.is_active),
+        'active': [obj for obj in objects if obj.is_active],
+        'loaded_at': time.monotonic(),
+    }
+
+
+def _fresh(entry):
+    # Сигналы сбрасывают кеш только в процессе, который изменил запись, и
+    # не срабатывают на QuerySet.update(); остальные процессы увидят
+    # изменение, когда запись кеша устареет.
+    max_age = getattr(settings, 'TAXONOMY_CACHE_MAX_AGE', 60)
+    return not max_age or time.monotonic() - entry['loaded_at'] < max_age
+
+
+def get_taxonomy(model):
+    entry = _cache.get(model)
+    if entry is not None and _fresh(entry):
+        return entry
+
+    generation = _generations.get(model, 0)
+    entry = _load(model)
+    with _lock:
+        if _generations.get(model, 0) == generation:
+            _cache[model] = entry
+    return entry
+
+
+def get_name(model, pk):
+    if pk is None:
+        return None
+    return get_taxonomy(model)['names'].get(pk)
+
+
+def get_active(model):
+    return get_taxonomy(model)['active']
+
+
+def find_missing_ids(model, ids):
+    return set(ids) - get_taxonomy(model)['names'].keys()
+
+
+def invalidate(model=None):
+    with _lock:
+        models = [model] if model is not None else list(TAXONOMY_MODELS)
+        for m in models:
+            _generations[m] = _generations.get(m, 0) + 1
+            _cache.pop(m, None)
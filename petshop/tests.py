@@ -1,3 +1,715 @@
-from django.test import TestCase
+import importlib
+import multiprocessing
+import signal
+import time
+from array import array
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core import mail
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    availability, carts, db_reports, order_numbers, orders, outbox, report_jobs, report_process, reservations, sales_rollup, search,
+    signals, stock_totals, taxonomy,
+)
+from .models import (
+    Brand, Cart, Category, Order, OrderItem, OrderNumberNode, OutboxEmail, PickupPoint, Product, ProductAvailability,
+    ProductSearchToken, ProductStock, ReportJob, Role, SalesRollup, StockReservation, User,
+)
+
+
+class TaxonomyCacheTests(TestCase):
+    def setUp(self):
+        taxonomy.invalidate()
+        self.category = Category.objects.create(name='Корма')
+
+    def test_update_seen_after_max_age(self):
+        with self.settings(TAXONOMY_CACHE_MAX_AGE=60), mock.patch('petshop.taxonomy.time.monotonic', return_value=1000):
+            self.assertEqual(taxonomy.get_name(Category, self.category.id), 'Корма')
+            # update() не вызывает сигналов, кеш сбросится только по возрасту.
+            Category.objects.filter(id=self.category.id).update(name='Корм')
+            self.assertEqual(taxonomy.get_name(Category, self.category.id), 'Корма')
+        with self.settings(TAXONOMY_CACHE_MAX_AGE=60), mock.patch('petshop.taxonomy.time.monotonic', return_value=1060):
+            self.assertEqual(taxonomy.get_name(Category, self.category.id), 'Корм')
+
+    def test_save_invalidates(self):
+        self.assertEqual(taxonomy.get_name(Category, self.category.id), 'Корма')
+        self.category.name = 'Корм'
+        self.category.save()
+        self.assertEqual(taxonomy.get_name(Category, self.category.id), 'Корм')
+
+
+
+class SearchIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Корма')
+        cls.cat_food = Product.objects.create(category=category, name='Корм для кошек', price=100)
+        cls.bowl = Product.objects.create(category=category, name='Миска', description='Для корма и воды', price=50)
+        cls.dog_food = Product.objects.create(category=category, name='Корм для собак', description='Сухой корм', price=120)
+
+    def search(self, query):
+        return list(search.ranked_matches(query).order_by('-rank', 'product_id').values_list('product_id', 'rank'))
+
+    def test_tokenize(self):
+        self.assertEqual(
+            search.tokenize('Корма для кошек, Ёжики и 2кг мячиков'),
+            ['корм', 'для', 'кошек', 'ежик', 'и', '2кг', 'мячик'],
+        )
+        self.assertEqual(search.tokenize(''), [])
+
+    def test_name_weighs_more_than_description(self):
+        self.assertEqual(search.product_terms(self.dog_food)['корм'], search.NAME_WEIGHT + search.DESCRIPTION_WEIGHT)
+        self.assertEqual(self.search('корма'), [(self.dog_food.id, 4), (self.cat_food.id, 3), (self.bowl.id, 1)])
+
+    def test_all_words_required_and_last_one_by_prefix(self):
+        self.assertEqual(self.search('корм кош'), [(self.cat_food.id, 6)])
+        self.assertEqual(self.search('ми'), [(self.bowl.id, 3)])
+        self.assertEqual(self.search('корм птиц'), [])
+        self.assertIsNone(search.ranked_matches(' , '))
+
+    def test_prefix_without_range_outside_sqlite(self):
+        # Порядок строк в MySQL (*_ci) и Postgres не совпадает с кодами
+        # символов, диапазон там не используется.
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            self.assertEqual(search.prefix_condition('кор'), Q(term__startswith='кор'))
+
+    def test_index_follows_product_save_and_delete(self):
+        self.bowl.name = 'Поилка'
+        self.bowl.save()
+        self.assertEqual(self.search('ми'), [])
+        self.assertEqual(self.search('поил'), [(self.bowl.id, 3)])
+        self.bowl.delete()
+        self.assertFalse(ProductSearchToken.objects.filter(product_id=self.bowl.id).exists())
+        self.assertEqual(self.search('поил'), [])
+
+class AvailabilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Корма')
+        cls.point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.other_point = PickupPoint.objects.create(address='ул. Мира, 2')
+        cls.product = Product.objects.create(category=category, name='Корм', price=100)
+
+    def points(self):
+        return set(ProductAvailability.objects.filter(product=self.product).values_list('pickup_point_id', flat=True))
+
+    def test_follows_stock_save_and_delete(self):
+        stock = ProductStock.objects.create(product=self.product, pickup_point=self.point, quantity=2)
+        other = ProductStock.objects.create(product=self.product, pickup_point=self.other_point, quantity=0)
+        self.assertEqual(self.points(), {self.point.id})
+        other.quantity = 3
+        other.save()
+        self.assertEqual(self.points(), {self.point.id, self.other_point.id})
+        stock.quantity = 0
+        stock.save()
+        self.assertEqual(self.points(), {self.other_point.id})
+        other.delete()
+        self.assertEqual(self.points(), set())
+
+    def test_inactive_product_is_hidden(self):
+        ProductStock.objects.create(product=self.product, pickup_point=self.point, quantity=2)
+        self.product.is_active = False
+        self.product.save()
+        self.assertEqual(self.points(), set())
+
+    def test_follows_stock_changed_signal(self):
+        ProductStock.objects.create(product=self.product, pickup_point=self.point, quantity=2)
+        # update() сигналов модели не вызывает, их заменяет stock_changed.
+        ProductStock.objects.filter(product=self.product).update(quantity=0)
+        self.assertEqual(self.points(), {self.point.id})
+        signals.stock_changed.send(sender=Order, product_ids={self.product.id})
+        self.assertEqual(self.points(), set())
+        ProductStock.objects.filter(product=self.product).update(quantity=5)
+        signals.stock_changed.send(sender=Order, product_ids={self.product.id})
+        self.assertEqual(self.points(), {self.point.id})
+
+
+@override_settings(CART_RESERVATION_TTL=60)
+class ReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        cls.buyer, cls.other = [
+            User.objects.create_user(email=f'buyer{i}@example.com', password='pass12345', first_name='Иван', last_name='Иванов')
+            for i in range(2)
+        ]
+        category = Category.objects.create(name='Корма')
+        cls.point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.product = Product.objects.create(category=category, name='Корм', price=100)
+        ProductStock.objects.create(product=cls.product, pickup_point=cls.point, quantity=2)
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def at(self, seconds):
+        return self.now + timedelta(seconds=seconds)
+
+    def is_listed(self):
+        return ProductAvailability.objects.filter(product=self.product, pickup_point=self.point).exists()
+
+    def test_expired_hold_restores_availability(self):
+        reservations.reserve(self.buyer, self.product, self.point, 2, now=self.now)
+        self.assertFalse(self.is_listed())
+        self.assertEqual(reservations.available_total(self.product, self.other, now=self.at(30)), 0)
+        with self.assertRaises(reservations.ReservationError):
+            reservations.reserve(self.other, self.product, self.point, 1, now=self.at(30))
+        self.assertEqual(reservations.release_expired_if_any(now=self.at(30)), 0)
+
+        # После истечения резерв уже не учитывается, даже пока он не удалён.
+        self.assertEqual(reservations.available_total(self.product, self.other, now=self.at(61)), 2)
+        self.assertEqual(reservations.release_expired_if_any(now=self.at(61)), 1)
+        self.assertTrue(self.is_listed())
+        self.assertFalse(StockReservation.objects.exists())
+        reservations.reserve(self.other, self.product, self.point, 2, now=self.at(61))
+        self.assertFalse(self.is_listed())
+
+    def test_release_restores_availability(self):
+        reservations.reserve(self.buyer, self.product, self.point, 2, now=self.now)
+        self.assertFalse(self.is_listed())
+        reservations.release(self.buyer, now=self.at(10))
+        self.assertTrue(self.is_listed())
+        self.assertEqual(reservations.available_total(self.product, self.other, now=self.at(10)), 2)
+
+    def test_renewal_extends_hold(self):
+        reservations.reserve(self.buyer, self.product, self.point, 1, now=self.now)
+        reservations.reserve(self.buyer, self.product, self.point, 2, now=self.at(50))
+        self.assertEqual(reservations.release_expired(now=self.at(61)), 0)
+        self.assertFalse(self.is_listed())
+        self.assertEqual(reservations.release_expired(now=self.at(111)), 1)
+        self.assertTrue(self.is_listed())
+
+
+class CartLoadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        cls.user = User.objects.create_user(email='buyer@example.com', password='pass12345', first_name='Иван', last_name='Иванов')
+        cls.other = User.objects.create_user(email='other@example.com', password='pass12345', first_name='Пётр', last_name='Петров')
+        category = Category.objects.create(name='Корма')
+        cls.point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        prices = [Decimal('99.90'), Decimal('0.35'), Decimal('1250.00'), Decimal('15.15')]
+        cls.products = [Product.objects.create(category=category, name=f'Корм {i}', price=price) for i, price in enumerate(prices)]
+        for product, quantity in zip(cls.products, [5, 1, 0, 3]):
+            ProductStock.objects.create(product=product, pickup_point=cls.point, quantity=quantity)
+        for product, quantity in zip(cls.products, [3, 7, 1, 2]):
+            Cart.objects.create(user=cls.user, product=product, quantity=quantity)
+        Cart.objects.create(user=cls.other, product=cls.products[0], quantity=10)
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            carts.load(self.user, self.point)
+        with self.assertNumQueries(1):
+            carts.load(self.user)
+
+    def test_totals_match_python(self):
+        rows, summary = carts.load(self.user, self.point)
+        items = Cart.objects.filter(user=self.user).select_related('product').order_by('id')
+        self.assertEqual([row['line_total'] for row in rows], [item.quantity * item.product.price for item in items])
+        self.assertEqual(summary['total_price'], sum(item.quantity * item.product.price for item in items))
+        self.assertEqual(summary['items_count'], sum(item.quantity for item in items))
+        self.assertEqual([row['is_available'] for row in rows], [True, False, False, True])
+
+    def test_empty_cart(self):
+        Cart.objects.filter(user=self.user).delete()
+        self.assertEqual(carts.load(self.user), ([], {'total_price': Decimal('0.00'), 'items_count': 0}))
+
+
+class PlaceOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        cls.user = User.objects.create_user(email='buyer@example.com', password='pass12345', first_name='Иван', last_name='Иванов')
+        cls.point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        category = Category.objects.create(name='Корма')
+        cls.products = [Product.objects.create(category=category, name=f'Корм {i}', price=Decimal(100 + i)) for i in range(100)]
+        ProductStock.objects.bulk_create([
+            ProductStock(product=product, pickup_point=cls.point, quantity=10) for product in cls.products
+        ])
+        availability.rebuild_availability()
+        stock_totals.refresh_totals([product.id for product in cls.products])
+
+    def fill_cart(self, products):
+        Cart.objects.bulk_create([Cart(user=self.user, product=product, quantity=2) for product in products])
+
+    def place(self):
+        return orders.place_order(self.user, self.point, 'Иван', 'Иванов', 'buyer@example.com', '')
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.fill_cart(self.products[:1])
+        self.place()
+
+        self.fill_cart(self.products[:1])
+        with CaptureQueriesContext(connection) as single:
+            self.place()
+
+        self.fill_cart(self.products)
+        with self.assertNumQueries(len(single)):
+            order = self.place()
+
+        self.assertEqual(order.items.count(), 100)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+        self.assertEqual(ProductStock.objects.get(product=self.products[0]).quantity, 4)
+        self.assertEqual(ProductStock.objects.get(product=self.products[1]).quantity, 8)
+
+    def test_insufficient_stock_rolls_back(self):
+        Cart.objects.create(user=self.user, product=self.products[0], quantity=11)
+        with self.assertRaises(orders.InsufficientStock):
+            self.place()
+        self.assertEqual(ProductStock.objects.get(product=self.products[0]).quantity, 10)
+        self.assertFalse(Order.objects.exists())
+
+    def test_insufficient_line_reported_and_nothing_decremented(self):
+        Cart.objects.create(user=self.user, product=self.products[0], quantity=9)
+        Cart.objects.create(user=self.user, product=self.products[1], quantity=11)
+        with self.assertRaises(orders.InsufficientStock) as raised:
+            self.place()
+        self.assertEqual((raised.exception.product_name, raised.exception.available), ('Корм 1', 10))
+        self.assertEqual(
+            list(ProductStock.objects.filter(product__in=self.products[:2]).order_by('product_id').values_list('quantity', flat=True)),
+            [10, 10],
+        )
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 2)
+
+    def test_decrement_skips_rows_without_enough_stock(self):
+        stocks = dict(ProductStock.objects.filter(product__in=self.products[:2]).values_list('product_id', 'id'))
+        first, second = stocks[self.products[0].id], stocks[self.products[1].id]
+        with transaction.atomic():
+            self.assertEqual(orders.lock_stocks([second, first]), {first: 10, second: 10})
+            self.assertEqual(orders.decrement_stocks({first: 3, second: 11}), 1)
+            self.assertEqual(orders.decrement_stocks({first: 3, second: 4}, reserved={second: 4}), 2)
+        self.assertEqual(ProductStock.objects.get(id=first).quantity, 4)
+        self.assertEqual(ProductStock.objects.get(id=second).quantity, 6)
+
+    def test_audit_user_set_only_on_postgres(self):
+        with CaptureQueriesContext(connection) as queries:
+            orders._set_audit_user(self.user)
+        self.assertEqual(len(queries), 0)
+        with mock.patch.object(connection, 'vendor', 'postgresql'), mock.patch.object(connection, 'cursor') as cursor:
+            orders._set_audit_user(self.user)
+        cursor.return_value.__enter__.return_value.execute.assert_called_once_with(
+            "SELECT set_config('myapp.current_user_id', %s, true)", [str(self.user.pk)],
+        )
+
+    def test_stock_unique_per_pickup_point(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ProductStock.objects.create(product=self.products[0], pickup_point=self.point, quantity=1)
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        user = User.objects.create_user(email='buyer@example.com', password='pass12345', first_name='Иван', last_name='Иванов')
+        point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.orders = [
+            Order.objects.create(
+                user=user, order_number=f'N{i}', pickup_point=point, total_price=100,
+                first_name='Иван', last_name='Иванов', email=f'buyer{i}@example.com',
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.entries = [outbox.enqueue_order_email(order, f"Заказ {order.order_number}") for order in self.orders]
+
+    def test_sends_and_records_each_message(self):
+        with self.settings(DEFAULT_FROM_EMAIL='shop@example.com'):
+            self.assertEqual(outbox.send_pending(), (3, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual({message.from_email for message in mail.outbox}, {'shop@example.com'})
+        self.assertEqual(set(OutboxEmail.objects.values_list('status', 'attempts')), {('sent', 1)})
+        self.assertEqual(outbox.send_pending(), (0, 0))
+
+    def test_crash_mid_batch_keeps_sent_messages(self):
+        sent = []
+
+        def send(message, *args, **kwargs):
+            if sent:
+                raise SystemExit("воркер остановлен")
+            sent.append(message)
+            return 1
+
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', send), self.assertRaises(SystemExit):
+            outbox.send_pending()
+
+        statuses = dict(OutboxEmail.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[self.entries[0].id], 'sent')
+        self.assertEqual(statuses[self.entries[1].id], 'sending')
+        # Пока аренда не истекла, письма никто не берёт; потом их
+        # отправляет следующий воркер, уже отправленное — нет.
+        self.assertEqual(outbox.send_pending(), (0, 0))
+        later = timezone.now() + outbox.sending_lease(outbox.DEFAULT_BATCH_SIZE)
+        self.assertEqual(outbox.send_pending(now=later), (2, 0))
+        self.assertEqual([message.to for message in mail.outbox], [['buyer1@example.com'], ['buyer2@example.com']])
+
+    def test_failed_message_is_retried_later(self):
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=OSError("SMTP недоступен")), \
+                self.assertLogs('petshop.outbox', 'WARNING'):
+            self.assertEqual(outbox.send_pending(), (0, 3))
+        entry = OutboxEmail.objects.get(id=self.entries[0].id)
+        self.assertEqual((entry.status, entry.attempts, entry.last_error), ('pending', 1, "SMTP недоступен"))
+        self.assertEqual(outbox.send_pending(), (0, 0))
+        self.assertEqual(outbox.send_pending(now=entry.next_attempt_at), (3, 0))
+
+
+def _generate_numbers(args):
+    node_id, count = args
+    generator = order_numbers.OrderNumberGenerator(node_id)
+    return array('q', (generator.next_value() for _ in range(count))).tobytes()
+
+
+class OrderNumberTests(TestCase):
+    def lease(self):
+        return order_numbers.NodeLease(ttl_ms=60_000)
+
+    def test_processes_with_leased_nodes_never_collide(self):
+        nodes = [self.lease().get() for _ in range(4)]
+        self.assertEqual(len(set(nodes)), 4)
+
+        per_process = 20_000
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            results = pool.map(_generate_numbers, [(node_id, per_process) for node_id in nodes])
+        numbers = set()
+        for raw in results:
+            values = array('q')
+            values.frombytes(raw)
+            self.assertEqual(list(values), sorted(values))
+            numbers.update(values)
+        self.assertEqual(len(numbers), 4 * per_process)
+
+    def test_sequence_overflow_and_clock_going_back(self):
+        clock = mock.Mock(return_value=1000)
+        generator = order_numbers.OrderNumberGenerator(5, clock=clock)
+        values = [generator.next_value() for _ in range(order_numbers.MAX_SEQUENCE + 2)]
+        clock.return_value = 990
+        values.append(generator.next_value())
+        self.assertEqual(values, sorted(set(values)))
+        parsed = [order_numbers.parse_number(order_numbers.format_number(value))[1:] for value in values[-3:]]
+        self.assertEqual(parsed, [(5, order_numbers.MAX_SEQUENCE), (5, 0), (5, 1)])
+        self.assertEqual(values[-2] >> (order_numbers.NODE_BITS + order_numbers.SEQUENCE_BITS), 1001)
+
+    def test_node_is_not_shared_until_lease_expires(self):
+        first, second = self.lease(), self.lease()
+        with mock.patch('petshop.order_numbers._now_ms', return_value=1_000_000):
+            node_id = first.get()
+            first._confirm(first._token, 1_000_000)
+            OrderNumberNode.objects.exclude(node_id=node_id).update(expires_ms=2_000_000)
+            with self.assertRaises(order_numbers.OrderNumberError):
+                second.get()
+        with mock.patch('petshop.order_numbers._now_ms', return_value=1_060_001):
+            self.assertEqual(second.get(), node_id)
+            # Аренду перехватили: первый процесс продлить её не может и
+            # ищет другой номер.
+            with self.assertRaises(order_numbers.OrderNumberError):
+                first.get()
+
+    def test_lease_renewed_from_half_of_ttl(self):
+        lease = self.lease()
+        with mock.patch('petshop.order_numbers._now_ms', return_value=1_000_000):
+            node_id = lease.get()
+        # В TestCase транзакция не фиксируется; подтверждаем вручную.
+        lease._confirm(lease._token, 1_000_000)
+        with mock.patch('petshop.order_numbers._now_ms', return_value=1_029_999), self.assertNumQueries(0):
+            self.assertEqual(lease.get(), node_id)
+        with mock.patch('petshop.order_numbers._now_ms', return_value=1_030_000), self.assertNumQueries(1):
+            self.assertEqual(lease.get(), node_id)
+        self.assertEqual(OrderNumberNode.objects.get(node_id=node_id).expires_ms, 1_090_000)
+
+    def test_lease_rolled_back_is_taken_again(self):
+        lease = self.lease()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            node_id = lease.get()
+            raise RuntimeError
+        self.assertNotEqual(OrderNumberNode.objects.get(node_id=node_id).owner, lease.owner)
+        with transaction.atomic():
+            lease.get()
+            with self.assertNumQueries(0):
+                lease.get()
+        self.assertEqual(OrderNumberNode.objects.filter(owner=lease.owner).count(), 1)
+
+    def test_release(self):
+        lease = self.lease()
+        node_id = lease.get()
+        lease.release()
+        self.assertEqual(OrderNumberNode.objects.get(node_id=node_id).expires_ms, 0)
+
+    def test_create_order_retries_taken_number(self):
+        Role.objects.create(id=1, name='Покупатель')
+        user = User.objects.create_user(email='buyer@example.com', password='pass12345', first_name='Иван', last_name='Иванов')
+        fields = {
+            'user': user, 'pickup_point': PickupPoint.objects.create(address='ул. Ленина, 1'), 'total_price': 100,
+            'first_name': 'Иван', 'last_name': 'Иванов', 'email': 'buyer@example.com',
+        }
+        orders.create_order('0000000000000000001', **fields)
+        with mock.patch('petshop.order_numbers.next_number', side_effect=['0000000000000000001', '0000000000000000002']), \
+                self.assertLogs('petshop.orders', 'WARNING'):
+            order = orders.create_order(**fields)
+        self.assertEqual(order.order_number, '0000000000000000002')
+        with self.assertRaises(IntegrityError):
+            orders.create_order('0000000000000000001', **fields)
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        cls.user = User.objects.create_user(email='buyer@example.com', password='pass12345', first_name='Иван', last_name='Иванов')
+        cls.point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.category = Category.objects.create(name='Корма')
+        cls.branded = Product.objects.create(category=cls.category, brand=Brand.objects.create(name='Бренд'), name='Корм', price=100)
+        cls.unbranded = Product.objects.create(category=cls.category, name='Миска', price=50)
+
+    def order(self, created, number):
+        order = Order.objects.create(
+            user=self.user, order_number=number, pickup_point=self.point, total_price=250,
+            first_name='Иван', last_name='Иванов', email='buyer@example.com',
+        )
+        OrderItem.objects.create(order=order, product=self.branded, quantity=2, price=100)
+        OrderItem.objects.create(order=order, product=self.unbranded, quantity=1, price=50)
+        Order.objects.filter(id=order.id).update(date_created=created)
+        sales_rollup.add_orders([order.id])
+        order.refresh_from_db()
+        return order
+
+    def snapshot(self):
+        # Опустевшие корзины остаются с нулями, отчёты их пропускают.
+        return sorted(SalesRollup.objects.exclude(lines=0).values_list('day', 'brand_key', 'status', 'quantity', 'lines', 'total_sales'))
+
+    def test_days_and_months_in_utc(self):
+        # 31 января 22:30 UTC — уже 1 февраля по Москве.
+        self.order(datetime(2026, 1, 31, 22, 30, tzinfo=dt_timezone.utc), 'N1')
+        self.order(datetime(2026, 2, 1, 0, 0, tzinfo=dt_timezone.utc), 'N2')
+        self.assertEqual(sorted(SalesRollup.objects.values_list('day', flat=True).distinct()), [date(2026, 1, 31), date(2026, 2, 1)])
+        self.assertEqual(
+            [(row['month'], row['total_orders'], row['total_sales']) for row in sales_rollup.sales_by_month()],
+            [(date(2026, 1, 1), 2, Decimal('250.00')), (date(2026, 2, 1), 2, Decimal('250.00'))],
+        )
+
+    def test_rebuild_matches_incremental(self):
+        self.order(datetime(2026, 1, 31, 22, 30, tzinfo=dt_timezone.utc), 'N1')
+        order = self.order(datetime(2026, 2, 28, 23, 59, tzinfo=dt_timezone.utc), 'N2')
+        order.status = 'Завершён'
+        order.save()
+        incremental = self.snapshot()
+        sales_rollup.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+        migration = importlib.import_module('petshop.migrations.0024_rebuild_salesrollup_utc')
+        migration.rebuild_rollup(apps, None)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_pickup_point_category_and_brand_changes_move_sales(self):
+        def buckets():
+            return sorted(
+                SalesRollup.objects.exclude(lines=0)
+                .values_list('day', 'pickup_point_id', 'category_id', 'brand_key', 'status', 'quantity', 'lines', 'total_sales')
+            )
+
+        order = self.order(datetime(2026, 1, 31, 12, 0, tzinfo=dt_timezone.utc), 'N1')
+        self.order(datetime(2026, 1, 31, 13, 0, tzinfo=dt_timezone.utc), 'N2')
+        order.pickup_point = PickupPoint.objects.create(address='ул. Мира, 2')
+        order.status = 'Получен'
+        order.save()
+        self.branded.category = Category.objects.create(name='Лакомства')
+        self.branded.save()
+        self.unbranded.brand = Brand.objects.create(name='Другой')
+        self.unbranded.save(update_fields=['brand'])
+        self.branded.brand = None
+        self.branded.save()
+
+        incremental = buckets()
+        self.assertEqual(len(incremental), 4)
+        sales_rollup.rebuild()
+        self.assertEqual(buckets(), incremental)
+
+
+def _hang(job_id):
+    time.sleep(30)
+
+
+class ReportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        cls.user = User.objects.create_user(email='buyer@example.com', password='pass12345', first_name='Иван', last_name='Иванов')
+
+    def submit(self, count):
+        return [ReportJob.objects.create(user=self.user, kind='orders_report', params={'type': 'day'}) for _ in range(count)]
+
+    def test_claim_respects_global_limit(self):
+        self.submit(3)
+        with self.settings(REPORT_JOB_CONCURRENCY=2), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(report_jobs.claim(5)), 2)
+            self.assertEqual(report_jobs.claim(5), [])
+        # Первый запрос в транзакции — блокировка строки очереди.
+        self.assertIn('petshop_reportjoblock', queries[1]['sql'])
+
+    def test_overdue_job_counted_until_its_process_is_stopped(self):
+        job, waiting = self.submit(2)
+        now = timezone.now()
+        with self.settings(REPORT_JOB_CONCURRENCY=1, REPORT_JOB_TIMEOUT=60):
+            self.assertEqual(report_jobs.claim(1, now), [job.id])
+            # Процесс отчёта ещё может работать: место не освобождается.
+            self.assertEqual(report_jobs.claim(1, now + timedelta(seconds=61)), [])
+            later = now + timedelta(seconds=61 + report_jobs.STALE_GRACE)
+            self.assertEqual(report_jobs.claim(1, later), [waiting.id])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', report_jobs.TIMEOUT_ERROR))
+
+    @mock.patch('petshop.report_jobs.run', _hang)
+    def test_run_pending_stops_overdue_report(self):
+        job, = self.submit(1)
+        started = time.monotonic()
+        # fork, чтобы дочерний процесс видел подменённый run и тестовую базу.
+        with self.settings(REPORT_JOB_TIMEOUT=1), \
+                mock.patch('petshop.report_jobs.multiprocessing.get_context', return_value=multiprocessing.get_context('fork')), \
+                self.assertLogs('petshop.report_jobs', 'ERROR'):
+            self.assertEqual(report_jobs.run_pending(concurrency=1, interval=0.1), 1)
+        self.assertLess(time.monotonic() - started, 10)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', report_jobs.TIMEOUT_ERROR))
+
+    @mock.patch('petshop.report_jobs.run', _hang)
+    def test_report_process_stops_itself_at_deadline(self):
+        if not hasattr(signal, 'alarm'):
+            self.skipTest("Нет signal.alarm")
+        # Воркера, который остановил бы процесс, нет — процесс завершается сам.
+        process = multiprocessing.get_context('fork').Process(target=report_process.main, args=(None, time.time() + 1))
+        process.start()
+        process.join(10)
+        self.assertEqual(process.exitcode, -signal.SIGALRM)
+
+
+def _utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+class ReportParityTests(TestCase):
+    """
+    ORM-версии отчётов db_reports против функций get_* из дампов базы
+    (media/backups): те же строки, колонки и порядок. Функции считают даты
+    по UTC, get_orders_report соединяет товары с брендом внутренним JOIN.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(id=1, name='Покупатель')
+        cls.ivan = User.objects.create_user(email='ivan@example.com', password='pass12345', first_name='Иван', last_name='Иванов')
+        cls.petr = User.objects.create_user(email='petr@example.com', password='pass12345', first_name='Пётр', last_name='Петров')
+        point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.food = Category.objects.create(name='Корма')
+        cls.toys = Category.objects.create(name='Игрушки')
+        cls.alpha = Brand.objects.create(name='Альфа')
+        cls.beta = Brand.objects.create(name='Бета')
+        cls.feed = Product.objects.create(category=cls.food, brand=cls.alpha, name='Корм', price=Decimal('100.00'))
+        cls.ball = Product.objects.create(category=cls.toys, brand=cls.beta, name='Мяч', price=Decimal('30.00'))
+        cls.bowl = Product.objects.create(category=cls.food, name='Миска', price=Decimal('50.00'))
+
+        def order(user, created, *items):
+            order = Order.objects.create(
+                user=user, order_number=f'N{Order.objects.count()}', pickup_point=point, total_price=0,
+                first_name=user.first_name, last_name=user.last_name, email=user.email,
+            )
+            for product, quantity in items:
+                OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+            Order.objects.filter(id=order.id).update(date_created=created)
+            return order.id
+
+        # Время выбрано у границ суток и месяцев: по Москве первый и третий
+        # заказы уже в следующем дне и месяце.
+        cls.o1 = order(cls.ivan, _utc(2026, 1, 31, 21, 30), (cls.feed, 2), (cls.bowl, 1))
+        cls.o2 = order(cls.petr, _utc(2026, 2, 1, 0, 0), (cls.ball, 3))
+        cls.o3 = order(cls.ivan, _utc(2026, 2, 28, 22, 0), (cls.feed, 1), (cls.ball, 1))
+        cls.o4 = order(cls.petr, _utc(2026, 3, 1, 0, 30), (cls.bowl, 2))
+
+    def assertRows(self, rows, expected):
+        self.assertEqual(rows, expected)
+        for row, want in zip(rows, expected):
+            self.assertEqual(list(row), list(want))
+            self.assertEqual([type(value) for value in row.values()], [type(value) for value in want.values()])
+
+    def period_row(self, order_id, user_name, total, order_date):
+        return {'order_id': order_id, 'user_name': user_name, 'total': Decimal(total), 'order_date': order_date}
+
+    def test_orders_by_period(self):
+        ivan, petr = 'Иван Иванов', 'Пётр Петров'
+        cases = [
+            ('day', date(2026, 1, 31), [self.period_row(self.o1, ivan, '250.00', date(2026, 1, 31))]),
+            ('day', date(2026, 2, 1), [self.period_row(self.o2, petr, '90.00', date(2026, 2, 1))]),
+            ('day', date(2026, 3, 2), []),
+            ('week', date(2026, 1, 28), [
+                self.period_row(self.o1, ivan, '250.00', date(2026, 1, 31)),
+                self.period_row(self.o2, petr, '90.00', date(2026, 2, 1)),
+            ]),
+            ('week', date(2026, 3, 1), [
+                self.period_row(self.o3, ivan, '130.00', date(2026, 2, 28)),
+                self.period_row(self.o4, petr, '100.00', date(2026, 3, 1)),
+            ]),
+            ('month', date(2026, 1, 1), [self.period_row(self.o1, ivan, '250.00', date(2026, 1, 31))]),
+            ('month', date(2026, 2, 15), [
+                self.period_row(self.o2, petr, '90.00', date(2026, 2, 1)),
+                self.period_row(self.o3, ivan, '130.00', date(2026, 2, 28)),
+            ]),
+            ('month', date(2026, 3, 31), [self.period_row(self.o4, petr, '100.00', date(2026, 3, 1))]),
+        ]
+        for report_type, day, expected in cases:
+            with self.subTest(report_type=report_type, day=day):
+                self.assertRows(list(db_reports.iter_report(report_type, day, engine='orm')), expected)
+
+    def test_orders_report_filters(self):
+        def row(order_id, product, user, quantity, order_date):
+            return {
+                'order_id': order_id, 'product_name': product.name, 'brand_name': product.brand.name,
+                'category_name': product.category.name, 'user_name': f"{user.first_name} {user.last_name}",
+                'quantity': quantity, 'total': quantity * product.price, 'order_date': order_date,
+            }
+
+        o1_feed = row(self.o1, self.feed, self.ivan, 2, date(2026, 1, 31))
+        o2_ball = row(self.o2, self.ball, self.petr, 3, date(2026, 2, 1))
+        o3_feed = row(self.o3, self.feed, self.ivan, 1, date(2026, 2, 28))
+        o3_ball = row(self.o3, self.ball, self.ivan, 1, date(2026, 2, 28))
+        # Миска без бренда не попадает ни в один отчёт, заказ o4 — целиком.
+        cases = [
+            ({}, [o1_feed, o2_ball, o3_feed, o3_ball]),
+            ({'product_id': self.ball.id}, [o2_ball, o3_ball]),
+            ({'product_id': self.bowl.id}, []),
+            ({'category_id': self.food.id}, [o1_feed, o3_feed]),
+            ({'brand_id': self.alpha.id}, [o1_feed, o3_feed]),
+            ({'user_id': self.petr.id}, [o2_ball]),
+            ({'brand_id': self.beta.id, 'user_id': self.ivan.id}, [o3_ball]),
+        ]
+        for filters, expected in cases:
+            with self.subTest(**filters):
+                self.assertRows(db_reports.get_orders_report(engine='orm', **filters), expected)
+
+    def test_keyset_batches_match_single_query(self):
+        cases = [('filtered', None), ('month', date(2026, 2, 15)), ('week', date(2026, 1, 28))]
+        for report_type, day in cases:
+            with self.subTest(report_type=report_type):
+                whole = list(db_reports.iter_report(report_type, day, engine='orm'))
+                for batch_size in (1, 3):
+                    self.assertEqual(list(db_reports.iter_report(report_type, day, batch_size=batch_size, engine='orm')), whole)
+        # Четыре строки пачками по три — два запроса, второй после (order_id, id) третьей строки.
+        with self.assertNumQueries(2):
+            self.assertEqual(len(list(db_reports.iter_report('filtered', None, batch_size=3, engine='orm'))), 4)
+
+    def test_sales_by_category(self):
+        self.assertRows(db_reports.get_sales_by_category(engine='orm'), [
+            {'category_name': 'Корма', 'total_sales': Decimal('450.00')},
+            {'category_name': 'Игрушки', 'total_sales': Decimal('120.00')},
+        ])
+
+    def test_sales_by_month(self):
+        self.assertRows(db_reports.get_sales_by_month(engine='orm'), [
+            {'month': date(2026, 1, 1), 'total_sales': Decimal('250.00')},
+            {'month': date(2026, 2, 1), 'total_sales': Decimal('220.00')},
+            {'month': date(2026, 3, 1), 'total_sales': Decimal('100.00')},
+        ])
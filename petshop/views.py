@@ -7,9 +7,6 @@ from .forms import UserRegistrationForm, UserLoginForm, UserProfileForm, CartAdd
 from django.contrib.auth import login
 from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.decorators import login_required
-from django.utils.crypto import get_random_string
-from django.core.mail import EmailMessage
-from django.template.loader import render_to_string
 from django.db import transaction
 from django.db.models import Avg
 from django.contrib.auth.decorators import login_required
@@ -20,6 +17,12 @@ import csv
 import datetime
 from django.http import HttpResponse, JsonResponse
 from . import db_reports  
+from .csv_export import streaming_csv_response
+from . import taxonomy
+from . import carts
+from . import orders
+from . import outbox
+from . import sales_rollup
 import os
 from django.views.decorators.http import require_POST
 from django.core import serializers
@@ -38,11 +41,11 @@ def customer_required(user):
 
 def index(request):
     context = {
-        'all_species': Species.objects.filter(is_active=True),
-        'all_ages': AgeCategory.objects.filter(is_active=True),
-        'all_categories': Category.objects.filter(is_active=True),
-        'all_types': ProductType.objects.filter(is_active=True),
-        'all_purposes': Purpose.objects.filter(is_active=True),
+        'all_species': taxonomy.get_active(Species),
+        'all_ages': taxonomy.get_active(AgeCategory),
+        'all_categories': taxonomy.get_active(Category),
+        'all_types': taxonomy.get_active(ProductType),
+        'all_purposes': taxonomy.get_active(Purpose),
     }
     return render(request, 'shablons/index.html', context)
 
@@ -91,12 +94,12 @@ def order_detail(request, order_id):
 
 
 def product_list(request):
-    all_categories = Category.objects.filter(is_active=True)
-    all_brands = Brand.objects.filter(is_active=True)
-    all_ages = AgeCategory.objects.filter(is_active=True)
-    all_species = Species.objects.filter(is_active=True)
-    all_types = ProductType.objects.filter(is_active=True)
-    all_purposes = Purpose.objects.filter(is_active=True)
+    all_categories = taxonomy.get_active(Category)
+    all_brands = taxonomy.get_active(Brand)
+    all_ages = taxonomy.get_active(AgeCategory)
+    all_species = taxonomy.get_active(Species)
+    all_types = taxonomy.get_active(ProductType)
+    all_purposes = taxonomy.get_active(Purpose)
 
     context = {
         'all_categories': all_categories,
@@ -177,13 +180,13 @@ def update_cart_quantity(request, cart_id):
 
 @login_required
 def checkout(request):
-    cart_items = Cart.objects.filter(user=request.user)
+    cart_items, summary = carts.load(request.user)
 
-    if not cart_items.exists():
+    if not cart_items:
         messages.error(request, "Ваша корзина пуста")
         return redirect('cart')
 
-    total_price = sum(item.quantity * item.product.price for item in cart_items)
+    total_price = summary['total_price']
 
     if request.method == "POST":
         form = OrderForm(request.POST)
@@ -192,62 +195,26 @@ def checkout(request):
             
             try:
                 with transaction.atomic():
-                    for item in cart_items:
-                        stock_entry = ProductStock.objects.get(
-                            product=item.product,
-                            pickup_point=pickup_point
-                        )
-                        if item.quantity > stock_entry.quantity:
-                            raise ValueError(
-                                f"В пункте {pickup_point.address} доступно только {stock_entry.quantity} шт. товара {item.product.name}"
-                            )
-
-                    
-                    order = Order.objects.create(
-                        order_number=get_random_string(10).upper(),
-                        user=request.user,
-                        pickup_point=pickup_point,
-                        status="В обработке",
-                        total_price=0,
+                    order = orders.place_order(
+                        request.user,
+                        pickup_point,
                         first_name=form.cleaned_data['first_name'],
                         last_name=form.cleaned_data['last_name'],
                         email=form.cleaned_data['email'],
-                        phone=form.cleaned_data['phone']
+                        phone=form.cleaned_data['phone'],
                     )
+                    outbox.enqueue_order_email(order, f"Подтверждение заказа №{order.order_number}")
 
-                    total_price_post = 0
-                    for item in cart_items:
-                        OrderItem.objects.create(
-                            order=order,
-                            product=item.product,
-                            quantity=item.quantity,
-                            price=item.product.price
-                        )
-                        total_price_post += item.quantity * item.product.price
-
-                        stock_entry = ProductStock.objects.get(
-                            product=item.product,
-                            pickup_point=pickup_point
-                        )
-                        stock_entry.quantity -= item.quantity
-                        stock_entry.save()
-
-                    order.total_price = total_price_post
-                    order.save()
-
-                    cart_items.delete() 
-
-                    subject = f"Подтверждение заказа №{order.order_number}"
-                    message = render_to_string('shablons/email.html', {'order': order})
-                    email = EmailMessage(subject, message, to=[order.email])
-                    email.content_subtype = "html"
-                    email.send(fail_silently=False)
-
-                    messages.success(request, "Заказ оформлен успешно!")
-                    return redirect('order_success', order_id=order.id)
-
-            except ProductStock.DoesNotExist:
+                messages.success(request, "Заказ оформлен успешно!")
+                return redirect('order_success', order_id=order.id)
+
+            except orders.ProductUnavailable:
                 messages.error(request, "Некоторые товары отсутствуют в выбранном пункте выдачи.")
+            except orders.InsufficientStock as e:
+                messages.error(
+                    request,
+                    f"В пункте {pickup_point.address} доступно только {e.available} шт. товара {e.product_name}"
+                )
             except ValueError as e:
                 messages.error(request, str(e))
             except Exception as e:
@@ -292,16 +259,10 @@ def view_summary(request, summary):
 
 
 def get_sales_by_category():
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM get_sales_by_category();")
-        rows = cursor.fetchall()
-    return [{'category': r[0], 'total_sales': float(r[1])} for r in rows]
+    return [{'category': r['category_name'], 'total_sales': float(r['total_sales'])} for r in sales_rollup.sales_by_category()]
 
 def get_sales_by_month():
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT * FROM get_sales_by_month();")
-        rows = cursor.fetchall()
-    return [{'month': r[0].strftime('%Y-%m-%d'), 'total_sales': float(r[1])} for r in rows]
+    return [{'month': r['month'].strftime('%Y-%m-%d'), 'total_sales': float(r['total_sales'])} for r in sales_rollup.sales_by_month()]
 
 
 @user_passes_test(admin_required)
@@ -335,16 +296,7 @@ def admin_statement(request):
 
         data = db_reports.get_orders_report(product_id, category_id, brand_id, user_id)
 
-    column_names = {
-        "order_id": "ID заказа",
-        "user_name": "Пользователь",
-        "total": "Сумма заказа",
-        "order_date": "Дата создания",
-        "product_name": "Товар",
-        "brand_name": "Бренд",
-        "category_name": "Категория",
-        "quantity": "Кол-во товара"
-    }
+    column_names = db_reports.COLUMN_NAMES
 
     context = {
         "data": data,
@@ -363,48 +315,17 @@ def admin_statement(request):
 def admin_reports_export(request):
     report_type = request.GET.get("type", "day")
     date_str = request.GET.get("date")
-    date = datetime.date.today() if not date_str else datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-
-    product_id = request.GET.get("product_id") or None
-    category_id = request.GET.get("category_id") or None
-    brand_id = request.GET.get("brand_id") or None
-    user_id = request.GET.get("user_id") or None
-
-    if report_type in ["day", "week", "month"]:
-        if report_type == "day":
-            data = db_reports.get_orders_by_day(date)
-        elif report_type == "week":
-            data = db_reports.get_orders_by_week(date)
-        else:
-            data = db_reports.get_orders_by_month(date)
-    else:
-        data = db_reports.get_orders_report(product_id, category_id, brand_id, user_id)
-
-    column_names = {
-        "order_id": "ID заказа",
-        "user_name": "Пользователь",
-        "total": "Сумма заказа",
-        "order_date": "Дата создания",
-        "product_name": "Товар",
-        "brand_name": "Бренд",
-        "category_name": "Категория",
-        "quantity": "Кол-во товара"
-    }
-
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = f'attachment; filename="report_{report_type}_{date}.csv"'
-    response.write(u'\ufeff'.encode('utf8')) 
-
-    writer = csv.writer(response, dialect='excel')
-
-    if data:
-        headers = [column_names.get(k, k) for k in data[0].keys()]
-        writer.writerow(headers)
+    report_date = date.today() if not date_str else datetime.strptime(date_str, "%Y-%m-%d").date()
 
-        for row in data:
-            writer.writerow(row.values())
+    rows = db_reports.iter_report(
+        report_type, report_date,
+        product_id=request.GET.get("product_id") or None,
+        category_id=request.GET.get("category_id") or None,
+        brand_id=request.GET.get("brand_id") or None,
+        user_id=request.GET.get("user_id") or None,
+    )
 
-    return response
+    return streaming_csv_response(db_reports.iter_table(rows), f"report_{report_type}_{report_date}.csv", dialect='excel')
 
 @user_passes_test(admin_required)
 def audit_log_view(request):
@@ -140,20 +140,80 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # LocMemCache — лишь приближение к LRU: при переполнении он удаляет сразу
+    # 1/CULL_FREQUENCY давно не читавшихся записей, и у каждого процесса свой
+    # кеш. У файлового кеша и Redis порядок вытеснения задаёт сам бэкенд.
+    'catalog': {
+        'BACKEND': config('CATALOG_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CATALOG_CACHE_LOCATION', default='catalog'),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CATALOG_CACHE_MAX_ENTRIES', default=1000, cast=int),
+            'CULL_FREQUENCY': config('CATALOG_CACHE_CULL_FREQUENCY', default=3, cast=int),
+        },
+    },
+}
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=600, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CRONJOBS = [
-    ('50 9 * * *', 'django.core.management.call_command', ['daily_backup'])
+    ('50 9 * * *', 'django.core.management.call_command', ['daily_backup']),
+    ('* * * * *', 'django.core.management.call_command', ['send_outbox_emails']),
+    ('* * * * *', 'django.core.management.call_command', ['release_expired_reservations']),
+    ('30 3 * * *', 'django.core.management.call_command', ['reconcile_stock']),
+    ('* * * * *', 'django.core.management.call_command', ['run_report_jobs']),
 ]
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = 'smtp.mail.ru'
 EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_USE_SSL = config('EMAIL_USE_SSL', default=False, cast=bool)
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=30, cast=int)
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
-SERVER_EMAIL = EMAIL_HOST_USER
\ No newline at end of file
+SERVER_EMAIL = EMAIL_HOST_USER
+
+# Сколько секунд справочники (petshop/taxonomy.py) живут в памяти
+# процесса, прежде чем будут перечитаны из базы; 0 — без ограничения
+TAXONOMY_CACHE_MAX_AGE = config('TAXONOMY_CACHE_MAX_AGE', default=60, cast=int)
+
+# Сколько секунд индекс подсказок (api_shop/suggest.py) живёт в памяти
+# процесса, прежде чем будет перестроен; 0 — без ограничения
+SUGGEST_INDEX_MAX_AGE = config('SUGGEST_INDEX_MAX_AGE', default=60, cast=int)
+
+CATALOG_INDEX_ENABLED = config('CATALOG_INDEX_ENABLED', default=False, cast=bool)
+CATALOG_INDEX_MAX_AGE = config('CATALOG_INDEX_MAX_AGE', default=300, cast=int)
+
+# Время жизни резерва товара в корзине, с; 0 — резервирование выключено
+CART_RESERVATION_TTL = config('CART_RESERVATION_TTL', default=0, cast=int)
+
+# Срок хранения корзины гостя в подписанной cookie, с
+GUEST_CART_MAX_AGE = config('GUEST_CART_MAX_AGE', default=60 * 60 * 24 * 30, cast=int)
+
+# Номер узла (0–1023) для генератора номеров заказов, см.
+# petshop/order_numbers.py. Без него каждый процесс берёт номер в аренду
+# в базе на ORDER_NUMBER_NODE_LEASE секунд; задавать явно стоит, только
+# если у каждого процесса своё значение
+ORDER_NUMBER_NODE_ID = config('ORDER_NUMBER_NODE_ID', default=None)
+ORDER_NUMBER_NODE_LEASE = config('ORDER_NUMBER_NODE_LEASE', default=600, cast=int)
+
+# Фоновые отчёты (petshop/report_jobs.py): сколько отчётов строится
+# одновременно, сколько секунд может строиться один отчёт (потом его
+# процесс останавливается), сколько секунд хранится файл результата и
+# сколько незавершённых заданий может быть у одного пользователя
+REPORT_JOB_CONCURRENCY = config('REPORT_JOB_CONCURRENCY', default=2, cast=int)
+REPORT_JOB_TIMEOUT = config('REPORT_JOB_TIMEOUT', default=60 * 30, cast=int)
+REPORT_JOB_RESULT_TTL = config('REPORT_JOB_RESULT_TTL', default=60 * 60 * 24, cast=int)
+REPORT_JOB_MAX_ACTIVE_PER_USER = config('REPORT_JOB_MAX_ACTIVE_PER_USER', default=3, cast=int)
+
+# Как строить отчёты petshop.db_reports: 'orm' — запросами ORM на любой
+# базе, 'sql' — функциями get_* в Postgres (их нет в миграциях)
+REPORTS_ENGINE = config('REPORTS_ENGINE', default='orm')